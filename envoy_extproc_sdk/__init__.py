@@ -5,8 +5,11 @@
 # from .health import FilterOutHealthChecks  # noqa: E402
 # tracer.configure(settings={"FILTERS": [FilterOutHealthChecks()]})
 
+from .body import body_buffer, BodyBuffer, BodyTooLarge  # noqa: F401,E402
+from .chain import ChainedExtProcService  # noqa: F401,E402
+from .context import RequestContext  # noqa: F401,E402
 from .extproc import BaseExtProcService  # noqa: F401,E402
 from .extproc import ExtProcPhase  # noqa: F401,E402
 from .extproc import StopRequestProcessing  # noqa: F401,E402
-from .server import create_server, serve  # noqa: F401,E402
+from .server import create_server, GrpcServerOptions, serve  # noqa: F401,E402
 from .util.envoy import ext_api  # noqa: F401,E402
@@ -2,17 +2,27 @@ import argparse
 from importlib import import_module
 import logging
 from os import environ
-from typing import Callable, List
 
 from .extproc import BaseExtProcService
-from .server import serve
-from .settings import GRPC_PORT, SHUTDOWN_GRACE_PERIOD
+from .server import COMPRESSION, EVENT_LOOPS, GrpcServerOptions, serve
+from .settings import (
+    EVENT_LOOP,
+    GRPC_COMPRESSION,
+    GRPC_HTTP2_WINDOW_SIZE,
+    GRPC_KEEPALIVE_TIME_MS,
+    GRPC_KEEPALIVE_TIMEOUT_MS,
+    GRPC_MAX_CONCURRENT_RPCS,
+    GRPC_MAX_CONCURRENT_STREAMS,
+    GRPC_MAX_RECEIVE_MESSAGE_LENGTH,
+    GRPC_MAX_SEND_MESSAGE_LENGTH,
+    GRPC_PORT,
+    GRPC_UDS,
+    SHUTDOWN_GRACE_PERIOD,
+    WORKERS,
+)
 
 logger = logging.getLogger(__name__)
 
-# Coroutines to be invoked when the event loop is shutting down.
-_cleanup: List[Callable[[], None]] = []
-
 
 def import_from_spec(spec: str) -> BaseExtProcService:
     module_spec = ".".join(spec.split(".")[:-1])
@@ -61,7 +71,16 @@ def parse_cli_args() -> argparse.Namespace:
         required=False,
         type=int,
         default=GRPC_PORT,
-        help="Port to run service on",
+        help="Port to run service on (0 to only use --uds)",
+    )
+    parser.add_argument(
+        "-u",
+        "--uds",
+        dest="uds",
+        required=False,
+        type=str,
+        default=GRPC_UDS,
+        help="Unix domain socket to (also) listen on: a path, or @name for an abstract socket",
     )
     parser.add_argument(
         "-g",
@@ -72,6 +91,89 @@ def parse_cli_args() -> argparse.Namespace:
         default=SHUTDOWN_GRACE_PERIOD,
         help="Grace period to finish requests on shutdown",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        required=False,
+        type=int,
+        default=WORKERS,
+        help="Number of server processes to run (sharing the port)",
+    )
+    parser.add_argument(
+        "--loop",
+        dest="loop",
+        required=False,
+        type=str,
+        choices=list(EVENT_LOOPS),
+        default=EVENT_LOOP,
+        help="Event loop to use (auto is uvloop, if installed)",
+    )
+    parser.add_argument(
+        "--max-concurrent-rpcs",
+        dest="max_concurrent_rpcs",
+        required=False,
+        type=int,
+        default=GRPC_MAX_CONCURRENT_RPCS,
+        help="Streams to serve at once (per worker) before rejecting new ones",
+    )
+    parser.add_argument(
+        "--max-concurrent-streams",
+        dest="max_concurrent_streams",
+        required=False,
+        type=int,
+        default=GRPC_MAX_CONCURRENT_STREAMS,
+        help="Streams to allow at once per HTTP/2 connection",
+    )
+    parser.add_argument(
+        "--max-receive-message-length",
+        dest="max_receive_message_length",
+        required=False,
+        type=int,
+        default=GRPC_MAX_RECEIVE_MESSAGE_LENGTH,
+        help="Largest message (in bytes) to accept, e.g. a BUFFERED body",
+    )
+    parser.add_argument(
+        "--max-send-message-length",
+        dest="max_send_message_length",
+        required=False,
+        type=int,
+        default=GRPC_MAX_SEND_MESSAGE_LENGTH,
+        help="Largest message (in bytes) to send",
+    )
+    parser.add_argument(
+        "--keepalive-time",
+        dest="keepalive_time_ms",
+        required=False,
+        type=int,
+        default=GRPC_KEEPALIVE_TIME_MS,
+        help="Interval (in ms) of keepalive pings to envoy",
+    )
+    parser.add_argument(
+        "--keepalive-timeout",
+        dest="keepalive_timeout_ms",
+        required=False,
+        type=int,
+        default=GRPC_KEEPALIVE_TIMEOUT_MS,
+        help="Time (in ms) to wait for a keepalive ping ack",
+    )
+    parser.add_argument(
+        "--http2-window-size",
+        dest="http2_window_size",
+        required=False,
+        type=int,
+        default=GRPC_HTTP2_WINDOW_SIZE,
+        help="HTTP/2 per-stream flow control window (in bytes)",
+    )
+    parser.add_argument(
+        "--compression",
+        dest="compression",
+        required=False,
+        type=str,
+        choices=list(COMPRESSION),
+        default=GRPC_COMPRESSION,
+        help="Compression for responses",
+    )
     parser.add_argument(
         "-l",
         "--logging",
@@ -96,4 +198,22 @@ if __name__ == "__main__":  # pragma: no cover
         logging.basicConfig(level=LOG_LEVEL, format=FORMAT, handlers=[logging.StreamHandler()])
 
     service = import_from_spec(args.service)() if args.service else BaseExtProcService()
-    serve(service, args.port, args.grace_period)
+    server_options = GrpcServerOptions(
+        maximum_concurrent_rpcs=args.max_concurrent_rpcs or None,
+        max_concurrent_streams=args.max_concurrent_streams or None,
+        max_receive_message_length=args.max_receive_message_length or None,
+        max_send_message_length=args.max_send_message_length or None,
+        keepalive_time_ms=args.keepalive_time_ms or None,
+        keepalive_timeout_ms=args.keepalive_timeout_ms or None,
+        http2_window_size=args.http2_window_size or None,
+        compression=args.compression,
+    )
+    serve(
+        service,
+        args.port,
+        args.grace_period,
+        workers=args.workers,
+        uds=args.uds,
+        server_options=server_options,
+        loop=args.loop,
+    )
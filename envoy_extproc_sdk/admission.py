@@ -0,0 +1,130 @@
+from typing import Optional
+
+from .settings import (
+    ADMISSION,
+    ADMISSION_BACKOFF,
+    ADMISSION_LIMIT,
+    ADMISSION_MIN_LIMIT,
+    ADMISSION_TARGET_LATENCY_MS,
+)
+
+
+class AdmissionController:
+    """
+    Decides, when a stream starts, whether a service takes it on or sheds
+    it (see BaseExtProcService.Process), so that under a burst some
+    streams get a quick answer rather than all of them waiting past
+    envoy's `message_timeout`. Streams are never queued. This base class
+    admits every stream; subclasses limit them.
+    """
+
+    name = "off"
+
+    def __init__(self) -> None:
+        self.in_use = 0
+        self.rejected = 0
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(limit={self.limit})"
+
+    @property
+    def limit(self) -> Optional[int]:
+        """streams admitted at once (None: unlimited)"""
+        return None
+
+    def acquire(self) -> bool:
+        """admit a stream, if there's room; release it when it's done"""
+        limit = self.limit
+        if (limit is not None) and (self.in_use >= limit):
+            self.rejected += 1
+            return False
+        self.in_use += 1
+        return True
+
+    def release(self) -> None:
+        """an admitted stream is done"""
+        self.in_use -= 1
+
+    def observe(self, latency_ns: int) -> None:
+        """a phase (of an admitted stream) took this long"""
+
+
+class ConcurrencyLimit(AdmissionController):
+    """admits at most `limit` streams at once"""
+
+    name = "concurrency"
+
+    def __init__(self, limit: Optional[int] = ADMISSION_LIMIT) -> None:
+        super().__init__()
+        if not limit or limit < 1:
+            raise ValueError(f"{self.__class__.__name__} needs a limit of at least 1")
+        self._limit = limit
+
+    @property
+    def limit(self) -> Optional[int]:
+        return self._limit
+
+
+class AIMDLimit(ConcurrencyLimit):
+    """
+    A concurrency limit that adapts to phase latency: each phase slower
+    than `target_latency_ms` cuts it (multiplicatively, by `backoff`, not
+    under `min_limit`), and phases within the target raise it again
+    (additively, by about one per `limit` phases, up to `limit`) while the
+    streams admitted use at least half of it.
+    """
+
+    name = "aimd"
+
+    def __init__(
+        self,
+        limit: Optional[int] = ADMISSION_LIMIT,
+        min_limit: int = ADMISSION_MIN_LIMIT,
+        target_latency_ms: float = ADMISSION_TARGET_LATENCY_MS,
+        backoff: float = ADMISSION_BACKOFF,
+    ) -> None:
+        super().__init__(limit=limit)
+        if not 0 < backoff < 1:
+            raise ValueError(f"backoff has to be between 0 and 1, not {backoff}")
+        self.max_limit = self._limit
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.target_ns = int(target_latency_ms * 1_000_000)
+        self.backoff = backoff
+        self._current = float(self.max_limit)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(limit={self.limit}, max_limit={self.max_limit},"
+            f" target_latency_ms={self.target_ns / 1_000_000:g})"
+        )
+
+    @property
+    def limit(self) -> Optional[int]:
+        return int(self._current)
+
+    def observe(self, latency_ns: int) -> None:
+        if latency_ns > self.target_ns:
+            self._current = max(float(self.min_limit), self._current * self.backoff)
+        elif self.in_use * 2 >= self._current:
+            self._current = min(float(self.max_limit), self._current + 1 / self._current)
+
+
+ADMISSION_CONTROLLERS = {
+    "": AdmissionController,
+    "off": AdmissionController,
+    "none": AdmissionController,
+    "concurrency": ConcurrencyLimit,
+    "aimd": AIMDLimit,
+}
+
+
+def get_admission_controller(name: str = ADMISSION) -> AdmissionController:
+    """create an admission controller by name: off, concurrency or aimd
+    (configured from the ADMISSION_* settings)"""
+    try:
+        controller_class = ADMISSION_CONTROLLERS[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown admission controller {name}; use one of {', '.join(ADMISSION_CONTROLLERS)}"
+        )
+    return controller_class()
@@ -0,0 +1,382 @@
+"""
+Benchmark a processor in process, without envoy or gRPC: drive its
+`Process` with synthetic request cycles, as envoy would, and report
+throughput, latency by phase and memory allocated per request, e.g.
+
+    python -m envoy_extproc_sdk.bench \
+        --service app.SomeExtProcService \
+        --requests 10000 --concurrency 32 --headers 20 --body-size 4096
+"""
+
+import argparse
+import asyncio
+import json
+from math import ceil
+from time import perf_counter_ns
+import tracemalloc
+from typing import Any, cast, Dict, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from grpc import ServicerContext
+
+from .__main__ import import_from_spec
+from .extproc import BaseExtProcService
+from .testing import AsEnvoyExtProc, envoy_body, envoy_headers
+from .util.envoy import ext_api
+
+# percentiles reported, and what of a stream's phases is a "request"
+PERCENTILES = (50, 99)
+STREAM = "stream"
+
+
+def synthetic_exchange(
+    header_count: int = 20,
+    body_size: int = 1024,
+    response_body_size: Optional[int] = None,
+    body: Optional[bytes] = None,
+    path: str = "/bench",
+) -> "TimedExchange":
+    """
+    a request cycle with `header_count` headers each way (besides
+    pseudo-headers) and bodies of `body_size` (or `response_body_size`)
+    bytes, or `body` (for both) when given; every request gets its own id
+    """
+    request_body = body if body is not None else b"x" * body_size
+    if response_body_size is None:
+        response_body = request_body
+    else:
+        response_body = body if body is not None else b"x" * response_body_size
+    request_headers = [
+        (":method", "POST"),
+        (":path", path),
+        (":authority", "bench.local"),
+        (":scheme", "https"),
+        ("x-request-id", str(uuid4())),
+        ("content-type", "application/octet-stream"),
+        ("content-length", str(len(request_body))),
+    ]
+    response_headers = [
+        (":status", "200"),
+        ("content-type", "application/octet-stream"),
+        ("content-length", str(len(response_body))),
+    ]
+    for headers in (request_headers, response_headers):
+        given = sum(1 for key, _ in headers if not key.startswith(":"))
+        headers.extend((f"x-bench-{n}", f"value-{n}") for n in range(header_count - given))
+    return TimedExchange(
+        request_headers=envoy_headers(headers=request_headers),
+        request_body=envoy_body(body=request_body),
+        response_headers=envoy_headers(headers=response_headers),
+        response_body=envoy_body(body=response_body),
+    )
+
+
+class TimedExchange(AsEnvoyExtProc):
+    """an exchange that keeps track of when it sent its latest message"""
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.phase = "unknown"
+        self.sent_ns = 0
+
+    async def __anext__(self) -> ext_api.ProcessingRequest:
+        message = await super().__anext__()
+        self.phase = cast(str, message.WhichOneof("request"))
+        self.sent_ns = perf_counter_ns()
+        return message
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """the nearest-rank q'th percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[max(0, min(len(values), ceil(q / 100 * len(values))) - 1)]
+
+
+class BenchResult:
+    """what a benchmark run measured, with latencies in nanoseconds"""
+
+    def __init__(
+        self,
+        requests: int,
+        concurrency: int,
+        duration_ns: int,
+        latencies_ns: Dict[str, List[int]],
+        allocated_bytes: Optional[List[int]] = None,
+        retained_bytes: Optional[int] = None,
+        retained_blocks: Optional[int] = None,
+    ) -> None:
+        self.requests = requests
+        self.concurrency = concurrency
+        self.duration_ns = duration_ns
+        self.latencies_ns = {phase: sorted(values) for phase, values in latencies_ns.items()}
+        self.allocated_bytes = sorted(allocated_bytes or [])
+        self.retained_bytes = retained_bytes
+        self.retained_blocks = retained_blocks
+
+    @property
+    def throughput(self) -> float:
+        """requests per second"""
+        return self.requests / (self.duration_ns / 1e9) if self.duration_ns else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        latency = {
+            phase: {f"p{q}_ms": percentile(values, q) / 1e6 for q in PERCENTILES}
+            for phase, values in self.latencies_ns.items()
+        }
+        summary: Dict[str, Any] = {
+            "requests": self.requests,
+            "concurrency": self.concurrency,
+            "duration_s": self.duration_ns / 1e9,
+            "throughput_rps": self.throughput,
+            "latency": latency,
+        }
+        if self.allocated_bytes:
+            summary["allocations"] = {
+                **{f"p{q}_bytes": percentile(self.allocated_bytes, q) for q in PERCENTILES},
+                "retained_bytes_per_request": self.retained_bytes,
+                "retained_blocks_per_request": self.retained_blocks,
+            }
+        return summary
+
+    def report(self) -> str:
+        lines = [
+            f"{self.requests} requests, {self.concurrency} at once, in"
+            f" {self.duration_ns / 1e9:.3f}s: {self.throughput:.1f} requests/s",
+            "",
+            f"{'phase':<20}" + "".join(f"{f'p{q} (ms)':>12}" for q in PERCENTILES),
+        ]
+        for phase, values in self.latencies_ns.items():
+            lines.append(
+                f"{phase:<20}"
+                + "".join(f"{percentile(values, q) / 1e6:>12.3f}" for q in PERCENTILES)
+            )
+        if self.allocated_bytes:
+            lines += [
+                "",
+                "allocated per request (peak): "
+                + ", ".join(
+                    f"p{q} {percentile(self.allocated_bytes, q):.0f}B" for q in PERCENTILES
+                ),
+                f"retained per request: {self.retained_bytes}B"
+                f" in {self.retained_blocks} blocks",
+            ]
+        return "\n".join(lines)
+
+
+async def run_cycle(
+    service: BaseExtProcService, exchange: TimedExchange, latencies_ns: Dict[str, List[int]]
+) -> None:
+    """send an exchange through a service, recording how long each phase
+    (from its message to its response) and the whole stream took"""
+    started_ns = perf_counter_ns()
+    async for _ in service.Process(exchange, cast(ServicerContext, None)):
+        latencies_ns.setdefault(exchange.phase, []).append(perf_counter_ns() - exchange.sent_ns)
+    latencies_ns.setdefault(STREAM, []).append(perf_counter_ns() - started_ns)
+
+
+async def measure_allocations(
+    service: BaseExtProcService, requests: int, **exchange: Any
+) -> Tuple[List[int], int, int]:
+    """
+    run `requests` cycles one at a time under tracemalloc: the peak of
+    memory allocated during each, and the bytes and blocks still allocated
+    after all of them, per request (non-zero if something grows)
+    """
+    latencies_ns: Dict[str, List[int]] = {}
+    exchanges = [synthetic_exchange(**exchange) for _ in range(requests)]
+    peaks: List[int] = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        # exchanges are dropped once run, so what they picked up running
+        # (see TimedExchange) isn't counted as retained
+        while exchanges:
+            E = exchanges.pop()
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await run_cycle(service, E, latencies_ns)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+            del E
+        latencies_ns.clear()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    # the benchmark's own bookkeeping (peaks, latencies) isn't the service's
+    ignored = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), "filename")
+    retained_bytes = sum(stat.size_diff for stat in stats) // max(requests, 1)
+    retained_blocks = sum(stat.count_diff for stat in stats) // max(requests, 1)
+    return peaks, retained_bytes, retained_blocks
+
+
+async def run_benchmark(
+    service: BaseExtProcService,
+    requests: int = 1000,
+    concurrency: int = 10,
+    warmup: int = 100,
+    allocation_requests: int = 100,
+    **exchange: Any,
+) -> BenchResult:
+    """
+    run `requests` synthetic cycles (see synthetic_exchange, which gets
+    `exchange`) through a service, `concurrency` at a time, after `warmup`
+    untimed ones, then measure allocations over `allocation_requests`
+    more (0 to skip that)
+    """
+    if requests < 1 or concurrency < 1:
+        raise ValueError("A benchmark needs at least one request and a concurrency of 1")
+
+    async def run(count: int, latencies_ns: Dict[str, List[int]]) -> None:
+        # exchanges are built up front, so building them isn't timed
+        exchanges = [synthetic_exchange(**exchange) for _ in range(count)]
+
+        async def worker() -> None:
+            while exchanges:
+                await run_cycle(service, exchanges.pop(), latencies_ns)
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, count))))
+
+    if warmup:
+        await run(warmup, {})
+    latencies_ns: Dict[str, List[int]] = {}
+    started_ns = perf_counter_ns()
+    await run(requests, latencies_ns)
+    duration_ns = perf_counter_ns() - started_ns
+
+    allocated: Optional[List[int]] = None
+    retained_bytes = retained_blocks = None
+    if allocation_requests:
+        allocated, retained_bytes, retained_blocks = await measure_allocations(
+            service, allocation_requests, **exchange
+        )
+    return BenchResult(
+        requests,
+        concurrency,
+        duration_ns,
+        latencies_ns,
+        allocated_bytes=allocated,
+        retained_bytes=retained_bytes,
+        retained_blocks=retained_blocks,
+    )
+
+
+def parse_cli_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="python -m envoy_extproc_sdk.bench",
+        description="Benchmark a processor in process, with synthetic requests",
+    )
+    parser.add_argument(
+        "-s",
+        "--service",
+        dest="service",
+        required=False,
+        type=str,
+        default=None,
+        help="Processor to benchmark, as an import spec",
+    )
+    parser.add_argument(
+        "-n",
+        "--requests",
+        dest="requests",
+        type=int,
+        default=1000,
+        help="Request cycles to time",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        dest="concurrency",
+        type=int,
+        default=10,
+        help="Request cycles to run at once",
+    )
+    parser.add_argument(
+        "--warmup",
+        dest="warmup",
+        type=int,
+        default=100,
+        help="Request cycles to run, untimed, first",
+    )
+    parser.add_argument(
+        "--headers",
+        dest="header_count",
+        type=int,
+        default=20,
+        help="Headers in requests and responses (besides pseudo-headers)",
+    )
+    parser.add_argument(
+        "--body-size",
+        dest="body_size",
+        type=int,
+        default=1024,
+        help="Request (and response) body size in bytes",
+    )
+    parser.add_argument(
+        "--response-body-size",
+        dest="response_body_size",
+        type=int,
+        default=None,
+        help="Response body size in bytes, if not the request's",
+    )
+    parser.add_argument(
+        "--body-file",
+        dest="body_file",
+        type=str,
+        default=None,
+        help="File with a (realistic) body to use instead",
+    )
+    parser.add_argument(
+        "--path",
+        dest="path",
+        type=str,
+        default="/bench",
+        help="Request path",
+    )
+    parser.add_argument(
+        "--allocations",
+        dest="allocation_requests",
+        type=int,
+        default=100,
+        help="Request cycles to measure allocations over, one at a time (0 to skip)",
+    )
+    parser.add_argument(
+        "--json",
+        dest="json",
+        default=False,
+        action="store_true",
+        help="Print results as JSON (e.g. for CI)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> BenchResult:
+    args = parse_cli_args(argv)
+    service = import_from_spec(args.service) if args.service else BaseExtProcService()
+    body = None
+    if args.body_file:
+        with open(args.body_file, "rb") as body_file:
+            body = body_file.read()
+    try:
+        result = asyncio.run(
+            run_benchmark(
+                service,
+                requests=args.requests,
+                concurrency=args.concurrency,
+                warmup=args.warmup,
+                allocation_requests=args.allocation_requests,
+                header_count=args.header_count,
+                body_size=args.body_size,
+                response_body_size=args.response_body_size,
+                body=body,
+                path=args.path,
+            )
+        )
+    finally:
+        service.shutdown()
+    print(json.dumps(result.summary(), indent=2) if args.json else result.report())
+    return result
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
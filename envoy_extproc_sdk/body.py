@@ -0,0 +1,206 @@
+from mmap import ACCESS_READ, mmap
+import re
+from tempfile import TemporaryFile
+from typing import Any, BinaryIO, Iterator, List, Optional
+
+from .context import RequestContext
+from .extproc import BaseExtProcService, StopRequestProcessing
+from .settings import BODY_MAX_SIZE, BODY_SPILL_DIR, BODY_SPILL_THRESHOLD
+from .util.envoy import EnvoyHttpStatusCode, ext_api
+
+
+class BodyTooLarge(StopRequestProcessing):
+    """a body went over its BodyBuffer's max_size; responds with a 413"""
+
+    def __init__(self, size: int, max_size: int) -> None:
+        super().__init__(
+            BaseExtProcService.form_immediate_response(
+                EnvoyHttpStatusCode.PayloadTooLarge,
+                {"content-type": "text/plain"},
+                f"body larger than {max_size} bytes",
+            ),
+            reason=f"body too large ({size} > {max_size} bytes)",
+        )
+        self.size = size
+        self.max_size = max_size
+
+
+class BodyBuffer:
+    """
+    A body collected from the chunks envoy streams, kept as a list of
+    views of the chunks' bytes rather than copied into one buffer as it
+    grows. A contiguous view is only made (by joining the chunks once)
+    when asked for, and `find` searches across chunk boundaries without
+    one.
+
+    Bodies over `max_size` raise BodyTooLarge (a StopRequestProcessing
+    with a 413 response). Bodies over `spill_threshold` move to a
+    temporary file (in `spill_dir`), and are read back through mmap, so
+    large bodies use page cache rather than process memory.
+    """
+
+    __slots__ = (
+        "max_size",
+        "spill_threshold",
+        "spill_dir",
+        "size",
+        "_chunks",
+        "_file",
+        "_map",
+    )
+
+    def __init__(
+        self,
+        max_size: Optional[int] = BODY_MAX_SIZE,
+        spill_threshold: Optional[int] = BODY_SPILL_THRESHOLD,
+        spill_dir: Optional[str] = BODY_SPILL_DIR,
+    ) -> None:
+        self.max_size = max_size
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.size = 0
+        self._chunks: List[memoryview] = []
+        self._file: Optional[BinaryIO] = None
+        self._map: Optional[mmap] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __enter__(self) -> "BodyBuffer":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def spilled(self) -> bool:
+        """whether the body has moved to a file"""
+        return self._file is not None
+
+    def append(self, chunk: bytes) -> "BodyBuffer":
+        """add a chunk (without copying it, unless spilled)"""
+        if not chunk:
+            return self
+        size = self.size + len(chunk)
+        if (self.max_size is not None) and (size > self.max_size):
+            self.close()
+            raise BodyTooLarge(size, self.max_size)
+        self.size = size
+        if self._file is not None:
+            self._unmap()
+            self._file.write(chunk)
+        elif (self.spill_threshold is not None) and (size > self.spill_threshold):
+            self._file = TemporaryFile(dir=self.spill_dir)  # type: ignore[assignment]
+            for previous in self._chunks:
+                self._file.write(previous)  # type: ignore[union-attr]
+            self._file.write(chunk)  # type: ignore[union-attr]
+            self._chunks = []
+        else:
+            self._chunks.append(memoryview(chunk))
+        return self
+
+    def chunks(self) -> Iterator[memoryview]:
+        """the body, chunk by chunk (in one piece, if spilled)"""
+        if self._file is not None:
+            yield self.view()
+        else:
+            yield from self._chunks
+
+    def view(self) -> memoryview:
+        """the whole body as one (read-only) view; joins chunks once"""
+        if self._file is not None:
+            if self._map is None:
+                self._file.flush()
+                self._map = mmap(self._file.fileno(), self.size, access=ACCESS_READ)
+            return memoryview(self._map)
+        if not self._chunks:
+            return memoryview(b"")
+        if len(self._chunks) > 1:
+            self._chunks = [memoryview(b"".join(self._chunks))]
+        return self._chunks[0]
+
+    def tobytes(self) -> bytes:
+        """the whole body as bytes (a copy)"""
+        return self.view().tobytes()
+
+    def find(self, sub: bytes, start: int = 0) -> int:
+        """
+        the offset of the first `sub` at or after `start`, or -1; matches
+        spanning chunks are found without joining them
+        """
+        if self._file is not None:
+            self.view()
+            return self._map.find(sub, start)  # type: ignore[union-attr]
+        if not sub:
+            return start if start <= self.size else -1
+        pattern = re.compile(re.escape(sub))
+        overlap = len(sub) - 1
+        tail = b""  # (up to) the last `overlap` bytes before this chunk
+        offset = 0
+        for chunk in self._chunks:
+            end = offset + len(chunk)
+            if end > start:
+                if tail:
+                    # matches starting in earlier chunks and ending in this one
+                    window = tail + chunk[:overlap].tobytes()
+                    index = window.find(sub)
+                    while (index != -1) and (index < len(tail)):
+                        position = offset - len(tail) + index
+                        if position >= start:
+                            return position
+                        index = window.find(sub, index + 1)
+                match = pattern.search(chunk, max(0, start - offset))  # type: ignore[call-overload]
+                if match is not None:
+                    return offset + match.start()  # type: ignore[no-any-return]
+            if overlap:
+                tail = (tail + chunk[-overlap:].tobytes())[-overlap:]
+            offset = end
+        return -1
+
+    def _unmap(self) -> None:
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # a view is still in use; it closes when collected
+            self._map = None
+
+    def close(self) -> None:
+        """drop the body (and any file it spilled to)"""
+        self._chunks = []
+        self._unmap()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.size = 0
+
+
+def _buffer_key(request: RequestContext) -> str:
+    return f"__{request.phase}_buffer"
+
+
+def body_buffer(
+    request: RequestContext,
+    body: ext_api.HttpBody,
+    max_size: Optional[int] = BODY_MAX_SIZE,
+    spill_threshold: Optional[int] = BODY_SPILL_THRESHOLD,
+) -> BodyBuffer:
+    """
+    Collect the chunks of a streamed body (of the current phase) in a
+    BodyBuffer kept in the request context, returning it with this chunk
+    added; after the last chunk (`end_of_stream`) the context lets go of
+    it. Like accumulate_body, without copying chunks into one buffer.
+    """
+    key = _buffer_key(request)
+    buffer = request.get(key)
+    if buffer is None:
+        buffer = BodyBuffer(max_size=max_size, spill_threshold=spill_threshold)
+        if not body.end_of_stream:
+            request[key] = buffer
+    elif body.end_of_stream:
+        del request[key]
+    try:
+        return buffer.append(body.body)  # type: ignore[no-any-return]
+    except BodyTooLarge:
+        request.pop(key, None)
+        raise
@@ -0,0 +1,393 @@
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from grpc import ServicerContext
+
+from .context import RequestContext
+from .extproc import (
+    BaseExtProcService,
+    ExtProcPhase,
+    PhaseDispatch,
+    PhaseResponse,
+)
+from .settings import EXTPROCS_APPLIED_HEADER, REVEAL_EXTPROC_CHAIN
+from .util.envoy import (
+    EnvoyHeaderValue,
+    EnvoyHeaderValueOption,
+    EnvoyProcessingMode,
+    ext_api,
+)
+from .util.mutation import merge_header_mutation
+
+PhaseData = Union[ext_api.HttpHeaders, ext_api.HttpBody, ext_api.HttpTrailers]
+
+# where the per-processor contexts live in the chain's own context
+CHAIN_CONTEXTS_KEY = "__chain"
+
+# the phases (of the same direction) after each headers phase: a chain runs
+# a headers phase whenever a processor handles one of these, so that every
+# processor's context gets that phase's standard headers
+_PHASES_AFTER_HEADERS: Dict[str, Tuple[str, ...]] = {
+    ExtProcPhase.request_headers.value: tuple(phase.value for phase in ExtProcPhase),
+    ExtProcPhase.response_headers.value: (
+        ExtProcPhase.response_headers.value,
+        ExtProcPhase.response_body.value,
+        ExtProcPhase.response_trailers.value,
+    ),
+}
+
+# ProcessingMode fields by phase, and body modes from the least to the most
+# demanding (BUFFERED bodies can be handled chunk by chunk, as one chunk,
+# but STREAMED ones can't be handled whole)
+_MODE_FIELDS: Dict[str, str] = {
+    ExtProcPhase.request_headers.value: "request_header_mode",
+    ExtProcPhase.request_body.value: "request_body_mode",
+    ExtProcPhase.request_trailers.value: "request_trailer_mode",
+    ExtProcPhase.response_headers.value: "response_header_mode",
+    ExtProcPhase.response_body.value: "response_body_mode",
+    ExtProcPhase.response_trailers.value: "response_trailer_mode",
+}
+_BODY_MODE_ORDER: Tuple[int, ...] = (
+    EnvoyProcessingMode.NONE,
+    EnvoyProcessingMode.STREAMED,
+    EnvoyProcessingMode.BUFFERED_PARTIAL,
+    EnvoyProcessingMode.BUFFERED,
+    EnvoyProcessingMode.FULL_DUPLEX_STREAMED,
+)
+
+
+def merge_response(into: PhaseResponse, response: PhaseResponse) -> None:
+    """merge a (later) processor's phase response into `into`"""
+    if isinstance(response, ext_api.HeaderMutation):
+        merge_header_mutation(into, response)  # type: ignore[arg-type]
+        return
+    assert isinstance(into, ext_api.CommonResponse)
+    if response.status == ext_api.CommonResponse.ResponseStatus.CONTINUE_AND_REPLACE:
+        into.status = response.status
+    if response.HasField("header_mutation"):
+        merge_header_mutation(into.header_mutation, response.header_mutation)
+    if response.HasField("body_mutation"):
+        into.body_mutation.CopyFrom(response.body_mutation)
+    if response.HasField("trailers"):
+        into.trailers.headers.extend(response.trailers.headers)
+    if response.clear_route_cache:
+        into.clear_route_cache = True
+
+
+def _mutate_header_map(
+    headers: Iterable[EnvoyHeaderValue], mutation: ext_api.HeaderMutation
+) -> List[EnvoyHeaderValue]:
+    """the headers a header mutation leaves (sets overwrite unless `append`)"""
+    removed = {name.lower() for name in mutation.remove_headers}
+    result = [h for h in headers if h.key.lower() not in removed]
+    for option in mutation.set_headers:
+        key = option.header.key.lower()
+        if not option.append.value:
+            result = [h for h in result if h.key.lower() != key]
+        result.append(option.header)
+    return result
+
+
+def apply_response(data: PhaseData, response: PhaseResponse) -> PhaseData:
+    """
+    the phase data as the next processor in a chain should see it, i.e.
+    with a processor's mutations applied (like the next ext_proc filter
+    in an envoy filter chain would). Returns `data` itself if unchanged.
+    """
+    if isinstance(response, ext_api.HeaderMutation):
+        mutation: Optional[ext_api.HeaderMutation] = response
+        body_mutation = None
+    elif isinstance(response, ext_api.CommonResponse):
+        mutation = response.header_mutation if response.HasField("header_mutation") else None
+        body_mutation = response.body_mutation if response.HasField("body_mutation") else None
+    else:
+        return data
+
+    if isinstance(data, ext_api.HttpBody):
+        if body_mutation is None:
+            return data
+        body = b"" if body_mutation.clear_body else body_mutation.body
+        return ext_api.HttpBody(body=body, end_of_stream=data.end_of_stream)
+
+    if (mutation is None) or not (mutation.set_headers or mutation.remove_headers):
+        return data
+    field = "headers" if isinstance(data, ext_api.HttpHeaders) else "trailers"
+    result = type(data)()
+    result.CopyFrom(data)
+    header_map = getattr(result, field)
+    values = _mutate_header_map(getattr(data, field).headers, mutation)
+    del header_map.headers[:]
+    header_map.headers.extend(values)
+    return result
+
+
+class ChainedExtProcService(BaseExtProcService):
+    """
+    Runs several processors, in order, within one ext_proc stream, instead
+    of one envoy ext_proc filter (and one gRPC stream and round trip per
+    phase) for each.
+
+    Each processor keeps its own RequestContext, sees the phase data as
+    modified by the processors before it (as it would behind those in an
+    envoy filter chain) and its response is merged, in order, into the
+    response the chain sends. A StopRequestProcessing from any processor
+    ends processing there, without running the rest. Phases a processor
+    skips (see skip_phases) are only skipped for the stream once every
+    processor handling them has.
+
+    The chain's PROCESSING_MODE (unless a subclass sets one) is merged
+    from those of the processors handling each phase: headers and
+    trailers are SEND if any of them needs it, and bodies use the most
+    demanding mode any of them needs. Configure the envoy filter with it.
+    """
+
+    def __init__(
+        self,
+        *services: BaseExtProcService,
+        name: Optional[str] = None,
+        **kwargs: Any,
+    ) -> None:
+        if not services:
+            raise ValueError("ChainedExtProcService needs at least one service")
+        self.services: Tuple[BaseExtProcService, ...] = services
+        self._handlers: Dict[str, List[Tuple[int, PhaseDispatch]]] = {}
+        if type(self).PROCESSING_MODE is BaseExtProcService.PROCESSING_MODE:
+            self.PROCESSING_MODE = self.merged_processing_mode()
+        super().__init__(name=name or ",".join(s.name for s in services), **kwargs)
+
+    def _resolve_phase(self, phase: str) -> None:
+        """(re)build the dispatch entry for a phase; the chain handles the
+        phases any of its processors handle"""
+        handlers = self._handlers[phase] = self.phase_handlers(phase)
+        super()._resolve_phase(phase)
+        handled = bool(handlers) or (
+            REVEAL_EXTPROC_CHAIN and (phase == ExtProcPhase.response_headers)
+        )
+        if phase in _PHASES_AFTER_HEADERS:
+            handled = handled or any(self.phase_handlers(p) for p in _PHASES_AFTER_HEADERS[phase])
+        self._dispatch[phase] = self._dispatch[phase]._replace(handled=handled)
+
+    def merged_processing_mode(self) -> EnvoyProcessingMode:
+        """
+        the ProcessingMode the chain needs, by phase, from those of the
+        processors handling it (or, for phases none handles, of all of
+        them, which mode_override then turns off): SEND for headers and
+        trailers if any has it, and the most demanding body mode
+        """
+        mode = EnvoyProcessingMode()
+        for phase, field in _MODE_FIELDS.items():
+            services = [self.services[index] for index, _ in self.phase_handlers(phase)]
+            modes = [getattr(s.PROCESSING_MODE, field) for s in (services or self.services)]
+            if field.endswith("_body_mode"):
+                value = max(modes, key=_BODY_MODE_ORDER.index)
+            elif EnvoyProcessingMode.SEND in modes:
+                value = EnvoyProcessingMode.SEND
+            else:
+                value = EnvoyProcessingMode.SKIP
+            setattr(mode, field, value)
+        return mode
+
+    def shutdown(self, wait: bool = True) -> None:
+        """shut down the chain's pools and those of its processors"""
+        super().shutdown(wait=wait)
+        for service in self.services:
+            service.shutdown(wait=wait)
+
+    def overhead_metadata(self, request: RequestContext) -> Dict[str, Any]:
+        """the chain's overhead, and each processor's own"""
+        metadata = super().overhead_metadata(request)
+        contexts = request.get(CHAIN_CONTEXTS_KEY)
+        if contexts is not None:
+            for service, sub_request in zip(self.services, contexts):
+                metadata.update(service.overhead_metadata(sub_request))
+        return metadata
+
+    def queued_handlers(self) -> int:
+        """handlers waiting for a worker in the chain's or its processors' pools"""
+        return super().queued_handlers() + sum(s.queued_handlers() for s in self.services)
+
+    def phase_handlers(self, phase: str) -> List[Tuple[int, PhaseDispatch]]:
+        """(index, dispatch) of the processors that handle a phase themselves"""
+        default = getattr(BaseExtProcService, f"process_{phase}")
+        handlers = []
+        for index, service in enumerate(self.services):
+            dispatch = service._dispatch.get(phase)
+            if (dispatch is None) or (not dispatch.handled):
+                continue
+            if getattr(dispatch.action, "__func__", dispatch.action) is default:
+                continue  # "handled" only because of the chain header
+            handlers.append((index, dispatch))
+        return handlers
+
+    def contexts(self, request: RequestContext) -> Sequence[RequestContext]:
+        """the processors' own contexts for a stream (made on first use)"""
+        contexts = request.get(CHAIN_CONTEXTS_KEY)
+        if contexts is None:
+            contexts = [RequestContext() for _ in self.services]
+            for context in contexts:
+                context.traced = request.traced
+            request[CHAIN_CONTEXTS_KEY] = contexts
+        return contexts  # type: ignore[no-any-return]
+
+    async def run_chain(
+        self,
+        phase: str,
+        data: PhaseData,
+        context: ServicerContext,
+        request: RequestContext,
+        response: PhaseResponse,
+    ) -> PhaseResponse:
+        """run a phase through each processor handling it, merging responses"""
+        handlers = self._handlers[phase]
+        contexts = self.contexts(request)
+        skipping = False
+        last = len(handlers) - 1
+        headers_phase = phase in _PHASES_AFTER_HEADERS
+        if headers_phase:
+            self.update_standard_headers(phase, data, contexts)
+        for position, (index, dispatch) in enumerate(handlers):
+            sub_request = contexts[index]
+            skipped = sub_request.skipped
+            if skipped and phase in skipped:
+                continue
+            sub_request.phase = phase
+            sub_response = await self.services[index].process_phase(
+                phase,
+                data,
+                context,
+                sub_request,
+                dispatch.response_factory(),
+                dispatch.action,
+                is_coroutine=dispatch.is_coroutine,
+                executor=dispatch.executor,
+                timeout=dispatch.timeout,
+            )
+            if not isinstance(sub_response, dispatch.response_factory):
+                continue
+            merge_response(response, sub_response)
+            if headers_phase:
+                # processors after this one (handling the phase or not) see
+                # the standard headers as it left them
+                changed = apply_response(data, sub_response)
+                if changed is not data:
+                    self.update_standard_headers(phase, changed, contexts, start=index + 1)
+                data = changed
+            elif position < last:
+                data = apply_response(data, sub_response)
+            skipping = skipping or bool(sub_request.skipped)
+        if skipping:
+            self._skip_common_phases(request, contexts)
+        return response
+
+    def update_standard_headers(
+        self,
+        phase: str,
+        headers: PhaseData,
+        contexts: Sequence[RequestContext],
+        start: int = 0,
+    ) -> None:
+        """copy a headers phase's standard headers (see STANDARD_REQUEST_HEADERS)
+        into the contexts of the processors from `start` on"""
+        for index in range(start, len(self.services)):
+            dispatch = self.services[index]._dispatch.get(phase)
+            if (dispatch is not None) and (dispatch.standard_headers is not None):
+                contexts[index].update(dispatch.standard_headers(headers))
+
+    def _skip_common_phases(
+        self, request: RequestContext, contexts: Sequence[RequestContext]
+    ) -> None:
+        """skip phases for the stream that all processors handling them skip"""
+        phases: Set[str] = set()
+        for sub_request in contexts:
+            phases.update(sub_request.skipped or ())
+        for phase in phases:
+            if all(phase in (contexts[index].skipped or ()) for index, _ in self._handlers[phase]):
+                self.skip_phases(request, ExtProcPhase(phase))
+
+    def add_extprocs_chain_header(
+        self,
+        headers: ext_api.HttpHeaders,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        """the chain header lists every chained processor, in order"""
+        names = ",".join(service.name for service in self.services)
+        filters_header = self.get_header(headers, EXTPROCS_APPLIED_HEADER, lower_cased=True)
+        value = f"{names},{filters_header}" if filters_header else names
+        header = EnvoyHeaderValue(key=EXTPROCS_APPLIED_HEADER, value=value)
+        response.header_mutation.set_headers.append(EnvoyHeaderValueOption(header=header))
+        return response
+
+    async def process_request_headers(
+        self,
+        headers: ext_api.HttpHeaders,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        return await self.run_chain(  # type: ignore[return-value]
+            ExtProcPhase.request_headers.value, headers, context, request, response
+        )
+
+    async def process_request_body(
+        self,
+        body: ext_api.HttpBody,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        return await self.run_chain(  # type: ignore[return-value]
+            ExtProcPhase.request_body.value, body, context, request, response
+        )
+
+    async def process_request_trailers(
+        self,
+        trailers: ext_api.HttpTrailers,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.TrailersResponse,
+    ) -> ext_api.TrailersResponse:
+        return await self.run_chain(  # type: ignore[return-value]
+            ExtProcPhase.request_trailers.value, trailers, context, request, response
+        )
+
+    async def process_response_headers(
+        self,
+        headers: ext_api.HttpHeaders,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        return await self.run_chain(  # type: ignore[return-value]
+            ExtProcPhase.response_headers.value, headers, context, request, response
+        )
+
+    async def process_response_body(
+        self,
+        body: ext_api.HttpBody,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        return await self.run_chain(  # type: ignore[return-value]
+            ExtProcPhase.response_body.value, body, context, request, response
+        )
+
+    async def process_response_trailers(
+        self,
+        trailers: ext_api.HttpTrailers,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.TrailersResponse,
+    ) -> ext_api.TrailersResponse:
+        return await self.run_chain(  # type: ignore[return-value]
+            ExtProcPhase.response_trailers.value, trailers, context, request, response
+        )
@@ -0,0 +1,183 @@
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Mapping, Optional, Set
+
+# dictionary keys that map to RequestContext slots. These are the keys
+# the SDK has always used for the per-stream "request" dict, so handlers
+# written against the dict keep working unchanged.
+_SLOT_KEYS: Dict[str, str] = {
+    "method": "method",
+    "path": "path",
+    "content_type": "content_type",
+    "content_length": "content_length",
+    "__id": "id",
+    "__phase": "phase",
+    "__overhead_ns": "overhead_ns",
+    "__phase_overhead_ns": "phase_overhead_ns",
+    "__skipped": "skipped",
+}
+
+# what each slot holds when nothing set it (and after its key is deleted)
+_SLOT_DEFAULTS: Dict[str, Any] = {
+    "method": None,
+    "path": None,
+    "content_type": None,
+    "content_length": None,
+    "id": "unknown",
+    "phase": "unknown",
+    "overhead_ns": 0,
+    "phase_overhead_ns": None,
+    "skipped": None,
+}
+
+_MISSING = object()
+
+
+class RequestContext(MutableMapping[str, Any]):
+    """
+    Per-stream ("request") context passed to every phase handler.
+
+    The standard fields the SDK itself maintains live in slots (and can
+    be used as attributes, e.g. `request.path`), while anything else a
+    handler stores goes into an extension dict that is only allocated
+    when first used. The object is a mutable mapping like the plain dict
+    earlier versions used, so `request["path"]`, `request.get("tenant")`,
+    `request["timer"] = ...`, `request.copy()` and friends all still work.
+    Slot-backed keys holding `None` are treated as absent, so
+    `request.get("path", "")` returns `""` when no path header was seen,
+    and deleting one resets it to its default. It isn't a dict, though:
+    serialize `to_dict()` (e.g. for `json.dumps`).
+    """
+
+    __slots__ = (
+        "method",
+        "path",
+        "content_type",
+        "content_length",
+        "id",
+        "phase",
+        "overhead_ns",
+        "phase_overhead_ns",
+        "skipped",
+        "traced",
+        "_extra",
+    )
+
+    def __init__(self, values: Optional[Mapping[str, Any]] = None) -> None:
+        self.method: Optional[str] = None
+        self.path: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.content_length: Optional[str] = None
+        self.id: Optional[str] = "unknown"
+        self.phase: Optional[str] = "unknown"
+        self.overhead_ns: int = 0
+        self.phase_overhead_ns: Optional[Dict[str, int]] = None
+        self.skipped: Optional[Set[str]] = None
+        self.traced: bool = False
+        self._extra: Optional[Dict[str, Any]] = None
+        if values:
+            self.update(values)
+
+    def __repr__(self) -> str:
+        return f"RequestContext({self.to_dict()!r})"
+
+    def __getitem__(self, key: str) -> Any:
+        slot = _SLOT_KEYS.get(key)
+        if slot is not None:
+            return getattr(self, slot)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        slot = _SLOT_KEYS.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        slot = _SLOT_KEYS.get(key)
+        if slot is not None:
+            default = _SLOT_DEFAULTS[slot]
+            value = getattr(self, slot)
+            if (value is None) or (value == default):
+                raise KeyError(key)
+            setattr(self, slot, default)
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key: object) -> bool:
+        slot = _SLOT_KEYS.get(key)  # type: ignore[call-overload]
+        if slot is not None:
+            return getattr(self, slot) is not None
+        return (self._extra is not None) and (key in self._extra)
+
+    def __iter__(self) -> Iterator[str]:
+        for key, slot in _SLOT_KEYS.items():
+            if getattr(self, slot) is not None:
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (RequestContext, Mapping)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def get(self, key: str, default: Any = None) -> Any:
+        slot = _SLOT_KEYS.get(key)
+        if slot is not None:
+            value = getattr(self, slot)
+            return default if value is None else value
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = default
+            return default
+        return value
+
+    def pop(self, key: str, default: Any = _MISSING) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            try:
+                del self[key]
+                return value
+            except KeyError:
+                pass
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        """a plain dict copy of this context (standard fields by their keys)"""
+        return dict(self.items())
+
+    def copy(self) -> "RequestContext":
+        """
+        a shallow copy, like dict.copy: values are shared, but setting or
+        deleting keys in one doesn't change the other (nor does skipping
+        phases, or timing them, in one)
+        """
+        copied = RequestContext.__new__(RequestContext)
+        for slot in self.__slots__:
+            setattr(copied, slot, getattr(self, slot))
+        if self._extra is not None:
+            copied._extra = dict(self._extra)
+        if self.skipped is not None:
+            copied.skipped = set(self.skipped)
+        if self.phase_overhead_ns is not None:
+            copied.phase_overhead_ns = dict(self.phase_overhead_ns)
+        return copied
+
+    __copy__ = copy
@@ -0,0 +1,210 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import copy_context
+from multiprocessing import get_context
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .settings import EXECUTOR_BACKLOG, EXECUTOR_PROCESSES, EXECUTOR_THREADS
+
+# how a handler runs: on the event loop (None), in the service's "thread"
+# or "process" pool, or in a given Executor
+ExecutorSpec = Union[None, str, Executor]
+
+EXECUTOR_KINDS = ("thread", "process")
+
+_local = threading.local()
+
+
+def _run_handler(
+    action: Callable,
+    is_coroutine: bool,
+    *args: Any,
+    loops: Optional[List[asyncio.AbstractEventLoop]] = None,
+) -> Any:
+    """call a handler in a pool thread or process; coroutine handlers run
+    on an event loop kept for that thread, added to `loops` (if given) so
+    whoever owns the pool can close it"""
+    if not is_coroutine:
+        return action(*args)
+    loop = getattr(_local, "loop", None)
+    if (loop is None) or loop.is_closed():
+        loop = _local.loop = asyncio.new_event_loop()
+        if loops is not None:
+            loops.append(loop)
+    return loop.run_until_complete(action(*args))
+
+
+def validate_executor(executor: ExecutorSpec) -> ExecutorSpec:
+    """an executor option as given, if it is one"""
+    if (executor is None) or isinstance(executor, Executor) or (executor in EXECUTOR_KINDS):
+        return executor
+    raise ValueError(
+        f"Unknown executor {executor!r}; use one of {', '.join(EXECUTOR_KINDS)} or an Executor"
+    )
+
+
+class HandlerPools:
+    """
+    The pools a service runs handlers in off the event loop, so CPU-heavy
+    handlers (hashing or parsing large bodies, say) don't stall every other
+    stream: a thread pool ("thread"), good for work that releases the GIL
+    (hashlib, zlib and many C parsers do), and a process pool ("process")
+    for work that doesn't. Pools are created on first use.
+
+    Each pool takes at most its workers plus `backlog` handlers at a time;
+    streams wanting more wait (on the loop) for a slot, rather than queueing
+    unboundedly in the pool. A slot is held until the handler is done, even
+    if its stream is cancelled (or its deadline passes) meanwhile: pool
+    threads and processes can't be interrupted, so a handler that already
+    started runs on. Those are counted in `overrun`.
+
+    Handlers run in processes get a copy of the request context (changes
+    to it aren't seen by later phases), no gRPC context (None), and must be
+    picklable, e.g. module-level functions or methods of a service (which
+    get a copy of it, see BaseExtProcService.__getstate__); they return the
+    response.
+    """
+
+    def __init__(
+        self,
+        threads: Optional[int] = EXECUTOR_THREADS,
+        processes: Optional[int] = EXECUTOR_PROCESSES,
+        backlog: int = EXECUTOR_BACKLOG,
+    ) -> None:
+        self.threads = threads
+        self.processes = processes
+        self.backlog = backlog
+        self._pools: Dict[str, Executor] = {}
+        self._limits: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = {}
+        # handlers waiting for or in each pool, and the pool's workers
+        self._active: Dict[int, int] = {}
+        self._workers: Dict[int, int] = {}
+        # the event loops pool threads made for coroutine handlers
+        self._loops: List[asyncio.AbstractEventLoop] = []
+        # handlers that kept running after they stopped being waited for
+        self.overrun = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(threads={self.threads},"
+            f" processes={self.processes}, backlog={self.backlog})"
+        )
+
+    def pool(self, executor: Union[str, Executor]) -> Executor:
+        """the pool for an executor option (created on first use)"""
+        if isinstance(executor, Executor):
+            return executor
+        pool = self._pools.get(executor)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(executor)
+                if pool is None:
+                    pool = self._pools[executor] = self._create(executor)
+        return pool
+
+    def _create(self, executor: str) -> Executor:
+        if executor == "thread":
+            return ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="extproc")
+        if executor == "process":
+            # not forked: the gRPC runtime doesn't survive fork
+            return ProcessPoolExecutor(max_workers=self.processes, mp_context=get_context("spawn"))
+        raise ValueError(f"Unknown executor {executor!r}; use one of {', '.join(EXECUTOR_KINDS)}")
+
+    def _limit(self, pool: Executor) -> asyncio.Semaphore:
+        """the (per event loop) bound on handlers in a pool"""
+        loop = asyncio.get_running_loop()
+        entry = self._limits.get(id(pool))
+        if (entry is None) or (entry[0] is not loop):
+            workers = self._workers[id(pool)] = getattr(pool, "_max_workers", None) or 1
+            entry = self._limits[id(pool)] = (loop, asyncio.Semaphore(workers + self.backlog))
+        return entry[1]
+
+    @property
+    def queued(self) -> int:
+        """handlers waiting for a worker, in the pools or for a slot"""
+        return sum(
+            max(0, active - self._workers.get(key, 1)) for key, active in self._active.items()
+        )
+
+    def _finished(self, key: int, limit: Optional[asyncio.Semaphore] = None) -> None:
+        if limit is not None:
+            limit.release()
+        self._active[key] -= 1
+
+    async def run(
+        self,
+        executor: Union[str, Executor],
+        action: Callable,
+        is_coroutine: bool,
+        data: Any,
+        context: Any,
+        request: Any,
+        response: Any,
+    ) -> Any:
+        """run a handler in a pool, waiting for a slot if the pool is full"""
+        pool = self.pool(executor)
+        limit = self._limit(pool)
+        key = id(pool)
+        self._active[key] = self._active.get(key, 0) + 1
+        try:
+            await limit.acquire()
+        except BaseException:
+            self._finished(key)
+            raise
+        loop = asyncio.get_running_loop()
+        try:
+            if isinstance(pool, ProcessPoolExecutor):
+                future = pool.submit(
+                    _run_handler, action, is_coroutine, data, None, request, response
+                )
+            else:
+                # in this (copied) context, so helpers still see the mutation builder
+                future = pool.submit(
+                    copy_context().run,
+                    _run_handler,
+                    action,
+                    is_coroutine,
+                    data,
+                    context,
+                    request,
+                    response,
+                    loops=self._loops,
+                )
+        except BaseException:
+            self._finished(key, limit)
+            raise
+
+        def release(_: Any) -> None:
+            # when the handler is done, not when we stop waiting for it
+            try:
+                loop.call_soon_threadsafe(self._finished, key, limit)
+            except RuntimeError:
+                pass  # the loop is closed
+
+        future.add_done_callback(release)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # only a handler that hasn't started yet can be dropped
+            future.cancel()
+            if future.running():
+                self.overrun += 1
+            raise
+
+    def shutdown(self, wait: bool = True) -> None:
+        """shut down the pools created (they're recreated if used again),
+        and close the event loops their threads ran coroutine handlers on;
+        without waiting, loops still running a handler are left open"""
+        with self._lock:
+            pools, self._pools = self._pools, {}
+            self._limits = {}
+            loops, self._loops = self._loops, []
+        for pool in pools.values():
+            pool.shutdown(wait=wait)
+        for loop in loops:
+            try:
+                loop.close()
+            except RuntimeError:
+                pass  # running a handler still
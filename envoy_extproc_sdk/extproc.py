@@ -1,35 +1,63 @@
 from __future__ import annotations
 
-from asyncio import CancelledError, iscoroutinefunction
+from asyncio import (
+    CancelledError,
+    ensure_future,
+    get_running_loop,
+    iscoroutinefunction,
+)
 from enum import Enum
-from logging import getLogger, Logger
+from logging import DEBUG, getLogger, Logger
+from time import perf_counter_ns
 from typing import (
+    Any,
     AsyncGenerator,
     AsyncIterator,
+    Awaitable,
     Callable,
+    Counter,
     Dict,
+    FrozenSet,
+    Iterable,
     List,
+    NamedTuple,
     Optional,
     Tuple,
+    Type,
     Union,
 )
 
-from ddtrace import tracer  # noqa: F401
 from grpc import ServicerContext, StatusCode
 
+from .admission import AdmissionController, get_admission_controller
+from .context import RequestContext
+from .executors import ExecutorSpec, HandlerPools, validate_executor
+from .metrics import EXTPROC_METRICS, ExtProcMetrics
 from .settings import (
-    ENVOY_SERVICE_NAME,
+    ADMISSION_FAIL_OPEN,
     EXTPROCS_APPLIED_HEADER,
+    LOG_SAMPLE_RATE,
+    METRICS,
+    OVERHEAD_METADATA,
+    OVERHEAD_METADATA_NAMESPACE,
+    PHASE_TIMEOUT_FAIL_OPEN,
+    PHASE_TIMEOUT_MS,
     REVEAL_EXTPROC_CHAIN,
+    SEND_MODE_OVERRIDE,
 )
+from .tracing import ExtProcTracer, get_tracer, NO_SPAN, NoopTracer
 from .util.envoy import (
     EnvoyExtProcServicer,
     EnvoyHeaderValue,
     EnvoyHeaderValueOption,
     EnvoyHttpStatus,
     EnvoyHttpStatusCode,
+    EnvoyProcessingMode,
     ext_api,
 )
+from .util.headers import HeaderIndex
+from .util.mutation import MutationBuilder
+from .util.sampling import EveryNth
 from .util.timer import Timer
 
 logger = getLogger(__name__)
@@ -37,6 +65,8 @@ logger = getLogger(__name__)
 
 ExtProcHandler = Callable
 
+PhaseResponse = Union[ext_api.CommonResponse, ext_api.HeaderMutation]
+
 
 class ExtProcPhase(str, Enum):
     request_headers = "request_headers"
@@ -47,6 +77,103 @@ class ExtProcPhase(str, Enum):
     response_trailers = "response_trailers"
 
 
+# For each phase: the (convenience) response object handlers receive,
+# the phase-specific message that wraps it and the field it goes in.
+# The ProcessingResponse field to fill is the phase name itself.
+_PHASE_RESPONSES: Dict[str, Tuple[Type[PhaseResponse], Type, str]] = {
+    ExtProcPhase.request_headers.value: (
+        ext_api.CommonResponse,
+        ext_api.HeadersResponse,
+        "response",
+    ),
+    ExtProcPhase.request_body.value: (ext_api.CommonResponse, ext_api.BodyResponse, "response"),
+    ExtProcPhase.request_trailers.value: (
+        ext_api.HeaderMutation,
+        ext_api.TrailersResponse,
+        "header_mutation",
+    ),
+    ExtProcPhase.response_headers.value: (
+        ext_api.CommonResponse,
+        ext_api.HeadersResponse,
+        "response",
+    ),
+    ExtProcPhase.response_body.value: (ext_api.CommonResponse, ext_api.BodyResponse, "response"),
+    ExtProcPhase.response_trailers.value: (
+        ext_api.HeaderMutation,
+        ext_api.TrailersResponse,
+        "header_mutation",
+    ),
+}
+
+# For each phase: the ProcessingMode field that controls whether envoy
+# sends it, and the value of that field that turns it off.
+_PHASE_MODES: Dict[str, Tuple[str, int]] = {
+    ExtProcPhase.request_headers.value: ("request_header_mode", EnvoyProcessingMode.SKIP),
+    ExtProcPhase.request_body.value: ("request_body_mode", EnvoyProcessingMode.NONE),
+    ExtProcPhase.request_trailers.value: ("request_trailer_mode", EnvoyProcessingMode.SKIP),
+    ExtProcPhase.response_headers.value: ("response_header_mode", EnvoyProcessingMode.SKIP),
+    ExtProcPhase.response_body.value: ("response_body_mode", EnvoyProcessingMode.NONE),
+    ExtProcPhase.response_trailers.value: ("response_trailer_mode", EnvoyProcessingMode.SKIP),
+}
+
+
+# body phases, which may be processed chunk by chunk (see process_*_chunk)
+_BODY_PHASES: Dict[str, str] = {
+    ExtProcPhase.request_body.value: "request_body_mode",
+    ExtProcPhase.response_body.value: "response_body_mode",
+}
+
+
+class PhaseDispatch(NamedTuple):
+    """Everything Process needs to handle one phase, resolved ahead of
+    time so the per-message path is a single dictionary lookup."""
+
+    phase: str
+    action: ExtProcHandler
+    is_coroutine: bool
+    response_factory: Type[PhaseResponse]
+    phase_response: Type
+    phase_response_field: str
+    standard_headers: Optional[Callable[[ext_api.HttpHeaders], Dict[str, Optional[str]]]]
+    handled: bool
+    skip_response: ext_api.ProcessingResponse
+    executor: ExecutorSpec = None
+    timeout: Optional[float] = None  # seconds
+
+    def wrap(self, response: PhaseResponse) -> ext_api.ProcessingResponse:
+        """wrap a handler's response in the ProcessingResponse for this phase"""
+        if not isinstance(response, self.response_factory):
+            response = None
+        phase_response = self.phase_response(**{self.phase_response_field: response})
+        return ext_api.ProcessingResponse(**{self.phase: phase_response})
+
+
+async def _within_deadline(call: Awaitable, timeout: float) -> Tuple[bool, Any]:
+    """
+    await a handler's call, cancelling it once `timeout` seconds pass:
+    whether its deadline fired (with no result), or its result. Unlike
+    wait_for, a TimeoutError the handler raises itself isn't a deadline.
+    """
+    task = ensure_future(call)
+    fired = False
+
+    def expire() -> None:
+        nonlocal fired
+        if not task.done():
+            fired = True
+            task.cancel()
+
+    deadline = get_running_loop().call_later(timeout, expire)
+    try:
+        return False, await task
+    except CancelledError:
+        if not fired:
+            raise  # the stream's, not the deadline's
+        return True, None
+    finally:
+        deadline.cancel()
+
+
 class StopRequestProcessing(Exception):
     """Raise this exception to stop processing the request
     altogether, concluding processing with the `response`
@@ -82,18 +209,133 @@ class BaseExtProcService(EnvoyExtProcServicer):
         "content-length": "content_length",
     }
 
-    def __init__(self, name: Optional[str] = None, logger: Optional[Logger] = None) -> None:
+    # The processing_mode envoy is configured with for this processor.
+    # Phases no handler implements are turned off relative to this in the
+    # mode_override sent with the first response; override in subclasses
+    # (or on instances) that are configured differently.
+    PROCESSING_MODE = EnvoyProcessingMode(
+        request_header_mode=EnvoyProcessingMode.SEND,
+        response_header_mode=EnvoyProcessingMode.SEND,
+        request_body_mode=EnvoyProcessingMode.BUFFERED,
+        response_body_mode=EnvoyProcessingMode.BUFFERED,
+        request_trailer_mode=EnvoyProcessingMode.SKIP,
+        response_trailer_mode=EnvoyProcessingMode.SKIP,
+    )
+
+    # Handlers to run off the event loop, by phase: "thread" or "process"
+    # (this service's HandlerPools), or an Executor. Override in subclasses,
+    # or pass `executors` (or use `@P.process(phase, executor=...)`). In a
+    # "process" pool, handlers are pickled: module-level functions, or
+    # methods, which take a copy of the service along (see __getstate__).
+    EXECUTORS: Dict[str, ExecutorSpec] = {}
+
+    # Whether the first response carries a mode_override turning off phases
+    # no handler uses (see PROCESSING_MODE). Off by default: the override
+    # is computed against PROCESSING_MODE, so opt in only where that matches
+    # the processing_mode envoy is configured with.
+    MODE_OVERRIDE: bool = SEND_MODE_OVERRIDE
+
+    # Whether streams the admission controller sheds are passed on
+    # unprocessed (CONTINUE), rather than answered with overloaded_response
+    FAIL_OPEN: bool = ADMISSION_FAIL_OPEN
+
+    # Deadlines for handlers, in ms: DEFAULT_TIMEOUT_MS for every phase, or
+    # by phase in TIMEOUTS_MS (or `timeouts_ms`, or `@P.process(phase,
+    # timeout_ms=...)`); None is no deadline. A handler past its deadline is
+    # cancelled, and the phase answered with the response as it was before
+    # the handler ran (TIMEOUT_FAIL_OPEN) or with timeout_response.
+    DEFAULT_TIMEOUT_MS: Optional[float] = PHASE_TIMEOUT_MS
+    TIMEOUTS_MS: Dict[str, Optional[float]] = {}
+    TIMEOUT_FAIL_OPEN: bool = PHASE_TIMEOUT_FAIL_OPEN
+
+    # Whether responses report the request's overhead so far (see
+    # overhead_metadata) to envoy as dynamic metadata, and under what
+    # namespace; envoy access logs can then include it, e.g. as
+    # %DYNAMIC_METADATA(envoy_extproc_sdk:SomeExtProcService:overhead_ns)%
+    REPORT_OVERHEAD: bool = OVERHEAD_METADATA
+    METADATA_NAMESPACE: str = OVERHEAD_METADATA_NAMESPACE
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        logger: Optional[Logger] = None,
+        log_sample_rate: Optional[int] = None,
+        tracer: Optional[ExtProcTracer] = None,
+        executors: Optional[Dict[str, ExecutorSpec]] = None,
+        pools: Optional[HandlerPools] = None,
+        admission: Optional[AdmissionController] = None,
+        timeouts_ms: Optional[Dict[str, Optional[float]]] = None,
+        metrics: Optional[ExtProcMetrics] = None,
+    ) -> None:
         self.name = name or self.__class__.__name__
         self.logger = logger or getLogger(__name__)
+        # log 1 in N phase completions at INFO, so there's some visibility
+        # at high request rates without formatting logs for every message
+        self.log_sampler = EveryNth(LOG_SAMPLE_RATE if log_sample_rate is None else log_sample_rate)
+        self.tracer = tracer or get_tracer()
+        self.executors: Dict[str, ExecutorSpec] = {
+            ExtProcPhase(phase).value: validate_executor(executor)
+            for phase, executor in {**self.EXECUTORS, **(executors or {})}.items()
+        }
+        self.timeouts_ms: Dict[str, Optional[float]] = {
+            ExtProcPhase(phase).value: timeout
+            for phase, timeout in {**self.TIMEOUTS_MS, **(timeouts_ms or {})}.items()
+        }
+        # handlers cancelled at their deadline, by phase
+        self.timed_out: Counter[str] = Counter()
+        self.pools = pools or HandlerPools()
+        self.admission = admission or get_admission_controller()
+        # None when METRICS is off
+        self.metrics = metrics or (EXTPROC_METRICS if METRICS else None)
+        # streams being processed (see health.LoadMonitor)
+        self.in_flight = 0
+        self._dispatch: Dict[str, PhaseDispatch] = {}
+        self._mode_override: Optional[EnvoyProcessingMode] = None
+        for phase in ExtProcPhase:
+            self._resolve_phase(phase.value)
+        self._resolve_mode_override()
+        self._full_duplex = self.full_duplex_phases(self.PROCESSING_MODE)
 
     def __repr__(self) -> str:
         """Get this object's \"name\", either class name or overriden"""
         return self.name
 
+    # A handler that's a method, run in a "process" pool, is pickled with
+    # its service. What only makes sense in the serving process (pools,
+    # executors, tracing, admission, metrics) isn't sent along: the copy
+    # there can call helpers and read the service's settings and state,
+    # but its own handlers run inline, untraced and unmetered.
+    _PROCESS_LOCAL = ("pools", "executors", "tracer", "admission", "metrics", "_dispatch")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for name in self._PROCESS_LOCAL:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.pools = HandlerPools()
+        self.executors = {}
+        self.tracer = NoopTracer()
+        self.admission = get_admission_controller("off")
+        self.metrics = None
+        self._dispatch = {}
+        for phase in ExtProcPhase:
+            self._resolve_phase(phase.value)
+
     def __call__(self) -> BaseExtProcService:
         """This no-op makes symbol importing and decorating work together"""
         return self
 
+    def shutdown(self, wait: bool = True) -> None:
+        """release resources, i.e. the pools handlers run in (see EXECUTORS)"""
+        self.pools.shutdown(wait=wait)
+
+    def queued_handlers(self) -> int:
+        """handlers waiting for a worker in this service's pools"""
+        return self.pools.queued
+
     async def Process(
         self,
         request_iterator: AsyncIterator[ext_api.ProcessingRequest],
@@ -124,129 +366,182 @@ class BaseExtProcService(EnvoyExtProcServicer):
         headers.
         """
 
-        with tracer.trace(
-            "process",
-            resource=f"/{ENVOY_SERVICE_NAME}/Process",
-            span_type="grpc",
-        ):
-            # for each stream invocation, define a new "call" context/"request"
-            request = {"__overhead_ns": 0, "__phase": "unknown", "__id": "unknown"}
-
-            async for req in self.safe_iterator(request_iterator, context, request):
-                phase = req.WhichOneof("request")
-                request["__phase"] = phase
-
-                # get the request-phase's data
-                data = getattr(req, phase)
-
-                # get the "action" to apply
-                action_name = f"process_{phase}"
-                action = getattr(self, action_name, None)
-
-                if phase == "request_headers":
-                    request.update(self.get_standard_request_headers(data))
-                elif phase == "response_headers":
-                    request.update(self.get_standard_response_headers(data))
-
-                if (action is None) or (not callable(action)):
-                    msg = f"{self.name} does not implement a callable for {phase}"
-                    logger.error(msg)
-                    context.abort(StatusCode.UNIMPLEMENTED, msg)
-
-                # get a response object to pass (convenience)
-                response = (
-                    ext_api.HeaderMutation()
-                    if phase.endswith("trailers")
-                    else ext_api.CommonResponse()
-                )
-
-                # NOTE: this only applies if we process response_headers...
-                # that's an envoy configuration. To always capture this we
-                # could assert that the response headers ProcessingMode is
-                # always SEND
-                # Chain header only applies to response_headers phase
-                if REVEAL_EXTPROC_CHAIN and (phase == "response_headers"):
-                    # We know response is CommonResponse in this phase
-                    assert isinstance(response, ext_api.CommonResponse)
-                    response = self.add_extprocs_chain_header(data, response)
-
-                # actually process the phase, wrapped for timing and tracing
-                try:
-                    response = await self.process_phase(
-                        phase, data, context, request, response, action
-                    )
-                    # Type inference can't handle ** construction with oneof fields
-                    # So we create the response objects directly
-                    if phase.endswith("headers"):
-                        headers_response = ext_api.HeadersResponse(
-                            response=response
-                            if isinstance(response, ext_api.CommonResponse)
-                            else None
-                        )
-                        if phase == "request_headers":
-                            result = ext_api.ProcessingResponse(request_headers=headers_response)
-                            yield result
-                        elif phase == "response_headers":
-                            result = ext_api.ProcessingResponse(response_headers=headers_response)
-                            yield result
-                    elif phase.endswith("body"):
-                        body_response = ext_api.BodyResponse(
-                            response=response
-                            if isinstance(response, ext_api.CommonResponse)
-                            else None
-                        )
-                        if phase == "request_body":
-                            result = ext_api.ProcessingResponse(request_body=body_response)
-                            yield result
-                        elif phase == "response_body":
-                            result = ext_api.ProcessingResponse(response_body=body_response)
+        # for each stream invocation, define a new "call" context/"request"
+        # and decide (once) whether to trace it
+        request = RequestContext()
+        request.traced = self.tracer.sample()
+        full_duplex = self._full_duplex
+        first = True
+
+        # admission control: streams over the limit are shed right away,
+        # never queued; failing open, they're passed on unprocessed
+        admitted = self.admission.acquire()
+        shed = (not admitted) and (not self.FAIL_OPEN)
+        if not admitted and self.FAIL_OPEN:
+            self.skip_phases(request, *ExtProcPhase)
+
+        metrics = self.metrics
+        labels = (self.name,)
+        if metrics is not None:
+            started_ns = perf_counter_ns()
+            metrics.in_flight.inc(labels)
+            if not admitted:
+                metrics.shed.inc(labels)
+        messages = 0
+
+        self.in_flight += 1
+        try:
+            with self.tracer.stream_span() if request.traced else NO_SPAN:
+
+                async for req in self.safe_iterator(request_iterator, context, request):
+                    phase = req.WhichOneof("request")
+                    request.phase = phase
+                    messages += 1
+
+                    if shed:
+                        if logger.isEnabledFor(DEBUG):
+                            logger.debug(
+                                "Shedding stream; sending ImmediateResponse",
+                                extra={"processor": self.name, "phase": phase},
+                            )
+                        immediate_response = self.overloaded_response()
+                        if metrics is not None:
+                            status = str(immediate_response.status.code)
+                            metrics.immediate_responses.inc((self.name, status))
+                        yield ext_api.ProcessingResponse(immediate_response=immediate_response)
+                        return
+
+                    # get the (pre-resolved) "action" to apply and how to wrap it
+                    dispatch = self._dispatch.get(phase)
+                    if dispatch is None:
+                        msg = f"{self.name} does not implement a callable for {phase}"
+                        logger.error(msg)
+                        context.abort(StatusCode.UNIMPLEMENTED, msg)
+
+                    # newer envoys say which body modes they use on the first message
+                    if first:
+                        first = False
+                        if req.HasField("protocol_config"):
+                            full_duplex = self.full_duplex_phases(req.protocol_config)
+
+                    # get the request-phase's data
+                    data = getattr(req, phase)
+                    if (metrics is not None) and (phase in _BODY_PHASES):
+                        metrics.body_size.observe(len(data.body), (self.name, phase))
+
+                    if dispatch.standard_headers is not None:
+                        request.update(dispatch.standard_headers(data))
+
+                    # phases nobody handles (for this request) just continue,
+                    # without any of the timing/tracing/logging around handlers
+                    skipped = request.skipped
+                    if (not dispatch.handled) or (skipped and phase in skipped):
+                        if full_duplex and phase in full_duplex:
+                            # envoy doesn't keep full duplex chunks; send them on
+                            yield dispatch.wrap(self.stream_body(data, dispatch.response_factory()))
+                        elif phase == "request_headers" and (
+                            (mode_override := self.get_mode_override(request)) is not None
+                        ):
+                            result = ext_api.ProcessingResponse()
+                            result.CopyFrom(dispatch.skip_response)
+                            result.mode_override.CopyFrom(mode_override)
                             yield result
-                    else:  # endswith("trailers") == True
-                        trailers_response = ext_api.TrailersResponse(
-                            header_mutation=response
-                            if isinstance(response, ext_api.HeaderMutation)
-                            else None
+                        else:
+                            yield dispatch.skip_response
+                        continue
+
+                    # get a response object to pass (convenience)
+                    response = dispatch.response_factory()
+
+                    # NOTE: this only applies if we process response_headers...
+                    # that's an envoy configuration. To always capture this we
+                    # could assert that the response headers ProcessingMode is
+                    # always SEND
+                    # Chain header only applies to response_headers phase
+                    if REVEAL_EXTPROC_CHAIN and (phase == "response_headers"):
+                        # We know response is CommonResponse in this phase
+                        assert isinstance(response, ext_api.CommonResponse)
+                        response = self.add_extprocs_chain_header(data, response)
+
+                    # actually process the phase, wrapped for timing and tracing
+                    try:
+                        response = await self.process_phase(
+                            phase,
+                            data,
+                            context,
+                            request,
+                            response,
+                            dispatch.action,
+                            is_coroutine=dispatch.is_coroutine,
+                            executor=dispatch.executor,
+                            timeout=dispatch.timeout,
                         )
-                        if phase == "request_trailers":
-                            result = ext_api.ProcessingResponse(request_trailers=trailers_response)
-                            yield result
-                        elif phase == "response_trailers":
-                            result = ext_api.ProcessingResponse(response_trailers=trailers_response)
-                            yield result
-
-                except StopRequestProcessing as err:
-                    logger.debug(
-                        "Caught StopRequestProcessing; sending ImmediateResponse",
-                        extra={
-                            "processor": self.name,
-                            "phase": request.get("__phase", "unknown"),
-                            "request": request.get("__id", "unknown"),
-                            "status": err.response.status.code,
-                            "reason": err.reason or "none supplied",
-                        },
-                    )
-                    immediate_response = err.response
-                    result = ext_api.ProcessingResponse(immediate_response=immediate_response)
-                    yield result
+                        if full_duplex and phase in full_duplex:
+                            if not isinstance(response, ext_api.CommonResponse):
+                                response = ext_api.CommonResponse()
+                            response = self.stream_body(data, response)
+                        result = dispatch.wrap(response)
+                        if phase == "request_headers" or (
+                            phase == "response_headers" and request.skipped
+                        ):
+                            mode_override = self.get_mode_override(request)
+                            if mode_override is not None:
+                                result.mode_override.CopyFrom(mode_override)
+                        if self.REPORT_OVERHEAD:
+                            self.add_overhead_metadata(result, request)
+                        yield result
+
+                    except StopRequestProcessing as err:
+                        if logger.isEnabledFor(DEBUG):
+                            logger.debug(
+                                "Caught StopRequestProcessing; sending ImmediateResponse",
+                                extra={
+                                    "processor": self.name,
+                                    "phase": request.phase,
+                                    "request": request.id,
+                                    "status": err.response.status.code,
+                                    "reason": err.reason or "none supplied",
+                                },
+                            )
+                        immediate_response = err.response
+                        if metrics is not None:
+                            status = str(immediate_response.status.code)
+                            metrics.immediate_responses.inc((self.name, status))
+                        result = ext_api.ProcessingResponse(immediate_response=immediate_response)
+                        if self.REPORT_OVERHEAD:
+                            self.add_overhead_metadata(result, request)
+                        yield result
+        finally:
+            self.in_flight -= 1
+            if admitted:
+                self.admission.release()
+            if metrics is not None:
+                metrics.in_flight.dec(labels)
+                metrics.stream_duration.observe((perf_counter_ns() - started_ns) / 1e9, labels)
+                metrics.stream_overhead.observe(request.overhead_ns / 1e9, labels)
+                metrics.stream_messages.observe(messages, labels)
 
     async def safe_iterator(
         self,
         request_iterator: AsyncIterator[ext_api.ProcessingRequest],
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
     ) -> AsyncGenerator[ext_api.ProcessingRequest, None]:
         try:
             async for req in request_iterator:
                 yield req
         except CancelledError:
-            logger.debug(
-                "RPC cancelled by client",
-                extra={
-                    "processor": self.name,
-                    "phase": request.get("__phase", "unknown"),
-                    "request": request.get("__id", "unknown"),
-                },
-            )
+            if self.metrics is not None:
+                self.metrics.cancelled.inc((self.name,))
+            if logger.isEnabledFor(DEBUG):
+                logger.debug(
+                    "RPC cancelled by client",
+                    extra={
+                        "processor": self.name,
+                        "phase": request.phase,
+                        "request": request.id,
+                    },
+                )
             return
 
     async def process_phase(
@@ -254,49 +549,155 @@ class BaseExtProcService(EnvoyExtProcServicer):
         phase: str,
         data: Union[ext_api.HttpHeaders, ext_api.HttpBody, ext_api.HttpTrailers],
         context: ServicerContext,
-        request: Dict,
-        response: Union[ext_api.CommonResponse, ext_api.HeaderMutation],
+        request: RequestContext,
+        response: PhaseResponse,
         action: Callable,
-    ) -> Union[ext_api.CommonResponse, ext_api.HeaderMutation]:
-        # actually process the request phase
-        logger.debug(
-            f"{self.name} started {phase}",
-            extra={
-                "processor": self.name,
-                "phase": request.get("__phase", "unknown"),
-                "request": request.get("__id", "unknown"),
-            },
-        )
+        is_coroutine: Optional[bool] = None,
+        executor: ExecutorSpec = None,
+        timeout: Optional[float] = None,
+    ) -> PhaseResponse:
+        # actually process the request phase; the level is checked once
+        # so nothing is formatted (or allocated) for disabled debug logs
+        debug = logger.isEnabledFor(DEBUG)
+        if debug:
+            logger.debug(
+                "%s started %s",
+                self.name,
+                phase,
+                extra={
+                    "processor": self.name,
+                    "phase": request.phase,
+                    "request": request.id,
+                },
+            )
 
         T = Timer().tic()
 
-        camel_case_phase = "".join([w.title() for w in phase.split("_")])
-        resource_name = f"/{ENVOY_SERVICE_NAME}/Process/{camel_case_phase}"
-        with tracer.trace(f"process.{phase}", resource=resource_name, span_type="grpc"):
-            if iscoroutinefunction(action):
-                response = await action(data, context, request, response)
-            else:
-                response = action(data, context, request, response)
-
-        T.toc()
-        duration = T.duration().ToNanoseconds()
-        request["__overhead_ns"] += duration
+        try:
+            with self.tracer.phase_span(phase) if request.traced else NO_SPAN:
+                if is_coroutine is None:
+                    is_coroutine = iscoroutinefunction(action)
+                # header/body helpers collect changes to the response in a
+                # builder, written into it once the handler is done
+                if timeout is not None:
+                    # what to answer with if the handler doesn't make its deadline
+                    fallback = type(response)()
+                    fallback.CopyFrom(response)
+                timed_out = False
+                token = MutationBuilder.bind(response)
+                try:
+                    if executor is not None:
+                        call = self.pools.run(
+                            executor, action, is_coroutine, data, context, request, response
+                        )
+                    elif is_coroutine:
+                        call = action(data, context, request, response)
+                    else:
+                        # handlers on the loop can't be interrupted; give them an
+                        # executor for deadlines to apply
+                        call = None
+                        response = action(data, context, request, response)
+                    if (call is not None) and (timeout is not None):
+                        timed_out, response = await _within_deadline(call, timeout)
+                    elif call is not None:
+                        response = await call
+                except BaseException:
+                    MutationBuilder.unbind(token, apply=False)
+                    raise
+                if timed_out:
+                    MutationBuilder.unbind(token, apply=False)
+                    response = self.phase_timed_out(phase, request, fallback)
+                else:
+                    MutationBuilder.unbind(token)
+        finally:
+            # handlers that stop processing (or time out) count too
+            duration = T.toc().duration_ns()
+            # the phase's header index isn't needed (or valid) past it
+            HeaderIndex.clear()
+            request.overhead_ns += duration
+            phases = request.phase_overhead_ns
+            if phases is None:
+                phases = request.phase_overhead_ns = {}
+            phases[phase] = phases.get(phase, 0) + duration
+            self.admission.observe(duration)
+            if self.metrics is not None:
+                self.metrics.phase_duration.observe(duration / 1e9, (self.name, phase))
 
         # how to store the data in the headers for chaining?
         # write events to kafka? Automatically impose headers?
 
-        logger.debug(
-            f"{self.name} finished {phase}",
-            extra={
-                "processor": self.name,
-                "phase": request.get("__phase", "unknown"),
-                "request": request.get("__id", "unknown"),
-                "duration_ns": duration,
-            },
-        )
+        if debug:
+            logger.debug(
+                "%s finished %s",
+                self.name,
+                phase,
+                extra={
+                    "processor": self.name,
+                    "phase": request.phase,
+                    "request": request.id,
+                    "duration_ns": duration,
+                },
+            )
+        elif self.log_sampler():
+            logger.info(
+                "%s finished %s in %dns",
+                self.name,
+                phase,
+                duration,
+                extra={
+                    "processor": self.name,
+                    "phase": request.phase,
+                    "request": request.id,
+                    "duration_ns": duration,
+                    "overhead_ns": request.overhead_ns,
+                    "sampled": self.log_sampler.every,
+                },
+            )
 
         return response
 
+    def overhead_metadata(self, request: RequestContext) -> Dict[str, Any]:
+        """
+        a request's overhead so far, in this processor's handlers, by
+        processor name: the total (`overhead_ns`) and by phase
+        (`phase_overhead_ns`)
+        """
+        return {
+            self.name: {
+                "overhead_ns": request.overhead_ns,
+                "phase_overhead_ns": dict(request.phase_overhead_ns or {}),
+            }
+        }
+
+    def add_overhead_metadata(
+        self, result: ext_api.ProcessingResponse, request: RequestContext
+    ) -> ext_api.ProcessingResponse:
+        """report overhead_metadata in a response's dynamic_metadata; later
+        responses replace what earlier ones reported"""
+        result.dynamic_metadata.update({self.METADATA_NAMESPACE: self.overhead_metadata(request)})
+        return result
+
+    def phase_timed_out(
+        self, phase: str, request: RequestContext, response: PhaseResponse
+    ) -> PhaseResponse:
+        """a handler was cancelled at its deadline: count it, and answer with
+        `response` (as it was before the handler) or stop with timeout_response"""
+        self.timed_out[phase] += 1
+        if self.metrics is not None:
+            self.metrics.timeouts.inc((self.name, phase))
+        if logger.isEnabledFor(DEBUG):
+            logger.debug(
+                "%s timed out in %s",
+                self.name,
+                phase,
+                extra={"processor": self.name, "phase": phase, "request": request.id},
+            )
+        if self.TIMEOUT_FAIL_OPEN:
+            return response
+        raise StopRequestProcessing(
+            self.timeout_response(phase), reason=f"{self.name} timed out in {phase}"
+        )
+
     # decorator-based assignment; use as
     #
     #   P = BaseExtProcService(name="MyExtProc")
@@ -306,13 +707,201 @@ class BaseExtProcService(EnvoyExtProcServicer):
     #       ...
     #
 
-    def process(self, phase: ExtProcPhase) -> Callable[[ExtProcHandler], ExtProcHandler]:
+    #   @P.process("request_body", chunks=True)
+    #   async def some_func(chunk, context, request):
+    #       ...
+    #
+    # for a body handler called for each chunk (see process_request_body_chunk),
+    # and
+    #
+    #   @P.process("request_body", executor="thread")
+    #   def some_func(body, context, request):
+    #       ...
+    #
+    # for a handler run off the event loop (see EXECUTORS); timeout_ms gives a
+    # handler its own deadline (see DEFAULT_TIMEOUT_MS)
+
+    def process(
+        self,
+        phase: ExtProcPhase,
+        chunks: bool = False,
+        executor: ExecutorSpec = None,
+        timeout_ms: Optional[float] = None,
+    ) -> Callable[[ExtProcHandler], ExtProcHandler]:
+        _phase = ExtProcPhase(phase).value  # f"{phase}" varies with python version
+        if chunks and (_phase not in _BODY_PHASES):
+            raise ValueError(f"Only body phases can be processed in chunks, not {_phase}")
+        validate_executor(executor)
+        name = f"process_{_phase}_chunk" if chunks else f"process_{_phase}"
+
         def wrapper(func: ExtProcHandler) -> ExtProcHandler:
-            setattr(self, f"process_{phase}", func)
-            return getattr(self, f"process_{phase}")
+            setattr(self, name, func)
+            if executor is not None:
+                self.executors[_phase] = executor
+            if timeout_ms is not None:
+                self.timeouts_ms[_phase] = timeout_ms
+            self._resolve_phase(_phase)
+            self._resolve_mode_override()
+            return getattr(self, name)
 
         return wrapper
 
+    def _resolve_phase(self, phase: str) -> None:
+        """(re)build the dispatch entry for a phase from the current handler"""
+        action = getattr(self, f"process_{phase}", None)
+        default = getattr(BaseExtProcService, f"process_{phase}")
+        if phase in _BODY_PHASES:
+            # chunk handlers, where implemented, take over body phases
+            chunk_action = getattr(self, f"process_{phase}_chunk", None)
+            chunk_default = getattr(BaseExtProcService, f"process_{phase}_chunk")
+            if callable(chunk_action) and (
+                getattr(chunk_action, "__func__", chunk_action) is not chunk_default
+            ):
+                action, default = chunk_action, chunk_default
+        if (action is None) or (not callable(action)):
+            self._dispatch.pop(phase, None)
+            return
+        response_factory, phase_response, phase_response_field = _PHASE_RESPONSES[phase]
+        standard_headers = None
+        if phase == ExtProcPhase.request_headers:
+            standard_headers = self.get_standard_request_headers
+        elif phase == ExtProcPhase.response_headers:
+            standard_headers = self.get_standard_response_headers
+        # a phase is "handled" unless it still uses the no-op defaults
+        # below; the chain header means response headers always are
+        handled = getattr(action, "__func__", action) is not default
+        if REVEAL_EXTPROC_CHAIN and (phase == ExtProcPhase.response_headers):
+            handled = True
+        timeout_ms = self.timeouts_ms.get(phase, self.DEFAULT_TIMEOUT_MS)
+        dispatch = PhaseDispatch(
+            phase=phase,
+            action=action,
+            is_coroutine=iscoroutinefunction(action),
+            response_factory=response_factory,
+            phase_response=phase_response,
+            phase_response_field=phase_response_field,
+            standard_headers=standard_headers,
+            handled=handled,
+            skip_response=ext_api.ProcessingResponse(),
+            executor=self.executors.get(phase),
+            timeout=(timeout_ms / 1000) if timeout_ms else None,
+        )
+        self._dispatch[phase] = dispatch._replace(skip_response=dispatch.wrap(response_factory()))
+
+    def _resolve_mode_override(self) -> None:
+        """compute the mode_override turning off phases no handler uses"""
+        self._mode_override = None
+        unhandled = [
+            phase
+            for phase in ExtProcPhase
+            if (phase != ExtProcPhase.request_headers)
+            and ((phase not in self._dispatch) or (not self._dispatch[phase].handled))
+        ]
+        mode = self.processing_mode_without(self.PROCESSING_MODE, unhandled)
+        if mode != self.PROCESSING_MODE:
+            self._mode_override = mode
+
+    def get_mode_override(self, request: RequestContext) -> Optional[EnvoyProcessingMode]:
+        """the mode_override for a request, including phases it skipped
+        (None when there's nothing to turn off, or MODE_OVERRIDE is off)"""
+        if not self.MODE_OVERRIDE:
+            return None
+        skipped = request.skipped
+        if not skipped:
+            return self._mode_override
+        return self.processing_mode_without(self._mode_override or self.PROCESSING_MODE, skipped)
+
+    @staticmethod
+    def processing_mode_without(
+        mode: EnvoyProcessingMode, phases: Iterable[str]
+    ) -> EnvoyProcessingMode:
+        """a copy of a ProcessingMode with some phases turned off"""
+        result = EnvoyProcessingMode()
+        result.CopyFrom(mode)
+        for phase in phases:
+            field, off = _PHASE_MODES[phase]
+            setattr(result, field, off)
+        return result
+
+    @staticmethod
+    def skip_phases(request: RequestContext, *phases: ExtProcPhase) -> None:
+        """
+        Declare that this request needs no (further) processing in some
+        phases, e.g. from request_headers for paths a processor ignores.
+        Those phases are short-circuited if envoy sends them anyway, and
+        turned off in the mode_override sent with the headers response.
+        Skipping a body phase also drops what accumulate_body (or a
+        body_buffer, or an event stream parser, see util.sse) held on to.
+        """
+        skipped = request.skipped
+        if skipped is None:
+            skipped = request.skipped = set()
+        for phase in phases:
+            _phase = ExtProcPhase(phase).value
+            skipped.add(_phase)
+            if _phase in _BODY_PHASES:
+                request.pop(f"__{_phase}_accumulated", None)  # see accumulate_body
+                request.pop(f"__{_phase}_sse", None)  # see util.sse
+                buffer = request.pop(f"__{_phase}_buffer", None)  # see body.body_buffer
+                if buffer is not None:
+                    buffer.close()
+
+    @staticmethod
+    def full_duplex_phases(
+        mode: Union[EnvoyProcessingMode, ext_api.ProtocolConfiguration]
+    ) -> FrozenSet[str]:
+        """the body phases a ProcessingMode (or ProtocolConfiguration) streams
+        in FULL_DUPLEX_STREAMED mode"""
+        return frozenset(
+            phase
+            for phase, field in _BODY_PHASES.items()
+            if getattr(mode, field) == EnvoyProcessingMode.FULL_DUPLEX_STREAMED
+        )
+
+    @staticmethod
+    def stream_body(
+        body: ext_api.HttpBody, response: ext_api.CommonResponse
+    ) -> ext_api.CommonResponse:
+        """
+        Turn a body response into the streamed_response FULL_DUPLEX_STREAMED
+        mode needs: envoy doesn't keep chunks it sends in that mode, so each
+        response carries the chunk to send on, i.e. any body (or clear_body)
+        mutation a handler made or else the chunk itself.
+        """
+        mutation = response.body_mutation
+        kind = mutation.WhichOneof("mutation")
+        if kind == "streamed_response":
+            return response
+        chunk = body.body
+        if kind == "body":
+            chunk = mutation.body
+        elif kind == "clear_body":
+            chunk = b""
+        mutation.streamed_response.body = chunk
+        mutation.streamed_response.end_of_stream = body.end_of_stream
+        return response
+
+    @staticmethod
+    def accumulate_body(request: RequestContext, body: ext_api.HttpBody) -> bytearray:
+        """
+        Collect the chunks of a streamed body (of the current phase) in the
+        request context, returning the body so far, this chunk included.
+        After the last chunk (`end_of_stream`) the context lets go of it.
+        Handlers that only need a prefix can skip the rest of the body
+        once they have it, with skip_phases.
+        """
+        key = f"__{request.phase}_accumulated"
+        accumulated = request.get(key)
+        if accumulated is None:
+            accumulated = bytearray(body.body)
+            if not body.end_of_stream:
+                request[key] = accumulated
+            return accumulated
+        accumulated += body.body
+        if body.end_of_stream:
+            del request[key]
+        return accumulated  # type: ignore[no-any-return]
+
     # Phase-specific methods are below. When using subclasses
     # define these to specialize filter behavior. Note these
     # aren't "NotImplemented", but rather no-ops.
@@ -321,7 +910,7 @@ class BaseExtProcService(EnvoyExtProcServicer):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         return response
@@ -330,16 +919,31 @@ class BaseExtProcService(EnvoyExtProcServicer):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         return response
 
+    async def process_request_body_chunk(
+        self,
+        chunk: ext_api.HttpBody,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        """
+        Called (instead of process_request_body) for each request body
+        message, when implemented. With STREAMED or FULL_DUPLEX_STREAMED
+        body modes those are chunks of the body, the last one marked
+        `end_of_stream` (see also accumulate_body).
+        """
+        return response
+
     async def process_request_trailers(
         self,
         trailers: ext_api.HttpTrailers,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.TrailersResponse,
     ) -> ext_api.TrailersResponse:
         return response
@@ -348,7 +952,7 @@ class BaseExtProcService(EnvoyExtProcServicer):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         return response
@@ -357,16 +961,26 @@ class BaseExtProcService(EnvoyExtProcServicer):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        return response
+
+    async def process_response_body_chunk(
+        self,
+        chunk: ext_api.HttpBody,
+        context: ServicerContext,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
+        """the response body counterpart of process_request_body_chunk"""
         return response
 
     async def process_response_trailers(
         self,
         trailers: ext_api.HttpTrailers,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.TrailersResponse,
     ) -> ext_api.TrailersResponse:
         return response
@@ -401,12 +1015,12 @@ class BaseExtProcService(EnvoyExtProcServicer):
     def form_immediate_response(
         status: EnvoyHttpStatusCode,
         headers: Dict[str, str],
-        body: Optional[str] = None,
+        body: Optional[Union[str, bytes]] = None,
     ) -> ext_api.ImmediateResponse:
         status_code = EnvoyHttpStatus(code=status)
-        response = ext_api.ImmediateResponse(
-            status=status_code, body=body.encode("utf-8") if body is not None else None
-        )
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        response = ext_api.ImmediateResponse(status=status_code, body=body)
         response.headers.set_headers.extend(
             [
                 EnvoyHeaderValueOption(header=EnvoyHeaderValue(key=key, value=value))
@@ -415,6 +1029,22 @@ class BaseExtProcService(EnvoyExtProcServicer):
         )
         return response
 
+    def overloaded_response(self) -> ext_api.ImmediateResponse:
+        """the response to streams shed by admission control (unless FAIL_OPEN)"""
+        return self.form_immediate_response(
+            EnvoyHttpStatusCode.ServiceUnavailable,
+            {"content-type": "text/plain"},
+            f"{self.name} is overloaded",
+        )
+
+    def timeout_response(self, phase: str) -> ext_api.ImmediateResponse:
+        """the response when a handler times out (unless TIMEOUT_FAIL_OPEN)"""
+        return self.form_immediate_response(
+            EnvoyHttpStatusCode.GatewayTimeout,
+            {"content-type": "text/plain"},
+            f"{self.name} timed out",
+        )
+
     def get_request_headers_response(self) -> ext_api.HeadersResponse:
         return self.just_continue_headers()
 
@@ -441,11 +1071,14 @@ class BaseExtProcService(EnvoyExtProcServicer):
         headers: ext_api.HttpHeaders, name: str, lower_cased: bool = False
     ) -> Optional[str]:
         """get a header value by name (envoy uses lower cased names)"""
-        _name = name if lower_cased else name.lower()
-        for header in headers.headers.headers:
-            if header.key == _name:
-                return header.value
-        return None
+        return HeaderIndex.of(headers).get(name, lower_cased=lower_cased)
+
+    @staticmethod
+    def get_header_values(
+        headers: ext_api.HttpHeaders, name: str, lower_cased: bool = False
+    ) -> List[str]:
+        """get all values of a (possibly repeated) header by name"""
+        return HeaderIndex.of(headers).get_all(name, lower_cased=lower_cased)
 
     @staticmethod
     def get_headers(
@@ -458,21 +1091,19 @@ class BaseExtProcService(EnvoyExtProcServicer):
         if isinstance(names, list):  # enforce dictionary input
             return BaseExtProcService.get_headers(headers, dict(names), lower_cased=lower_cased)
 
-        if not lower_cased:  # enforce lower-cased keys
-            keys = {k.lower(): v for k, v in names.items()}
-            return BaseExtProcService.get_headers(headers, keys, lower_cased=True)
-
-        results: Dict[str, Optional[str]] = {name: None for _, name in names.items()}
-        for header in headers.headers.headers:
-            if header.key in names:
-                results[names[header.key]] = header.value  # store value at mapped name
-        return results
+        index = HeaderIndex.of(headers)
+        # store values at mapped names
+        return {name: index.get(key, lower_cased=lower_cased) for key, name in names.items()}
 
     @staticmethod
     def add_header(
         response: ext_api.CommonResponse, key: str, value: str
     ) -> ext_api.CommonResponse:
-        """add a header to a CommonResponse"""
+        """add (set) a header in a CommonResponse"""
+        builder = MutationBuilder.of(response)
+        if builder is not None:
+            builder.set_header(key, value)
+            return response
         header = EnvoyHeaderValue(key=key, value=value)
         response.header_mutation.set_headers.append(EnvoyHeaderValueOption(header=header))
         return response
@@ -485,6 +1116,11 @@ class BaseExtProcService(EnvoyExtProcServicer):
         """add a set of headers to a CommonResponse"""
         if isinstance(headers, dict):
             return BaseExtProcService.add_headers(response, [(k, v) for k, v in headers.items()])
+        builder = MutationBuilder.of(response)
+        if builder is not None:
+            for key, value in headers:
+                builder.set_header(key, value)
+            return response
         response.header_mutation.set_headers.extend(
             [
                 EnvoyHeaderValueOption(header=EnvoyHeaderValue(key=key, value=value))
@@ -493,9 +1129,27 @@ class BaseExtProcService(EnvoyExtProcServicer):
         )
         return response
 
+    @staticmethod
+    def append_header(
+        response: ext_api.CommonResponse, key: str, value: str
+    ) -> ext_api.CommonResponse:
+        """add a value to a header in a CommonResponse, keeping existing values"""
+        builder = MutationBuilder.of(response)
+        if builder is not None:
+            builder.append_header(key, value)
+            return response
+        header = EnvoyHeaderValueOption(header=EnvoyHeaderValue(key=key, value=value))
+        header.append.value = True
+        response.header_mutation.set_headers.append(header)
+        return response
+
     @staticmethod
     def remove_header(response: ext_api.CommonResponse, name: str) -> ext_api.CommonResponse:
         """remove a header from a CommonResponse"""
+        builder = MutationBuilder.of(response)
+        if builder is not None:
+            builder.remove_header(name)
+            return response
         response.header_mutation.remove_headers.append(name)
         return response
 
@@ -504,9 +1158,34 @@ class BaseExtProcService(EnvoyExtProcServicer):
         response: ext_api.CommonResponse, names: List[str]
     ) -> ext_api.CommonResponse:
         """remove a header from a CommonResponse"""
+        builder = MutationBuilder.of(response)
+        if builder is not None:
+            for name in names:
+                builder.remove_header(name)
+            return response
         response.header_mutation.remove_headers.extend(names)
         return response
 
+    @staticmethod
+    def set_body(response: ext_api.CommonResponse, body: bytes) -> ext_api.CommonResponse:
+        """replace the body with a CommonResponse"""
+        builder = MutationBuilder.of(response)
+        if builder is not None:
+            builder.set_body(body)
+            return response
+        response.body_mutation.body = body
+        return response
+
+    @staticmethod
+    def clear_body(response: ext_api.CommonResponse) -> ext_api.CommonResponse:
+        """clear the body with a CommonResponse"""
+        builder = MutationBuilder.of(response)
+        if builder is not None:
+            builder.clear_body()
+            return response
+        response.body_mutation.clear_body = True
+        return response
+
     @staticmethod
     def get_standard_request_headers(
         headers: ext_api.HttpHeaders,
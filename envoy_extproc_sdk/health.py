@@ -1,7 +1,7 @@
-from typing import List, Optional
+import asyncio
+from logging import getLogger
+from typing import Any, AsyncIterator, List, Optional, Set, Tuple
 
-from ddtrace import Span
-from ddtrace.filters import TraceFilter
 from grpc import ServicerContext
 from grpc_health_check.v1.health_pb2 import (
     HealthCheckRequest,
@@ -12,29 +12,180 @@ from grpc_health_check.v1.health_pb2_grpc import (  # noqa: F401
     HealthServicer,
 )
 
+from .settings import (
+    HEALTH_INTERVAL_MS,
+    HEALTH_MAX_IN_FLIGHT,
+    HEALTH_MAX_LOOP_LAG_MS,
+    HEALTH_MAX_QUEUED,
+    HEALTH_RECOVER_CHECKS,
+    HEALTH_RECOVER_RATIO,
+)
+
+logger = getLogger(__name__)
+
+SERVING = HealthCheckResponse.ServingStatus.SERVING
+NOT_SERVING = HealthCheckResponse.ServingStatus.NOT_SERVING
+
 grpc_health_path_base = "grpc.health"  # allow extension to future versions
 grpc_health_path_v1 = f"{grpc_health_path_base}.v1.Health"
 
 
-class FilterOutHealthChecks(TraceFilter):
-    def exclude(self, span: Span):
-        """
-        return True if span_type == grpc and resource starts with /{grpc_health_path_base}
-        """
-        return (span.span_type == "grpc") and span.resource.startswith(f"/{grpc_health_path_base}")
-
-    def include(self, span: Span):
-        return not self.exclude(span)
+def __getattr__(name: str) -> Any:
+    # FilterOutHealthChecks lives with ddtrace, which only tracing imports
+    if name == "FilterOutHealthChecks":
+        from .tracefilter import FilterOutHealthChecks
 
-    def process_trace(self, trace: List[Span]) -> Optional[List[Span]]:
-        for span in trace:
-            if self.exclude(span):
-                return None
-        return trace
+        return FilterOutHealthChecks
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class HealthService(HealthServicer):
+    """
+    gRPC health checks for the server (whatever service is asked for):
+    SERVING, unless `set_status` says otherwise (LoadMonitor does, when
+    the server is overloaded, and serve does at shutdown). Watch streams
+    the status, and every change to it.
+    """
+
+    def __init__(self) -> None:
+        self.status = SERVING
+        self._watchers: Set[asyncio.Queue] = set()
+
+    def set_status(self, status: int) -> None:
+        """change the status reported, notifying watchers"""
+        if status == self.status:
+            return
+        self.status = status
+        for queue in self._watchers:
+            queue.put_nowait(status)
+
     async def Check(
         self, request: HealthCheckRequest, context: ServicerContext
     ) -> HealthCheckResponse:
-        return HealthCheckResponse(status=HealthCheckResponse.ServingStatus.SERVING)
+        return HealthCheckResponse(status=self.status)
+
+    async def Watch(
+        self, request: HealthCheckRequest, context: ServicerContext
+    ) -> AsyncIterator[HealthCheckResponse]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._watchers.add(queue)
+        try:
+            status = self.status
+            yield HealthCheckResponse(status=status)
+            while True:
+                changed = await queue.get()
+                if changed != status:
+                    status = changed
+                    yield HealthCheckResponse(status=status)
+        finally:
+            self._watchers.discard(queue)
+
+
+class LoadMonitor:
+    """
+    Samples, every `interval_ms`, how far behind the event loop is (how
+    much later than asked for a sleep wakes up), the streams a service is
+    processing and the handlers queued for its executors, and reports the
+    server NOT_SERVING through `health` while any is over its maximum
+    (None turns a check off), so envoy's active health checks (or outlier
+    detection) move traffic elsewhere before requests start to time out.
+
+    Back to SERVING takes every reading under `recover_ratio` of its
+    maximum for `recover_checks` samples in a row, so a server near its
+    limits doesn't flap between the two.
+    """
+
+    def __init__(
+        self,
+        service: Any,
+        health: Optional[HealthService] = None,
+        interval_ms: int = HEALTH_INTERVAL_MS,
+        max_loop_lag_ms: Optional[int] = HEALTH_MAX_LOOP_LAG_MS,
+        max_in_flight: Optional[int] = HEALTH_MAX_IN_FLIGHT,
+        max_queued: Optional[int] = HEALTH_MAX_QUEUED,
+        recover_ratio: float = HEALTH_RECOVER_RATIO,
+        recover_checks: int = HEALTH_RECOVER_CHECKS,
+    ) -> None:
+        if not 0 <= recover_ratio <= 1:
+            raise ValueError(f"recover_ratio has to be between 0 and 1, not {recover_ratio}")
+        self.service = service
+        self.health = health
+        self.interval_ms = interval_ms
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.recover_ratio = recover_ratio
+        self.recover_checks = recover_checks
+        # the latest readings
+        self.loop_lag_ms = 0.0
+        self.in_flight = 0
+        self.queued = 0
+        self.overloaded = False
+        self._calm = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def readings(self) -> List[Tuple[str, float, Optional[float]]]:
+        """(name, reading, maximum) for each check"""
+        return [
+            ("loop_lag_ms", self.loop_lag_ms, self.max_loop_lag_ms),
+            ("in_flight", self.in_flight, self.max_in_flight),
+            ("queued", self.queued, self.max_queued),
+        ]
+
+    def _over(self, ratio: float) -> List[str]:
+        return [
+            f"{name}={reading:g}"
+            for name, reading, maximum in self.readings()
+            if (maximum is not None) and (reading > maximum * ratio)
+        ]
+
+    def sample(self, loop_lag_ms: float) -> bool:
+        """take a reading (with the lag measured); returns whether overloaded"""
+        self.loop_lag_ms = loop_lag_ms
+        self.in_flight = getattr(self.service, "in_flight", 0)
+        queued_handlers = getattr(self.service, "queued_handlers", None)
+        self.queued = queued_handlers() if queued_handlers is not None else 0
+
+        if not self.overloaded:
+            over = self._over(1.0)
+            if over:
+                self.overloaded = True
+                self._calm = 0
+                logger.warning(f"Overloaded ({', '.join(over)}), reporting NOT_SERVING")
+                if self.health is not None:
+                    self.health.set_status(NOT_SERVING)
+        elif self._over(self.recover_ratio):
+            self._calm = 0
+        else:
+            self._calm += 1
+            if self._calm >= self.recover_checks:
+                self.overloaded = False
+                logger.warning("Recovered from overload, reporting SERVING")
+                if self.health is not None:
+                    self.health.set_status(SERVING)
+        return self.overloaded
+
+    async def run(self) -> None:
+        """sample until cancelled"""
+        loop = asyncio.get_running_loop()
+        interval = self.interval_ms / 1000
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.sample(max(0.0, loop.time() - start - interval) * 1000)
+
+    def start(self) -> "asyncio.Task[None]":
+        """sample in the background (on the running loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        """stop sampling"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,313 @@
+import asyncio
+from bisect import bisect_left
+from logging import getLogger
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+logger = getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+# seconds, from handlers doing next to nothing to ones far past envoy's timeout
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+# bytes, 64B to 16MiB
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A metric, with a value per combination of label values. Metrics are
+    updated from the event loop's thread only, so they do without locks:
+    an update is a dict lookup and some arithmetic.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.name!r})"
+
+    def _labels(self, labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+        if extra is not None:
+            pairs.append(f'{extra[0]}="{extra[1]}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        """the metric's sample lines, in the prometheus text format"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    """a count that only goes up"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{self._labels(labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """a value that goes up and down"""
+
+    kind = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    """
+    Observations counted in fixed buckets (upper bounds, ascending), plus
+    their sum: an observation costs a bisect and two additions.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        if list(buckets) != sorted(set(buckets)):
+            raise ValueError(f"Histogram buckets have to be ascending, not {buckets}")
+        self.buckets = tuple(buckets)
+        # counts per bucket (the last for over the largest bound), and sums
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def samples(self) -> Iterator[str]:
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, counts in self.counts.items():
+            total = 0
+            for bound, count in zip(bounds, counts):
+                total += count
+                yield f"{self.name}_bucket{self._labels(labels, ('le', bound))} {total}"
+            yield f"{self.name}_sum{self._labels(labels)} {_format_value(self.sums[labels])}"
+            yield f"{self.name}_count{self._labels(labels)} {total}"
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class MetricsRegistry:
+    """metrics to expose together"""
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self.metrics:
+            raise ValueError(f"A metric named {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """all metrics in the prometheus text format"""
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class ExtProcMetrics:
+    """
+    The metrics services record (see BaseExtProcService), by processor:
+    handler latency by phase, stream durations, handler time per stream,
+    messages per stream, body sizes by phase, streams in flight, and
+    immediate responses (by status), cancelled and shed streams and
+    handler timeouts.
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None) -> None:
+        self.registry = registry or MetricsRegistry()
+        register = self.registry.register
+        self.phase_duration = register(
+            Histogram(
+                "extproc_phase_duration_seconds",
+                "Time phase handlers take",
+                ("processor", "phase"),
+            )
+        )
+        self.stream_duration = register(
+            Histogram(
+                "extproc_stream_duration_seconds",
+                "Time from the start to the end of Process streams",
+                ("processor",),
+            )
+        )
+        self.stream_overhead = register(
+            Histogram(
+                "extproc_stream_overhead_seconds",
+                "Time spent in phase handlers per stream",
+                ("processor",),
+            )
+        )
+        self.stream_messages = register(
+            Histogram(
+                "extproc_stream_messages",
+                "Messages received per stream",
+                ("processor",),
+                buckets=COUNT_BUCKETS,
+            )
+        )
+        self.body_size = register(
+            Histogram(
+                "extproc_body_bytes",
+                "Sizes of body messages (whole bodies, or chunks when streamed)",
+                ("processor", "phase"),
+                buckets=SIZE_BUCKETS,
+            )
+        )
+        self.in_flight = register(
+            Gauge("extproc_streams_in_flight", "Streams being processed", ("processor",))
+        )
+        self.immediate_responses = register(
+            Counter(
+                "extproc_immediate_responses_total",
+                "Immediate responses sent, by HTTP status",
+                ("processor", "status"),
+            )
+        )
+        self.cancelled = register(
+            Counter(
+                "extproc_cancelled_streams_total",
+                "Streams cancelled by the client (envoy)",
+                ("processor",),
+            )
+        )
+        self.shed = register(
+            Counter(
+                "extproc_shed_streams_total",
+                "Streams rejected by admission control",
+                ("processor",),
+            )
+        )
+        self.timeouts = register(
+            Counter(
+                "extproc_phase_timeouts_total",
+                "Phase handlers cancelled at their deadline",
+                ("processor", "phase"),
+            )
+        )
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+# the metrics services record by default
+EXTPROC_METRICS = ExtProcMetrics()
+
+
+async def _handle_scrape(
+    registry: MetricsRegistry, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass  # headers
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] in (b"GET", b"HEAD") and parts[1] == b"/metrics":
+            status, content_type = "200 OK", CONTENT_TYPE
+            body = registry.render().encode("utf-8")
+            if parts[0] == b"HEAD":
+                length, body = len(body), b""
+            else:
+                length = len(body)
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            length = len(body)
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {length}\r\nConnection: close\r\n\r\n"
+            ).encode("ascii")
+            + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(
+    port: int,
+    registry: Optional[MetricsRegistry] = None,
+    host: Optional[str] = None,
+) -> asyncio.Server:
+    """
+    Serve `registry`'s metrics (by default the services') at
+    http://host:port/metrics, on the running event loop. A scrape renders
+    the metrics on the loop, so nothing else has to be synchronized.
+    """
+    registry = registry or EXTPROC_METRICS.registry
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await _handle_scrape(registry, reader, writer)  # type: ignore[arg-type]
+
+    server = await asyncio.start_server(handle, host=host, port=port)
+    logger.info(f"Serving metrics at :{port}/metrics")
+    return server
@@ -1,63 +1,394 @@
-from asyncio import get_event_loop
+import asyncio
+from dataclasses import dataclass
+from importlib import import_module
 from logging import getLogger
+import os
+import signal
+import socket
+import stat
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
 
+from grpc import Compression
 from grpc.aio import Server
 from grpc.aio import server as grpc_aio_server
 
 from .extproc import BaseExtProcService
-from .health import add_HealthServicer_to_server, HealthService
-from .settings import GRPC_PORT, SHUTDOWN_GRACE_PERIOD
+from .health import (
+    add_HealthServicer_to_server,
+    HealthService,
+    LoadMonitor,
+    NOT_SERVING,
+)
+from .metrics import start_metrics_server
+from .settings import (
+    EVENT_LOOP,
+    GRPC_COMPRESSION,
+    GRPC_HTTP2_BDP_PROBE,
+    GRPC_HTTP2_WINDOW_SIZE,
+    GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS,
+    GRPC_KEEPALIVE_TIME_MS,
+    GRPC_KEEPALIVE_TIMEOUT_MS,
+    GRPC_MAX_CONCURRENT_RPCS,
+    GRPC_MAX_CONCURRENT_STREAMS,
+    GRPC_MAX_RECEIVE_MESSAGE_LENGTH,
+    GRPC_MAX_SEND_MESSAGE_LENGTH,
+    GRPC_MIN_PING_INTERVAL_MS,
+    GRPC_PORT,
+    GRPC_UDS,
+    METRICS_PORT,
+    SHUTDOWN_GRACE_PERIOD,
+    WORKERS,
+)
 from .util.envoy import (
     add_ExternalProcessorServicer_to_server,
     EnvoyExtProcServicer,
 )
+from .workers import worker_index, WorkerSupervisor
 
 logger = getLogger(__name__)
 
-# Coroutines to be invoked when the event loop is shutting down.
-_cleanup = []
+LoopFactory = Callable[[], asyncio.AbstractEventLoop]
+
+# lets several worker processes bind the same port (see serve)
+REUSE_PORT_OPTIONS: Sequence[Tuple[str, Any]] = (("grpc.so_reuseport", 1),)
+
+COMPRESSION = {
+    "none": Compression.NoCompression,
+    "gzip": Compression.Gzip,
+    "deflate": Compression.Deflate,
+}
+
+
+@dataclass
+class GrpcServerOptions:
+    """
+    gRPC server tuning, defaulting to the GRPC_* settings. `None` leaves
+    gRPC's own default in place.
+
+    * `maximum_concurrent_rpcs` caps streams across the server; further
+      streams are rejected with RESOURCE_EXHAUSTED, a backstop against
+      overload
+    * `max_concurrent_streams` caps streams per HTTP/2 connection (envoy
+      multiplexes many streams over few connections)
+    * `max_receive_message_length`/`max_send_message_length` bound single
+      messages, which matters for BUFFERED bodies
+    * `keepalive_*` and `min_ping_interval_ms` set the ping policy; the
+      latter has to allow envoy's own keepalive interval, or connections
+      are closed with "too_many_pings"
+    * `http2_window_size` sets the per-stream flow control window, and
+      `http2_bdp_probe` whether gRPC grows windows dynamically
+    * `compression` is the default compression for responses
+    """
+
+    maximum_concurrent_rpcs: Optional[int] = GRPC_MAX_CONCURRENT_RPCS
+    max_concurrent_streams: Optional[int] = GRPC_MAX_CONCURRENT_STREAMS
+    max_receive_message_length: Optional[int] = GRPC_MAX_RECEIVE_MESSAGE_LENGTH
+    max_send_message_length: Optional[int] = GRPC_MAX_SEND_MESSAGE_LENGTH
+    keepalive_time_ms: Optional[int] = GRPC_KEEPALIVE_TIME_MS
+    keepalive_timeout_ms: Optional[int] = GRPC_KEEPALIVE_TIMEOUT_MS
+    keepalive_permit_without_calls: bool = GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS
+    min_ping_interval_ms: Optional[int] = GRPC_MIN_PING_INTERVAL_MS
+    http2_window_size: Optional[int] = GRPC_HTTP2_WINDOW_SIZE
+    http2_bdp_probe: bool = GRPC_HTTP2_BDP_PROBE
+    compression: str = GRPC_COMPRESSION
+
+    def __post_init__(self) -> None:
+        if self.compression not in COMPRESSION:
+            raise ValueError(
+                f"Unknown compression {self.compression!r}, use one of {', '.join(COMPRESSION)}"
+            )
+
+    def channel_options(self) -> List[Tuple[str, Any]]:
+        """these options as gRPC channel arguments"""
+        options: List[Tuple[str, Any]] = []
+        for key, value in (
+            ("grpc.max_concurrent_streams", self.max_concurrent_streams),
+            ("grpc.max_receive_message_length", self.max_receive_message_length),
+            ("grpc.max_send_message_length", self.max_send_message_length),
+            ("grpc.keepalive_time_ms", self.keepalive_time_ms),
+            ("grpc.keepalive_timeout_ms", self.keepalive_timeout_ms),
+            ("grpc.http2.min_recv_ping_interval_without_data_ms", self.min_ping_interval_ms),
+            ("grpc.http2.lookahead_bytes", self.http2_window_size),
+        ):
+            if value is not None:
+                options.append((key, value))
+        if self.keepalive_permit_without_calls:
+            options.append(("grpc.keepalive_permit_without_calls", 1))
+        if not self.http2_bdp_probe:
+            options.append(("grpc.http2.bdp_probe", 0))
+        return options
+
+    def compression_algorithm(self) -> Compression:
+        return COMPRESSION[self.compression]
+
+
+def _uvloop_factory() -> LoopFactory:
+    return import_module("uvloop").new_event_loop  # type: ignore[no-any-return]
+
+
+def _auto_loop_factory() -> LoopFactory:
+    try:
+        return _uvloop_factory()
+    except ImportError:
+        return asyncio.new_event_loop
+
+
+# event loop implementations by name; "auto" is uvloop when it's installed
+EVENT_LOOPS = {
+    "auto": _auto_loop_factory,
+    "asyncio": lambda: asyncio.new_event_loop,
+    "uvloop": _uvloop_factory,
+}
+
+
+def event_loop_factory(loop: Union[str, LoopFactory] = EVENT_LOOP) -> LoopFactory:
+    """
+    A function creating event loops from a name in EVENT_LOOPS, or the
+    given function itself. Asking for "uvloop" when it isn't installed
+    raises ImportError; "auto" falls back to asyncio's own loop.
+    """
+    if callable(loop):
+        return loop
+    if loop not in EVENT_LOOPS:
+        raise ValueError(f"Unknown event loop {loop!r}, use one of {', '.join(EVENT_LOOPS)}")
+    return EVENT_LOOPS[loop]()
+
+
+def uds_address(uds: str) -> str:
+    """
+    gRPC address for a unix domain socket given as a path (optionally
+    prefixed with "unix:") or an abstract socket name (prefixed with "@"
+    or "unix-abstract:").
+    """
+    abstract = False
+    if uds.startswith("unix-abstract:"):
+        name, abstract = uds[len("unix-abstract:") :], True
+    elif uds.startswith("@"):
+        name, abstract = uds[1:], True
+    elif uds.startswith("unix://"):
+        name = uds[len("unix://") :]
+    elif uds.startswith("unix:"):
+        name = uds[len("unix:") :]
+    else:
+        name = uds
+    return f"unix-abstract:{name}" if abstract else f"unix:{name}"
+
+
+def _remove_stale_socket(address: str) -> None:
+    """
+    remove a socket file left behind by a previous run, so bind works: one
+    nothing accepts connections on (a server still listening there raises
+    ValueError instead)
+    """
+    if not address.startswith("unix:"):
+        return
+    path = address[len("unix:") :]
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+    except FileNotFoundError:
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return
+    finally:
+        probe.close()
+    raise ValueError(f"Unix domain socket {path} is in use")
 
 
 def create_server(
     service: EnvoyExtProcServicer = BaseExtProcService(),
     port: int = GRPC_PORT,
+    options: Optional[Sequence[Tuple[str, Any]]] = None,
+    uds: Optional[str] = GRPC_UDS,
+    server_options: Optional[GrpcServerOptions] = None,
+    health: Optional[HealthService] = None,
 ) -> Server:
-    server = grpc_aio_server()
+    """
+    Create a server for the service listening on a TCP `port` and/or a
+    unix domain socket `uds` (see uds_address). A sidecar envoy in the
+    same pod can use the socket and skip the loopback TCP stack. Use a
+    port of 0 (or less) to listen only on the socket.
+
+    The server is tuned with `server_options` (by default from settings);
+    raw channel `options` are added after those. gRPC health checks are
+    answered by `health` (a new HealthService by default).
+    """
+    server_options = server_options or GrpcServerOptions()
+    server = grpc_aio_server(
+        options=server_options.channel_options() + list(options or ()),
+        maximum_concurrent_rpcs=server_options.maximum_concurrent_rpcs,
+        compression=server_options.compression_algorithm(),
+    )
     add_ExternalProcessorServicer_to_server(service, server)
-    add_HealthServicer_to_server(HealthService, server)
-    server.add_insecure_port(f"[::]:{port}")
+    add_HealthServicer_to_server(health or HealthService(), server)
+    for address in listen_addresses(port=port, uds=uds):
+        _remove_stale_socket(address)
+        server.add_insecure_port(address)
     return server
 
 
+def listen_addresses(port: int = GRPC_PORT, uds: Optional[str] = GRPC_UDS) -> List[str]:
+    """the addresses a server with this port and socket listens on"""
+    addresses = []
+    if port > 0:
+        addresses.append(f"[::]:{port}")
+    if uds:
+        addresses.append(uds_address(uds))
+    if not addresses:
+        raise ValueError("Need a port or a unix domain socket to listen on")
+    return addresses
+
+
 async def _serve(
     service: EnvoyExtProcServicer = BaseExtProcService(),
     port: int = GRPC_PORT,
     grace_period: int = SHUTDOWN_GRACE_PERIOD,
+    options: Optional[Sequence[Tuple[str, Any]]] = None,
+    uds: Optional[str] = GRPC_UDS,
+    server_options: Optional[GrpcServerOptions] = None,
+    metrics_port: int = METRICS_PORT,
 ) -> None:
-    server = create_server(service=service, port=port)
-    logger.info(f'Starting Envoy ExternalProcessor "{service}" at {port}')
+    health = HealthService()
+    server = create_server(
+        service=service,
+        port=port,
+        options=options,
+        uds=uds,
+        server_options=server_options,
+        health=health,
+    )
+    monitor = LoadMonitor(service, health)
+    addresses = ", ".join(listen_addresses(port=port, uds=uds))
+    logger.info(f'Starting Envoy ExternalProcessor "{service}" at {addresses}')
     await server.start()
-
-    async def server_graceful_shutdown():
+    monitor.start()
+    metrics_server = None
+    if metrics_port > 0:
+        metrics_server = await start_metrics_server(metrics_port + (worker_index() or 0))
+    try:
+        await server.wait_for_termination()
+    finally:
+        # on cancellation (shutdown): during the grace period, the server
+        # won't accept new connections and lets existing RPCs finish; health
+        # checks say so, in case envoy is still connected
         logger.info("Starting graceful shutdown...")
-        # Shuts down the server with 0 seconds of grace period. During the
-        # grace period, the server won't accept new connections and allow
-        # existing RPCs to continue within the grace period.
+        health.set_status(NOT_SERVING)
+        await monitor.stop()
         await server.stop(grace_period)
+        if metrics_server is not None:
+            metrics_server.close()
+        if isinstance(service, BaseExtProcService):
+            service.shutdown(wait=False)
 
-    _cleanup.append(server_graceful_shutdown())
-    await server.wait_for_termination()
 
+def _cancel_remaining(loop: asyncio.AbstractEventLoop) -> None:
+    """cancel and await tasks still pending on the loop (as asyncio.run does)"""
+    tasks = asyncio.all_tasks(loop)
+    if not tasks:
+        return
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
 
-def serve(
+
+def _run(
     service: EnvoyExtProcServicer = BaseExtProcService(),
     port: int = GRPC_PORT,
     grace_period: int = SHUTDOWN_GRACE_PERIOD,
+    options: Optional[Sequence[Tuple[str, Any]]] = None,
+    uds: Optional[str] = GRPC_UDS,
+    server_options: Optional[GrpcServerOptions] = None,
+    loop: Union[str, LoopFactory] = EVENT_LOOP,
 ) -> None:
-    loop = get_event_loop()
+    """
+    Serve on a new event loop until SIGINT/SIGTERM, then shut down
+    gracefully. This is asyncio.run, except for the choice of loop
+    (asyncio.Runner's loop_factory is 3.11+) and signal handling.
+    """
+    event_loop = event_loop_factory(loop)()
+    loop_type = type(event_loop)
+    logger.info(f"Using event loop {loop_type.__module__}.{loop_type.__qualname__}")
+    asyncio.set_event_loop(event_loop)
     try:
-        runc = _serve(service=service, port=port, grace_period=grace_period)
-        loop.run_until_complete(runc)
+        main = event_loop.create_task(
+            _serve(
+                service=service,
+                port=port,
+                grace_period=grace_period,
+                options=options,
+                uds=uds,
+                server_options=server_options,
+            )
+        )
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                event_loop.add_signal_handler(signum, main.cancel)
+            except (NotImplementedError, RuntimeError):  # pragma: no cover
+                pass  # not the main thread, or no signal support (windows)
+        try:
+            event_loop.run_until_complete(main)
+        except asyncio.CancelledError:
+            pass
     finally:
-        loop.run_until_complete(*_cleanup)
-        loop.close()
+        try:
+            _cancel_remaining(event_loop)
+            event_loop.run_until_complete(event_loop.shutdown_asyncgens())
+            event_loop.run_until_complete(event_loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            event_loop.close()
+
+
+def serve(
+    service: EnvoyExtProcServicer = BaseExtProcService(),
+    port: int = GRPC_PORT,
+    grace_period: int = SHUTDOWN_GRACE_PERIOD,
+    workers: int = WORKERS,
+    uds: Optional[str] = GRPC_UDS,
+    server_options: Optional[GrpcServerOptions] = None,
+    loop: Union[str, LoopFactory] = EVENT_LOOP,
+) -> None:
+    """
+    Run the service until interrupted. With `workers` > 1, fork that many
+    server processes sharing the port (SO_REUSEPORT) under a supervisor
+    that restarts crashed workers and passes shutdown on to them, so one
+    deployment can use several cores for handler work.
+
+    With a unix domain socket `uds` (a path, or "@name" for an abstract
+    socket) the server listens there too. Workers can't share a socket
+    (envoy would only reach one of them), so `uds` needs `workers` <= 1.
+
+    `server_options` tunes the gRPC server (see GrpcServerOptions), and
+    `loop` picks the event loop: "auto" (uvloop if installed), "asyncio",
+    "uvloop" or a function returning a new loop.
+    """
+    if workers > 1 and uds:
+        raise ValueError(
+            "Workers can't share a unix domain socket, use a port with several workers"
+        )
+    if workers <= 1:
+        _run(
+            service=service,
+            port=port,
+            grace_period=grace_period,
+            uds=uds,
+            server_options=server_options,
+            loop=loop,
+        )
+        return
+
+    logger.info(f'Starting {workers} workers for Envoy ExternalProcessor "{service}" at {port}')
+    supervisor = WorkerSupervisor(
+        _run,
+        args=(service, port, grace_period, REUSE_PORT_OPTIONS, uds, server_options, loop),
+        workers=workers,
+        grace_period=grace_period,
+    )
+    supervisor.run()
@@ -3,12 +3,130 @@ import re
 
 GRPC_PORT = int(environ.get("GRPC_PORT", "50051"))
 
+# unix domain socket to (also) listen on: a path, or @name for an abstract
+# socket; set GRPC_PORT=0 to listen only on the socket
+GRPC_UDS = environ.get("GRPC_UDS") or None
+
+# gRPC server tuning (see server.GrpcServerOptions); 0 keeps gRPC's default
+GRPC_MAX_CONCURRENT_RPCS = int(environ.get("GRPC_MAX_CONCURRENT_RPCS", "0")) or None
+GRPC_MAX_CONCURRENT_STREAMS = int(environ.get("GRPC_MAX_CONCURRENT_STREAMS", "0")) or None
+# BUFFERED bodies arrive as one message, so allow more than gRPC's 4MiB
+GRPC_MAX_RECEIVE_MESSAGE_LENGTH = (
+    int(environ.get("GRPC_MAX_RECEIVE_MESSAGE_LENGTH", str(32 * 1024 * 1024))) or None
+)
+GRPC_MAX_SEND_MESSAGE_LENGTH = int(environ.get("GRPC_MAX_SEND_MESSAGE_LENGTH", "0")) or None
+GRPC_KEEPALIVE_TIME_MS = int(environ.get("GRPC_KEEPALIVE_TIME_MS", "0")) or None
+GRPC_KEEPALIVE_TIMEOUT_MS = int(environ.get("GRPC_KEEPALIVE_TIMEOUT_MS", "0")) or None
+GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS = (
+    re.match(
+        r"^([Tt](rue)?|[Yy](es)?)$", environ.get("GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS", "False")
+    )
+    is not None
+)
+GRPC_MIN_PING_INTERVAL_MS = int(environ.get("GRPC_MIN_PING_INTERVAL_MS", "0")) or None
+GRPC_HTTP2_WINDOW_SIZE = int(environ.get("GRPC_HTTP2_WINDOW_SIZE", "0")) or None
+GRPC_HTTP2_BDP_PROBE = (
+    re.match(r"^([Tt](rue)?|[Yy](es)?)$", environ.get("GRPC_HTTP2_BDP_PROBE", "True")) is not None
+)
+# response compression: none, gzip or deflate
+GRPC_COMPRESSION = environ.get("GRPC_COMPRESSION", "none")
+
+# event loop implementation: auto (uvloop if installed), asyncio or uvloop
+EVENT_LOOP = environ.get("EVENT_LOOP", "auto")
+
+JSON_CODEC = environ.get("JSON_CODEC", "auto")
+
+# pools for handlers run off the event loop (see executors.py): workers in
+# the thread and process pools (0 for python's defaults), and how many more
+# handlers each takes before streams wait for a slot
+EXECUTOR_THREADS = int(environ.get("EXECUTOR_THREADS", "0")) or None
+EXECUTOR_PROCESSES = int(environ.get("EXECUTOR_PROCESSES", "0")) or None
+EXECUTOR_BACKLOG = int(environ.get("EXECUTOR_BACKLOG", "0"))
+
+# BodyBuffer defaults: bodies over BODY_MAX_SIZE get a 413, and bodies over
+# BODY_SPILL_THRESHOLD move to a file (in BODY_SPILL_DIR); 0 turns either off
+BODY_MAX_SIZE = int(environ.get("BODY_MAX_SIZE", "0")) or None
+BODY_SPILL_THRESHOLD = int(environ.get("BODY_SPILL_THRESHOLD", "0")) or None
+BODY_SPILL_DIR = environ.get("BODY_SPILL_DIR") or None
+
+# admission control (see admission.py): off, concurrency (at most
+# ADMISSION_LIMIT streams at once) or aimd (a limit, up to ADMISSION_LIMIT,
+# cut when phases take over ADMISSION_TARGET_LATENCY_MS). Streams over the
+# limit get a 503, or with ADMISSION_FAIL_OPEN are passed on unprocessed
+ADMISSION = environ.get("ADMISSION", "off")
+ADMISSION_LIMIT = int(environ.get("ADMISSION_LIMIT", "0")) or None
+ADMISSION_MIN_LIMIT = int(environ.get("ADMISSION_MIN_LIMIT", "1"))
+ADMISSION_TARGET_LATENCY_MS = float(environ.get("ADMISSION_TARGET_LATENCY_MS", "50"))
+ADMISSION_BACKOFF = float(environ.get("ADMISSION_BACKOFF", "0.9"))
+ADMISSION_FAIL_OPEN = (
+    re.match(r"^([Tt](rue)?|[Yy](es)?)$", environ.get("ADMISSION_FAIL_OPEN", "False")) is not None
+)
+
+# deadline for phase handlers, in ms (0 for none); keep it under envoy's
+# message_timeout (200ms by default). Handlers past it are cancelled and the
+# phase answered with a 504, or with PHASE_TIMEOUT_FAIL_OPEN left unchanged
+PHASE_TIMEOUT_MS = float(environ.get("PHASE_TIMEOUT_MS", "0")) or None
+PHASE_TIMEOUT_FAIL_OPEN = (
+    re.match(r"^([Tt](rue)?|[Yy](es)?)$", environ.get("PHASE_TIMEOUT_FAIL_OPEN", "False"))
+    is not None
+)
+
+# report each request's overhead (time in handlers, in all and by phase) to
+# envoy in ProcessingResponse.dynamic_metadata, under this namespace
+OVERHEAD_METADATA = (
+    re.match(r"^([Tt](rue)?|[Yy](es)?)$", environ.get("OVERHEAD_METADATA", "False")) is not None
+)
+OVERHEAD_METADATA_NAMESPACE = environ.get("OVERHEAD_METADATA_NAMESPACE", "envoy_extproc_sdk")
+
+# record metrics (see metrics.py), and serve them at :METRICS_PORT/metrics
+# (0 doesn't; with several workers, each serves at METRICS_PORT + its index)
+METRICS = re.match(r"^([Tt](rue)?|[Yy](es)?)$", environ.get("METRICS", "True")) is not None
+METRICS_PORT = int(environ.get("METRICS_PORT", "0"))
+
+# load-aware health (see health.LoadMonitor): every HEALTH_INTERVAL_MS the
+# event loop lag, streams in flight and handlers queued for executors are
+# checked against their maximums (0 turns a check off); over any of them the
+# health service reports NOT_SERVING, until all are under HEALTH_RECOVER_RATIO
+# of their maximums for HEALTH_RECOVER_CHECKS checks in a row
+HEALTH_INTERVAL_MS = int(environ.get("HEALTH_INTERVAL_MS", "250"))
+HEALTH_MAX_LOOP_LAG_MS = int(environ.get("HEALTH_MAX_LOOP_LAG_MS", "0")) or None
+HEALTH_MAX_IN_FLIGHT = int(environ.get("HEALTH_MAX_IN_FLIGHT", "0")) or None
+HEALTH_MAX_QUEUED = int(environ.get("HEALTH_MAX_QUEUED", "0")) or None
+HEALTH_RECOVER_RATIO = float(environ.get("HEALTH_RECOVER_RATIO", "0.5"))
+HEALTH_RECOVER_CHECKS = int(environ.get("HEALTH_RECOVER_CHECKS", "4"))
+
 SHUTDOWN_GRACE_PERIOD = int(environ.get("SHUTDOWN_GRACE_PERIOD", "5"))
 
+# server processes to fork (sharing GRPC_PORT); 1 serves in-process
+WORKERS = int(environ.get("WORKERS", "1"))
+
 REVEAL_EXTPROC_CHAIN = (
     re.match(r"^([Tt](rue)?|[Yy](es)?)$", environ.get("REVEAL_EXTPROC_CHAIN", "True")) is not None
 )
 
+# send ProcessingResponse.mode_override so envoy stops sending phases no
+# handler uses (computed against the service's PROCESSING_MODE, so only
+# turn this on where that matches envoy's); envoy ignores this unless
+# `allow_mode_override` is set
+SEND_MODE_OVERRIDE = (
+    re.match(r"^([Tt](rue)?|[Yy](es)?)$", environ.get("SEND_MODE_OVERRIDE", "False")) is not None
+)
+
+# log 1 in N phase completions (with durations) at INFO; 0 turns this off
+LOG_SAMPLE_RATE = int(environ.get("LOG_SAMPLE_RATE", "0"))
+
+# tracing backend: off, ddtrace or otel. Defaults to ddtrace unless it is
+# disabled with DD_TRACE_ENABLED=false, in which case it isn't imported
+TRACING = environ.get(
+    "TRACING",
+    "ddtrace"
+    if re.match(r"^([Ff](alse)?|[Nn](o)?|0)$", environ.get("DD_TRACE_ENABLED", "true")) is None
+    else "off",
+)
+
+# fraction of streams traced (decided once per stream)
+TRACE_SAMPLE_RATE = float(environ.get("TRACE_SAMPLE_RATE", "1.0"))
+
 EXTPROCS_APPLIED_HEADER = environ.get("EXTPROCS_APPLIED_HEADER", "x-ext-procs-applied")
 
 ENVOY_SERVICE_NAME = "envoy.service.ext_proc.v3.ExternalProcessor"
@@ -1,6 +1,6 @@
-from json import dumps
 from typing import Any, Dict, List, Optional, Tuple, Union
 
+from ..util.codec import dumps
 from ..util.envoy import EnvoyHeaderMap, EnvoyHeaderValue, ext_api
 
 
@@ -34,7 +34,7 @@ def envoy_body(
     if isinstance(body, str):
         return ext_api.HttpBody(body=body.encode())
     if isinstance(body, list) or isinstance(body, dict):
-        return ext_api.HttpBody(body=dumps(body).encode())
+        return ext_api.HttpBody(body=dumps(body))
     raise ValueError(f"Unparseable body type {type(body)}")
 
 
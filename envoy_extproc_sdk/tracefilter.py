@@ -0,0 +1,28 @@
+"""
+ddtrace filters. Importing this imports ddtrace, which the SDK otherwise
+only does when tracing with it (see tracing.DatadogTracer).
+"""
+
+from typing import List, Optional
+
+from ddtrace import Span
+from ddtrace.filters import TraceFilter
+
+from .health import grpc_health_path_base
+
+
+class FilterOutHealthChecks(TraceFilter):
+    def exclude(self, span: Span):
+        """
+        return True if span_type == grpc and resource starts with /{grpc_health_path_base}
+        """
+        return (span.span_type == "grpc") and span.resource.startswith(f"/{grpc_health_path_base}")
+
+    def include(self, span: Span):
+        return not self.exclude(span)
+
+    def process_trace(self, trace: List[Span]) -> Optional[List[Span]]:
+        for span in trace:
+            if self.exclude(span):
+                return None
+        return trace
@@ -0,0 +1,121 @@
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, Optional
+
+from .settings import ENVOY_SERVICE_NAME, TRACE_SAMPLE_RATE, TRACING
+from .util.sampling import RateSampler
+
+# a reusable "span" for streams or phases that aren't traced
+NO_SPAN: ContextManager[Any] = nullcontext()
+
+# span and resource names are fixed per phase, so compute them once
+STREAM_SPAN_NAME = "process"
+STREAM_RESOURCE = f"/{ENVOY_SERVICE_NAME}/Process"
+PHASE_SPAN_NAMES: Dict[str, str] = {}
+PHASE_RESOURCES: Dict[str, str] = {}
+for _phase in (
+    "request_headers",
+    "request_body",
+    "request_trailers",
+    "response_headers",
+    "response_body",
+    "response_trailers",
+):
+    PHASE_SPAN_NAMES[_phase] = f"{STREAM_SPAN_NAME}.{_phase}"
+    PHASE_RESOURCES[_phase] = f"{STREAM_RESOURCE}/{''.join([w.title() for w in _phase.split('_')])}"
+
+
+class ExtProcTracer:
+    """
+    Tracing backend used by BaseExtProcService. This base class is the
+    no-op tracer; backends override the span methods. Whether a stream
+    is traced is decided once, when it starts (head-based sampling), so
+    unsampled streams cost one call to `sample` and nothing per phase.
+    """
+
+    name = "off"
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE) -> None:
+        self.sample = RateSampler(sample_rate)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(sample_rate={self.sample.rate})"
+
+    def stream_span(self) -> ContextManager[Any]:
+        """span covering a whole Process stream"""
+        return NO_SPAN
+
+    def phase_span(self, phase: str) -> ContextManager[Any]:
+        """span covering one phase handler"""
+        return NO_SPAN
+
+
+class NoopTracer(ExtProcTracer):
+    """never traces anything"""
+
+    def __init__(self, sample_rate: float = 0.0) -> None:
+        super().__init__(sample_rate=0.0)
+
+
+class DatadogTracer(ExtProcTracer):
+    """traces with ddtrace, imported only when this tracer is created"""
+
+    name = "ddtrace"
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE) -> None:
+        super().__init__(sample_rate=sample_rate)
+        from ddtrace import tracer
+
+        self._tracer = tracer
+
+    def stream_span(self) -> ContextManager[Any]:
+        return self._tracer.trace(STREAM_SPAN_NAME, resource=STREAM_RESOURCE, span_type="grpc")
+
+    def phase_span(self, phase: str) -> ContextManager[Any]:
+        return self._tracer.trace(
+            PHASE_SPAN_NAMES[phase], resource=PHASE_RESOURCES[phase], span_type="grpc"
+        )
+
+
+class OpenTelemetryTracer(ExtProcTracer):
+    """traces with the OpenTelemetry API, imported only when this tracer
+    is created (configure the SDK/exporters as usual for your app)"""
+
+    name = "otel"
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE) -> None:
+        super().__init__(sample_rate=sample_rate)
+        from opentelemetry import trace
+
+        self._tracer = trace.get_tracer("envoy_extproc_sdk")
+        self._kind = trace.SpanKind.SERVER
+
+    def stream_span(self) -> ContextManager[Any]:
+        return self._tracer.start_as_current_span(
+            STREAM_SPAN_NAME, kind=self._kind, attributes={"rpc.method": STREAM_RESOURCE}
+        )
+
+    def phase_span(self, phase: str) -> ContextManager[Any]:
+        return self._tracer.start_as_current_span(
+            PHASE_SPAN_NAMES[phase], attributes={"rpc.method": PHASE_RESOURCES[phase]}
+        )
+
+
+TRACERS = {
+    "": NoopTracer,
+    "off": NoopTracer,
+    "none": NoopTracer,
+    "noop": NoopTracer,
+    "ddtrace": DatadogTracer,
+    "datadog": DatadogTracer,
+    "otel": OpenTelemetryTracer,
+    "opentelemetry": OpenTelemetryTracer,
+}
+
+
+def get_tracer(name: str = TRACING, sample_rate: Optional[float] = None) -> ExtProcTracer:
+    """create a tracer by name: off (or none/noop), ddtrace or otel"""
+    try:
+        tracer_class = TRACERS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown tracer {name}; use one of {', '.join(TRACERS)}")
+    return tracer_class(sample_rate=TRACE_SAMPLE_RATE if sample_rate is None else sample_rate)
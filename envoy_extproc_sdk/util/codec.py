@@ -0,0 +1,236 @@
+from dataclasses import fields, is_dataclass
+import json
+from typing import (
+    Any,
+    Dict,
+    get_args,
+    get_origin,
+    get_type_hints,
+    Iterable,
+    List,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from ..settings import JSON_CODEC
+
+JSONInput = Union[bytes, bytearray, memoryview, str]
+
+T = TypeVar("T")
+
+_NONE_TYPE = type(None)
+
+
+class JSONCodec:
+    """
+    JSON (de)serialization from and to bytes, so bodies don't go through
+    `decode("utf-8")` and `encode()` around the stdlib's str-based API.
+    This base class uses the stdlib `json`; the faster backends (orjson,
+    msgspec) are imported only when their codec is created.
+
+    All codecs write compact, UTF-8 (not ASCII-escaped) JSON, and raise
+    ValueError for invalid input.
+    """
+
+    name = "json"
+
+    def loads(self, data: JSONInput) -> Any:
+        return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data: JSONInput, schema: Type[T]) -> T:
+        """decode into a (dataclass) schema, raising ValueError if it doesn't fit"""
+        return from_builtins(self.loads(data), schema)  # type: ignore[no-any-return]
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson; note it doesn't serialize non-str dict keys or ints beyond 64 bits"""
+
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._orjson = orjson
+
+    def loads(self, data: JSONInput) -> Any:
+        return self._orjson.loads(data)
+
+    def dumps(self, value: Any) -> bytes:
+        return self._orjson.dumps(value)  # type: ignore[no-any-return]
+
+
+class MsgspecCodec(JSONCodec):
+    """msgspec, which also decodes (and validates) schemas natively"""
+
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        self._error = msgspec.DecodeError
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder()
+        self._decoders: Dict[Any, Any] = {}
+        self._member_decoders: Dict[Tuple[str, ...], Any] = {}
+        self._msgspec = msgspec
+
+    def loads(self, data: JSONInput) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._error as error:
+            raise ValueError(str(error)) from error
+
+    def dumps(self, value: Any) -> bytes:
+        return self._encoder.encode(value)  # type: ignore[no-any-return]
+
+    def decode(self, data: JSONInput, schema: Type[T]) -> T:
+        decoder = self._decoders.get(schema)
+        if decoder is None:
+            decoder = self._decoders[schema] = self._msgspec.json.Decoder(schema)
+        try:
+            return decoder.decode(data)  # type: ignore[no-any-return]
+        except self._error as error:
+            raise ValueError(str(error)) from error
+
+    def loads_members(self, data: JSONInput, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        some top-level members of a JSON object (those present), decoded
+        into a Struct with just those fields so the others are skipped
+        """
+        keys = tuple(dict.fromkeys(keys))
+        decoder = self._member_decoders.get(keys)
+        if decoder is None:
+            # keys needn't be identifiers, so the fields are renamed to them
+            names = [f"field{i}" for i in range(len(keys))]
+            struct = self._msgspec.defstruct(
+                "Members",
+                [(name, Any, self._msgspec.UNSET) for name in names],
+                rename=dict(zip(names, keys)),
+            )
+            decoder = self._member_decoders[keys] = self._msgspec.json.Decoder(struct)
+        try:
+            members = decoder.decode(data)
+        except self._error as error:
+            raise ValueError(str(error)) from error
+        values = (getattr(members, f"field{i}") for i in range(len(keys)))
+        return {key: value for key, value in zip(keys, values) if value is not self._msgspec.UNSET}
+
+
+def _auto_codec() -> JSONCodec:
+    for codec_class in (OrjsonCodec, MsgspecCodec):
+        try:
+            return codec_class()
+        except ImportError:
+            continue
+    return JSONCodec()
+
+
+# codecs by name; "auto" is the fastest one installed
+JSON_CODECS = {
+    "auto": _auto_codec,
+    "json": JSONCodec,
+    "stdlib": JSONCodec,
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+}
+
+
+def get_json_codec(name: str = JSON_CODEC) -> JSONCodec:
+    """
+    create a codec by name: auto, json (or stdlib), orjson or msgspec.
+    Asking for a backend that isn't installed raises ImportError.
+    """
+    try:
+        factory = JSON_CODECS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown JSON codec {name}; use one of {', '.join(JSON_CODECS)}")
+    return factory()  # type: ignore[no-any-return]
+
+
+_codec = get_json_codec()
+
+
+def json_codec() -> JSONCodec:
+    """the codec the SDK (and `loads`/`dumps`/`decode`) use"""
+    return _codec
+
+
+def set_json_codec(codec: Union[str, JSONCodec]) -> JSONCodec:
+    """switch the codec the SDK uses, by name or instance"""
+    global _codec
+    _codec = get_json_codec(codec) if isinstance(codec, str) else codec
+    return _codec
+
+
+def loads(data: JSONInput) -> Any:
+    """parse JSON bytes (or str) with the current codec"""
+    return _codec.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    """serialize to compact UTF-8 JSON bytes with the current codec"""
+    return _codec.dumps(value)
+
+
+def decode(data: JSONInput, schema: Type[T]) -> T:
+    """parse JSON bytes (or str) into a dataclass schema with the current codec"""
+    return _codec.decode(data, schema)
+
+
+def from_builtins(value: Any, schema: Any) -> Any:
+    """
+    convert parsed JSON into a schema: dataclasses (from objects, ignoring
+    unknown fields), List, Dict, Optional/Union and plain types, raising
+    ValueError for values that don't fit
+    """
+    if schema is Any:
+        return value
+    if isinstance(schema, type) and is_dataclass(schema):
+        if not isinstance(value, dict):
+            raise ValueError(f"Expected an object for {schema.__name__}")
+        hints = get_type_hints(schema)
+        kwargs = {
+            f.name: from_builtins(value[f.name], hints[f.name])
+            for f in fields(schema)
+            if f.init and f.name in value
+        }
+        try:
+            return schema(**kwargs)
+        except TypeError as error:  # missing required fields
+            raise ValueError(f"Invalid {schema.__name__}: {error}") from error
+
+    origin = get_origin(schema)
+    if origin is Union:
+        if value is None and _NONE_TYPE in get_args(schema):
+            return None
+        for option in get_args(schema):
+            if option is _NONE_TYPE:
+                continue
+            try:
+                return from_builtins(value, option)
+            except ValueError:
+                continue
+        raise ValueError(f"Expected {schema}, got {type(value).__name__}")
+    if origin in (list, List):
+        if not isinstance(value, list):
+            raise ValueError(f"Expected an array, got {type(value).__name__}")
+        (item,) = get_args(schema) or (Any,)
+        return [from_builtins(v, item) for v in value]
+    if origin in (dict, Dict):
+        if not isinstance(value, dict):
+            raise ValueError(f"Expected an object, got {type(value).__name__}")
+        _, item = get_args(schema) or (str, Any)
+        return {k: from_builtins(v, item) for k, v in value.items()}
+
+    if schema is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(schema, type) and not isinstance(value, schema):
+        raise ValueError(f"Expected {schema.__name__}, got {type(value).__name__}")
+    if schema is int and isinstance(value, bool):
+        raise ValueError("Expected int, got bool")
+    return value
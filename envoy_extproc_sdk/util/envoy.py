@@ -7,6 +7,9 @@ from envoy.config.core.v3.base_pb2 import (  # noqa: F401
 from envoy.config.core.v3.base_pb2 import (  # noqa: F401
     HeaderValueOption as EnvoyHeaderValueOption,
 )
+from envoy.extensions.filters.http.ext_proc.v3.processing_mode_pb2 import (  # noqa: F401
+    ProcessingMode as EnvoyProcessingMode,
+)
 from envoy.service.ext_proc.v3 import (  # noqa: F401
     external_processor_pb2 as ext_api,
 )
@@ -0,0 +1,95 @@
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from .envoy import EnvoyHeaderValue, ext_api
+
+
+def header_value(header: EnvoyHeaderValue) -> str:
+    """a header's value as a string; newer envoys may only send raw_value"""
+    if header.value or not header.raw_value:
+        return header.value
+    return header.raw_value.decode("utf-8", errors="replace")
+
+
+def header_raw_value(header: EnvoyHeaderValue) -> bytes:
+    """a header's value as bytes, whichever of value/raw_value was sent"""
+    return header.raw_value or header.value.encode("utf-8")
+
+
+class HeaderIndex:
+    """
+    Lower-cased name index over an envoy HttpHeaders message, so looking
+    up a header doesn't scan every header. Multi-valued headers keep all
+    their values, in order. Use `HeaderIndex.of(headers)` to share one
+    index between all lookups on the same message, e.g. the SDK's own
+    "standard" headers and any get_header calls in a handler.
+    """
+
+    __slots__ = ("source", "size", "_first", "_more")
+
+    def __init__(self, headers: ext_api.HttpHeaders) -> None:
+        self.source = headers
+        # how many headers were indexed, to notice ones added (or removed)
+        self.size = len(headers.headers.headers)
+        first: Dict[str, EnvoyHeaderValue] = {}
+        more: Optional[Dict[str, List[EnvoyHeaderValue]]] = None
+        for header in headers.headers.headers:
+            key = header.key.lower()
+            if key not in first:
+                first[key] = header
+            elif more is None:
+                more = {key: [header]}
+            else:
+                more.setdefault(key, []).append(header)
+        self._first = first
+        self._more = more
+
+    @classmethod
+    def of(cls, headers: ext_api.HttpHeaders) -> "HeaderIndex":
+        """the index for a headers message, built at most once per message
+        (per asyncio task, i.e. per stream), or again if headers were added
+        to or removed from it since"""
+        index = _current_index.get()
+        if (
+            (index is None)
+            or (index.source is not headers)
+            or (index.size != len(headers.headers.headers))
+        ):
+            index = cls(headers)
+            _current_index.set(index)
+        return index
+
+    @staticmethod
+    def clear() -> None:
+        """drop the cached index (e.g. when a phase is done with it)"""
+        _current_index.set(None)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._first
+
+    def __len__(self) -> int:
+        return len(self._first)
+
+    def get(self, name: str, lower_cased: bool = False) -> Optional[str]:
+        """the (first) value of a header, or None"""
+        header = self._first.get(name if lower_cased else name.lower())
+        return None if header is None else header_value(header)
+
+    def get_raw(self, name: str, lower_cased: bool = False) -> Optional[bytes]:
+        """the (first) value of a header as bytes, or None"""
+        header = self._first.get(name if lower_cased else name.lower())
+        return None if header is None else header_raw_value(header)
+
+    def get_all(self, name: str, lower_cased: bool = False) -> List[str]:
+        """all values of a (possibly repeated) header, in order"""
+        _name = name if lower_cased else name.lower()
+        header = self._first.get(_name)
+        if header is None:
+            return []
+        values = [header_value(header)]
+        if self._more is not None and _name in self._more:
+            values.extend(header_value(h) for h in self._more[_name])
+        return values
+
+
+_current_index: ContextVar[Optional[HeaderIndex]] = ContextVar("header_index", default=None)
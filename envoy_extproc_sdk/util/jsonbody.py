@@ -0,0 +1,281 @@
+import re
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+from .codec import dumps, json_codec, loads, MsgspecCodec
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING = re.compile(rb'"[^"\\\x00-\x1f]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*"')
+_SCALAR = re.compile(rb"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null")
+_BRACKETS = (b"[", b"{", b"]", b"}")  # openers first
+
+_OPEN = frozenset(b"[{")
+_QUOTE = ord('"')
+_BACKSLASH = ord("\\")
+_COMMA = ord(",")
+_COLON = ord(":")
+_OPEN_BRACE = ord("{")
+_CLOSE_BRACE = ord("}")
+
+
+class _Member(NamedTuple):
+    key: str
+    key_start: int
+    key_end: int
+    value_start: int
+    value_end: int
+
+
+def _skip_string(body: bytes, start: int) -> int:
+    """the end of the string at start, found with bytes.find rather than a regex"""
+    end = body.find(b'"', start + 1)
+    while end > 0 and body[end - 1] == _BACKSLASH:
+        backslash = end - 1
+        while body[backslash - 1] == _BACKSLASH:
+            backslash -= 1
+        if (end - backslash) % 2 == 0:  # the backslashes are escaped, not the quote
+            break
+        end = body.find(b'"', end + 1)
+    if end < 0:
+        raise ValueError(f"Unterminated string at {start}")
+    return end + 1
+
+
+def _skip_nested(body: bytes, start: int) -> int:
+    """
+    the end of the array or object at start, checking only that brackets
+    match: it jumps (with bytes.find) from one bracket or string to the
+    next, so runs of numbers or long strings cost next to nothing
+    """
+    find, end = body.find, len(body)
+    brackets = [find(char, start) for char in _BRACKETS]
+    brackets = [end if found < 0 else found for found in brackets]
+    bracket = min(brackets)
+    quote = find(b'"', start)
+    quote = end if quote < 0 else quote
+    opened: List[int] = []
+    while True:
+        if quote < bracket:
+            position = _skip_string(body, quote)
+            quote = find(b'"', position)
+            quote = end if quote < 0 else quote
+            if bracket < position:  # brackets in the string don't count
+                for index, found in enumerate(brackets):
+                    if found < position:
+                        found = find(_BRACKETS[index], position)
+                        brackets[index] = end if found < 0 else found
+                bracket = min(brackets)
+            continue
+        if bracket == end:
+            raise ValueError(f"Unterminated value at {start}")
+        index = brackets.index(bracket)
+        if index < 2:
+            opened.append(index)
+        elif not opened or opened.pop() != index - 2:
+            raise ValueError(f"Unmatched bracket at {bracket}")
+        elif not opened:
+            return bracket + 1
+        found = find(_BRACKETS[index], bracket + 1)
+        brackets[index] = end if found < 0 else found
+        bracket = min(brackets)
+
+
+def _skip_value(body: bytes, start: int) -> int:
+    """the end of the value at start"""
+    if start < len(body) and body[start] in _OPEN:
+        return _skip_nested(body, start)
+    if start < len(body) and body[start] == _QUOTE:
+        return _skip_string(body, start)
+    match = _SCALAR.match(body, start)
+    if match is None:
+        raise ValueError(f"Expected a value at {start}")
+    return match.end()
+
+
+def _expect(body: bytes, position: int, char: int) -> int:
+    if position >= len(body) or body[position] != char:
+        raise ValueError(f"Expected {chr(char)!r} at {position}")
+    return _WHITESPACE.match(body, position + 1).end()  # type: ignore[union-attr]
+
+
+def _key(raw: bytes) -> str:
+    return raw[1:-1].decode("utf-8") if b"\\" not in raw else loads(raw)  # type: ignore[no-any-return]
+
+
+class JSONMembers:
+    """
+    The top-level members of a JSON object body, located by one scan of
+    its bytes so a handler can read some fields and then patch the body
+    without parsing (or re-serializing) the rest. The scan of a large
+    body (say a chat completion with a long message history) jumps from
+    quote to quote and bracket to bracket; `get` parses just the member
+    asked for, and `patch` writes new values into the original bytes,
+    keeping everything else (formatting included) as is.
+
+    Raises ValueError if the body isn't a JSON object. String, array and
+    object values are only checked for closing quotes and matching
+    brackets until they're read.
+    """
+
+    __slots__ = ("body", "_members", "_close", "_index")
+
+    def __init__(self, body: bytes) -> None:
+        self.body = body
+        self._members: List[_Member] = []
+        self._index: Dict[str, _Member] = {}  # the last member with each key, as json.loads
+
+        position = _WHITESPACE.match(body).end()  # type: ignore[union-attr]
+        position = _expect(body, position, _OPEN_BRACE)
+        if body[position : position + 1] != b"}":
+            while True:
+                match = _STRING.match(body, position)
+                if match is None:
+                    raise ValueError(f"Expected a key at {position}")
+                key_end = match.end()
+                value_start = _expect(
+                    body, _WHITESPACE.match(body, key_end).end(), _COLON  # type: ignore[union-attr]
+                )
+                value_end = _skip_value(body, value_start)
+                member = _Member(_key(match.group()), position, key_end, value_start, value_end)
+                self._members.append(member)
+                self._index[member.key] = member
+
+                position = _WHITESPACE.match(body, value_end).end()  # type: ignore[union-attr]
+                if body[position : position + 1] != b",":
+                    break
+                position = _expect(body, position, _COMMA)
+        self._close = position
+        if _expect(body, position, _CLOSE_BRACE) != len(body):
+            raise ValueError(f"Extra data at {position + 1}")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def keys(self) -> Iterable[str]:
+        return self._index.keys()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """a member's value, parsed (on each call) with the SDK's codec"""
+        member = self._index.get(key)
+        if member is None:
+            return default
+        return loads(self.body[member.value_start : member.value_end])
+
+    def patch(
+        self,
+        values: Optional[Mapping[str, Any]] = None,
+        remove: Iterable[str] = (),
+        rename: Optional[Mapping[str, str]] = None,
+    ) -> bytes:
+        """
+        The body with members renamed (old to new names; a member renamed
+        onto an existing one replaces it), then set to `values` (existing
+        members keep their place, new ones are added at the end) and then
+        removed. Changed keys and values are written into the original
+        bytes; only duplicate keys, or renames onto existing keys, take a
+        full parse and re-serialization. A patch that changes nothing
+        returns the body as it was.
+        """
+        rename = {old: new for old, new in (rename or {}).items() if old in self._index}
+        values = values or {}
+        remove = frozenset(key for key in remove if key in self._index or key in values)
+        if not (rename or values or remove):
+            return self.body
+
+        names = [rename.get(member.key, member.key) for member in self._members]
+        if len(set(names)) < len(names):
+            return self._reserialize(values, remove, rename)
+
+        body, members = memoryview(self.body), self._members  # slices without copies
+        pieces: List[Union[bytes, memoryview]]
+        if members:
+            pieces = [body[: members[0].key_start]]
+            tail = body[members[-1].value_end :]
+            colon = bytes(body[members[-1].key_end : members[-1].value_start])
+        else:
+            pieces = [body[: self._close]]
+            tail = body[self._close :]
+            colon = b":"
+        # new members are formatted like the last one
+        if len(members) > 1:
+            separator = bytes(body[members[-2].value_end : members[-1].key_start])
+        else:
+            separator = b", " if colon.endswith(b" ") else b","
+
+        first = True
+        for index, (member, name) in enumerate(zip(members, names)):
+            if name in remove:
+                continue
+            if not first:  # whatever came before it
+                pieces.append(body[members[index - 1].value_end : member.key_start])
+            first = False
+            if name == member.key:
+                pieces.append(body[member.key_start : member.value_start])
+            else:
+                pieces.extend((dumps(name), body[member.key_end : member.value_start]))
+            if name in values:
+                pieces.append(dumps(values[name]))
+            else:
+                pieces.append(body[member.value_start : member.value_end])
+        present = frozenset(names)
+        for name, value in values.items():
+            if name in present or name in remove:
+                continue
+            if not first:
+                pieces.append(separator)
+            first = False
+            pieces.extend((dumps(name), colon, dumps(value)))
+        pieces.append(tail)
+        return b"".join(pieces)
+
+    def _reserialize(
+        self, values: Mapping[str, Any], remove: Iterable[str], rename: Mapping[str, str]
+    ) -> bytes:
+        document = loads(self.body)
+        document = {rename.get(key, key): value for key, value in document.items()}
+        document.update(values)
+        for key in remove:
+            document.pop(key, None)
+        return dumps(document)
+
+
+def get_json_fields(body: bytes, *keys: str) -> Dict[str, Any]:
+    """
+    Some top-level fields of a JSON object body (those present), parsing
+    only their values: with msgspec as the codec, it decodes (and
+    validates) the body into a Struct of just those fields, otherwise the
+    body is scanned as in JSONMembers. Invalid JSON raises ValueError. To
+    patch the body too, use one JSONMembers for both rather than scanning
+    twice.
+    """
+    codec = json_codec()
+    if isinstance(codec, MsgspecCodec):
+        return codec.loads_members(body, keys)
+    members = JSONMembers(body)
+    return {key: members.get(key) for key in keys if key in members}
+
+
+def patch_json_fields(
+    body: bytes,
+    values: Optional[Mapping[str, Any]] = None,
+    remove: Iterable[str] = (),
+    rename: Optional[Mapping[str, str]] = None,
+) -> bytes:
+    """
+    A JSON object body with top-level fields renamed (`rename`, old to new
+    names), then set (`values`) and then removed (`remove`), written into
+    the original bytes; see JSONMembers.patch. Invalid JSON raises
+    ValueError.
+    """
+    return JSONMembers(body).patch(values=values, remove=remove, rename=rename)
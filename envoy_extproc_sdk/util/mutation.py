@@ -0,0 +1,167 @@
+from contextvars import ContextVar, Token
+from typing import Dict, List, Optional, Union
+
+from .envoy import EnvoyHeaderValue, EnvoyHeaderValueOption, ext_api
+
+MutationTarget = Union[ext_api.CommonResponse, ext_api.HeaderMutation]
+
+
+def _is_append(option: EnvoyHeaderValueOption) -> bool:
+    return option.HasField("append") and option.append.value
+
+
+def merge_header_mutation(into: ext_api.HeaderMutation, mutation: ext_api.HeaderMutation) -> None:
+    """
+    merge a (later) header mutation into `into`, so that the result is
+    what applying both in order would do: a later set replaces earlier
+    sets of the same header and undoes an earlier remove of it, and a
+    later remove drops earlier sets
+    """
+    if mutation.remove_headers:
+        removed = {name.lower() for name in mutation.remove_headers}
+        kept = [o for o in into.set_headers if o.header.key.lower() not in removed]
+        if len(kept) != len(into.set_headers):
+            del into.set_headers[:]
+            into.set_headers.extend(kept)
+        into.remove_headers.extend(mutation.remove_headers)
+    if mutation.set_headers:
+        added = {o.header.key.lower() for o in mutation.set_headers}
+        if into.remove_headers:
+            names = [name for name in into.remove_headers if name.lower() not in added]
+            if len(names) != len(into.remove_headers):
+                del into.remove_headers[:]
+                into.remove_headers.extend(names)
+        if into.set_headers:
+            replaced = {o.header.key.lower() for o in mutation.set_headers if not _is_append(o)}
+            kept = [o for o in into.set_headers if o.header.key.lower() not in replaced]
+            if len(kept) != len(into.set_headers):
+                del into.set_headers[:]
+                into.set_headers.extend(kept)
+        into.set_headers.extend(mutation.set_headers)
+
+
+class MutationBuilder:
+    """
+    Collects the header and body changes handlers make to one phase
+    response, keyed by (lower-cased) header name, and writes them into
+    the response once, when the phase is done. Setting a header twice
+    sends it once, removing a header drops pending sets (and setting it
+    again undoes the remove), and the last body replacement wins.
+
+    Process binds a builder to the response it passes each handler (see
+    `bind`), and the header/body helpers on BaseExtProcService use it for
+    that response (see `of`); changes to any other response object are
+    made directly, as before.
+    """
+
+    __slots__ = ("target", "_sets", "_removes", "_body", "_clear_body")
+
+    def __init__(self, target: MutationTarget) -> None:
+        self.target = target
+        self._sets: Optional[Dict[str, List[EnvoyHeaderValueOption]]] = None
+        self._removes: Optional[Dict[str, str]] = None
+        self._body: Optional[bytes] = None
+        self._clear_body = False
+
+    @staticmethod
+    def bind(target: MutationTarget) -> Token:
+        """collect mutations of `target` (in this context) until `unbind`"""
+        return _current_builder.set(MutationBuilder(target))
+
+    @staticmethod
+    def unbind(token: Token, apply: bool = True) -> None:
+        """stop collecting, writing what was collected into the target"""
+        builder = _current_builder.get()
+        _current_builder.reset(token)
+        if apply and (builder is not None):
+            builder.apply()
+
+    @staticmethod
+    def of(target: MutationTarget) -> Optional["MutationBuilder"]:
+        """the builder bound to `target`, if any"""
+        builder = _current_builder.get()
+        if (builder is None) or (builder.target is not target):
+            return None
+        return builder
+
+    def __bool__(self) -> bool:
+        return bool(self._sets or self._removes or self._clear_body or self._body is not None)
+
+    def set_header(self, key: str, value: str) -> "MutationBuilder":
+        """set (overwrite) a header"""
+        name = key.lower()
+        option = EnvoyHeaderValueOption(header=EnvoyHeaderValue(key=key, value=value))
+        if self._sets is None:
+            self._sets = {name: [option]}
+        else:
+            self._sets[name] = [option]
+        if self._removes is not None:
+            self._removes.pop(name, None)
+        return self
+
+    def append_header(self, key: str, value: str) -> "MutationBuilder":
+        """add a value to a header, keeping any existing values"""
+        name = key.lower()
+        option = EnvoyHeaderValueOption(header=EnvoyHeaderValue(key=key, value=value))
+        option.append.value = True
+        if self._sets is None:
+            self._sets = {name: [option]}
+        else:
+            self._sets.setdefault(name, []).append(option)
+        if self._removes is not None:
+            self._removes.pop(name, None)
+        return self
+
+    def remove_header(self, key: str) -> "MutationBuilder":
+        """remove a header (and any pending sets of it)"""
+        name = key.lower()
+        if self._sets is not None:
+            self._sets.pop(name, None)
+        if self._removes is None:
+            self._removes = {name: key}
+        else:
+            self._removes[name] = key
+        return self
+
+    def set_body(self, body: bytes) -> "MutationBuilder":
+        """replace the body"""
+        self._body = body
+        self._clear_body = False
+        return self
+
+    def clear_body(self) -> "MutationBuilder":
+        """clear the body"""
+        self._body = None
+        self._clear_body = True
+        return self
+
+    def header_mutation(self) -> ext_api.HeaderMutation:
+        """the collected header changes"""
+        mutation = ext_api.HeaderMutation()
+        if self._sets:
+            for options in self._sets.values():
+                mutation.set_headers.extend(options)
+        if self._removes:
+            mutation.remove_headers.extend(self._removes.values())
+        return mutation
+
+    def apply(self) -> MutationTarget:
+        """write the collected changes into the target, merging them with
+        any changes made to it directly"""
+        target = self.target
+        if self._sets or self._removes:
+            if isinstance(target, ext_api.CommonResponse):
+                merge_header_mutation(target.header_mutation, self.header_mutation())
+            else:
+                merge_header_mutation(target, self.header_mutation())
+        if isinstance(target, ext_api.CommonResponse):
+            if self._body is not None:
+                target.body_mutation.body = self._body
+            elif self._clear_body:
+                target.body_mutation.clear_body = True
+        return target
+
+
+_current_builder: ContextVar[Optional[MutationBuilder]] = ContextVar(
+    "mutation_builder", default=None
+)
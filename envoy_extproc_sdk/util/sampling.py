@@ -0,0 +1,47 @@
+from random import random
+
+
+class EveryNth:
+    """Deterministic 1-in-N sampler: calling it returns True once every
+    `every` calls, and never when `every` is 0 (or less). Cheap enough
+    to call on every message; not meant to be shared across threads."""
+
+    __slots__ = ("every", "_count")
+
+    def __init__(self, every: int = 0) -> None:
+        self.every = every
+        self._count = 0
+
+    def __bool__(self) -> bool:
+        """whether this sampler can ever sample"""
+        return self.every > 0
+
+    def __call__(self) -> bool:
+        if self.every <= 0:
+            return False
+        self._count += 1
+        if self._count < self.every:
+            return False
+        self._count = 0
+        return True
+
+
+class RateSampler:
+    """Random sampler: calling it returns True with probability `rate`
+    (so always for 1.0 and never for 0.0, without drawing a number)."""
+
+    __slots__ = ("rate",)
+
+    def __init__(self, rate: float = 1.0) -> None:
+        self.rate = rate
+
+    def __bool__(self) -> bool:
+        """whether this sampler can ever sample"""
+        return self.rate > 0.0
+
+    def __call__(self) -> bool:
+        if self.rate >= 1.0:
+            return True
+        if self.rate <= 0.0:
+            return False
+        return random() < self.rate
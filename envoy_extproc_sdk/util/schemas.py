@@ -0,0 +1,28 @@
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+# Typed request bodies, to decode with envoy_extproc_sdk.util.codec.decode
+# (natively with msgspec, otherwise from parsed JSON). Fields not listed
+# here are ignored when decoding.
+
+
+@dataclass
+class ChatMessage:
+    """one message of a chat completion request"""
+
+    role: str
+    # a str, or a list of content parts (text, images, ...)
+    content: Any = None
+    name: Optional[str] = None
+
+
+@dataclass
+class ChatCompletionRequest:
+    """an (OpenAI-style) chat completion request body"""
+
+    model: str
+    messages: List[ChatMessage] = field(default_factory=list)
+    stream: bool = False
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    user: Optional[str] = None
@@ -0,0 +1,220 @@
+import re
+from typing import Any, Callable, List, Optional, Union
+
+from ..context import RequestContext
+from .envoy import ext_api
+
+# the blank line ending an event: two line ends, each CRLF, CR or LF
+_LINE_END = rb"(?:\r\n|\r(?!\n)|\n)"
+_EVENT_END = re.compile(_LINE_END + _LINE_END)
+# an event end can be up to 4 bytes, so 3 may already be in hand
+_EVENT_END_OVERLAP = 3
+_CR = ord("\r")
+
+_MISSING: Any = object()
+
+Bytes = Union[bytes, memoryview]
+
+
+class SSEEvent:
+    """
+    One server-sent event. `raw` holds the event's bytes as received
+    (blank line included), and is what `encode` sends on for events that
+    weren't changed; `replace` makes a changed copy, encoded from its
+    fields. `data` is the event's data lines joined with newlines, or
+    None for events without any (comments, keep-alives).
+    """
+
+    __slots__ = ("data", "event", "id", "retry", "raw")
+
+    def __init__(
+        self,
+        data: Optional[bytes] = None,
+        event: Optional[str] = None,
+        id: Optional[str] = None,
+        retry: Optional[int] = None,
+        raw: Optional[Bytes] = None,
+    ) -> None:
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+        self.raw = raw
+
+    def __repr__(self) -> str:
+        return f"SSEEvent(data={self.data!r}, event={self.event!r}, id={self.id!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SSEEvent):
+            return NotImplemented
+        return (self.data, self.event, self.id, self.retry) == (
+            other.data,
+            other.event,
+            other.id,
+            other.retry,
+        )
+
+    @classmethod
+    def parse(cls, raw: Bytes) -> "SSEEvent":
+        """an event from its bytes, as in the event stream spec"""
+        event = cls(raw=raw)
+        data: Optional[List[bytes]] = None
+        for line in bytes(raw).splitlines():
+            if not line or line[0] == 0x3A:  # blank or a ":" comment
+                continue
+            name, colon, value = line.partition(b":")
+            if colon and value[:1] == b" ":
+                value = value[1:]
+            if name == b"data":
+                if data is None:
+                    data = [value]
+                else:
+                    data.append(value)
+            elif name == b"event":
+                event.event = value.decode("utf-8", "replace")
+            elif name == b"id":
+                if b"\0" not in value:
+                    event.id = value.decode("utf-8", "replace")
+            elif name == b"retry":
+                if value.isdigit():
+                    event.retry = int(value)
+        if data is not None:
+            event.data = data[0] if len(data) == 1 else b"\n".join(data)
+        return event
+
+    def replace(
+        self,
+        data: Optional[bytes] = _MISSING,
+        event: Optional[str] = _MISSING,
+        id: Optional[str] = _MISSING,
+        retry: Optional[int] = _MISSING,
+    ) -> "SSEEvent":
+        """a copy with some fields changed, encoded from its fields"""
+        return SSEEvent(
+            data=self.data if data is _MISSING else data,
+            event=self.event if event is _MISSING else event,
+            id=self.id if id is _MISSING else id,
+            retry=self.retry if retry is _MISSING else retry,
+        )
+
+    def encode(self) -> Bytes:
+        """the event's bytes"""
+        if self.raw is not None:
+            return self.raw
+        parts = []
+        if self.event is not None:
+            parts.append(b"event: " + self.event.encode("utf-8") + b"\n")
+        if self.id is not None:
+            parts.append(b"id: " + self.id.encode("utf-8") + b"\n")
+        if self.retry is not None:
+            parts.append(b"retry: %d\n" % self.retry)
+        if self.data is not None:
+            for line in self.data.split(b"\n"):
+                parts.append(b"data: " + line + b"\n")
+        parts.append(b"\n")
+        return b"".join(parts)
+
+
+class SSEParser:
+    """
+    Incremental parser for a text/event-stream body that arrives in
+    chunks. `feed` returns the events each chunk completes and holds on
+    to the (partial) rest until a later chunk completes it, so only the
+    tail of a chunk is ever kept, never the whole stream. Events' `raw`
+    bytes are views into the chunk they arrived in, not copies.
+    """
+
+    __slots__ = ("_pending", "_scanned")
+
+    def __init__(self) -> None:
+        self._pending = b""
+        self._scanned = 0  # where to resume searching _pending for an event end
+
+    @property
+    def pending(self) -> int:
+        """how many bytes of a partial event are held"""
+        return len(self._pending)
+
+    def feed(self, chunk: bytes, end_of_stream: bool = False) -> List[SSEEvent]:
+        """
+        the events completed by `chunk`; at the end of the stream, a
+        trailing event without its blank line is returned as well
+        """
+        source = (self._pending + chunk) if self._pending else chunk
+        view = memoryview(source)
+        size = len(source)
+        events = []
+        start = 0
+        search = self._scanned
+        while True:
+            match = _EVENT_END.search(source, search)
+            if match is None:
+                break
+            end = match.end()
+            if (end == size) and (source[end - 1] == _CR) and not end_of_stream:
+                break  # might be the CR of a CRLF split across chunks
+            events.append(SSEEvent.parse(view[start:end]))
+            start = search = end
+        if end_of_stream:
+            if start < size:
+                events.append(SSEEvent.parse(view[start:]))
+            self._pending, self._scanned = b"", 0
+        else:
+            self._pending = source[start:]
+            self._scanned = max(0, len(self._pending) - _EVENT_END_OVERLAP)
+        return events
+
+    def rewrite(
+        self,
+        chunk: bytes,
+        rewrite: Callable[[SSEEvent], Optional[SSEEvent]],
+        end_of_stream: bool = False,
+    ) -> bytes:
+        """
+        the complete events in `chunk` (and what's held from before), each
+        passed through `rewrite` (return the event, a replacement, or None
+        to drop it), for use as the chunk's body mutation. A partial event
+        at the end is held back until the chunk completing it.
+        """
+        parts = []
+        for event in self.feed(chunk, end_of_stream=end_of_stream):
+            result = rewrite(event)
+            if result is not None:
+                parts.append(result.encode())
+        return b"".join(parts)
+
+
+def _parser_key(request: RequestContext) -> str:
+    return f"__{request.phase}_sse"
+
+
+def sse_parser(request: RequestContext) -> SSEParser:
+    """the parser for the current body phase's event stream, kept in the
+    request context across chunks"""
+    key = _parser_key(request)
+    parser = request.get(key)
+    if parser is None:
+        parser = request[key] = SSEParser()
+    return parser  # type: ignore[no-any-return]
+
+
+def sse_events(request: RequestContext, body: ext_api.HttpBody) -> List[SSEEvent]:
+    """the events a body chunk completes (see SSEParser.feed); the context
+    lets go of the parser after the last chunk"""
+    events = sse_parser(request).feed(body.body, end_of_stream=body.end_of_stream)
+    if body.end_of_stream:
+        request.pop(_parser_key(request), None)
+    return events
+
+
+def rewrite_sse(
+    request: RequestContext,
+    body: ext_api.HttpBody,
+    rewrite: Callable[[SSEEvent], Optional[SSEEvent]],
+) -> bytes:
+    """a body chunk with its events rewritten (see SSEParser.rewrite); the
+    context lets go of the parser after the last chunk"""
+    result = sse_parser(request).rewrite(body.body, rewrite, end_of_stream=body.end_of_stream)
+    if body.end_of_stream:
+        request.pop(_parser_key(request), None)
+    return result
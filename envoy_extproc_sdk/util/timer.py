@@ -1,3 +1,5 @@
+from time import perf_counter_ns, time_ns
+
 from google.protobuf.duration_pb2 import Duration
 from google.protobuf.timestamp_pb2 import Timestamp
 
@@ -5,13 +7,19 @@ from google.protobuf.timestamp_pb2 import Timestamp
 class Timer:
     """Simple timer object implementing the "with"
     interface for capturing start, end, and duration
-    of a block of compute. Uses protobuf objects.
+    of a block of compute. Durations use the monotonic
+    perf_counter clock and the start is kept as wall
+    clock nanoseconds; protobuf objects are only built
+    when asked for.
     """
 
-    def __init__(self):
-        self._start, self._end = Timestamp(), Timestamp()
-        self._duration = Duration()
-        self._running = False
+    __slots__ = ("_started_ns", "_tic_ns", "_toc_ns", "running")
+
+    def __init__(self) -> None:
+        self._started_ns = 0
+        self._tic_ns = 0
+        self._toc_ns = 0
+        self.running = False
 
     def __repr__(self) -> str:
         return f"{self.started_iso()}, {self.duration_ns()}"
@@ -21,30 +29,35 @@ class Timer:
 
     def __exit__(self, exc_type, exc_value, exc_trace):
         self.toc()
-        self._duration.FromNanoseconds(self._end.ToNanoseconds() - self._start.ToNanoseconds())
 
     def tic(self):
-        self._start.GetCurrentTime()
+        self._started_ns = time_ns()
+        self._tic_ns = perf_counter_ns()
         self.running = True
         return self
 
     def toc(self):
-        self._end.GetCurrentTime()
+        self._toc_ns = perf_counter_ns()
         self.running = False
         return self
 
     def started(self) -> Timestamp:
-        return self._start
+        started = Timestamp()
+        started.FromNanoseconds(self._started_ns)
+        return started
 
     def started_ns(self) -> int:
-        return self.started().ToNanoseconds()
+        return self._started_ns
 
     def started_iso(self) -> str:
         return self.started().ToJsonString()
 
     def duration(self) -> Duration:
-        self._duration.FromNanoseconds(self._end.ToNanoseconds() - self._start.ToNanoseconds())
-        return self._duration
+        duration = Duration()
+        duration.FromNanoseconds(self.duration_ns())
+        return duration
 
     def duration_ns(self) -> int:
-        return self.duration().ToNanoseconds()
+        """elapsed nanoseconds, up to now if the timer is still running"""
+        end = perf_counter_ns() if self.running else self._toc_ns
+        return end - self._tic_ns
@@ -0,0 +1,136 @@
+from logging import getLogger
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+import signal
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = getLogger(__name__)
+
+# don't restart a worker more often than this (seconds), so a worker that
+# can't start (e.g. a bad bind) doesn't turn into a fork loop
+RESTART_INTERVAL = 1.0
+
+# index of the current worker process, None outside of workers
+_worker_index: Optional[int] = None
+
+
+def worker_index() -> Optional[int]:
+    """the index of this worker process (0..workers-1), or None if this
+    process isn't a supervised worker"""
+    return _worker_index
+
+
+def _interrupt(signum: int, frame: Any) -> None:
+    raise KeyboardInterrupt()
+
+
+def _run_worker(target: Callable[..., None], args: Tuple[Any, ...], index: int) -> None:
+    """worker entrypoint: shut down gracefully on SIGTERM (from the
+    supervisor) and leave terminal interrupts to the supervisor"""
+    global _worker_index
+    _worker_index = index
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        target(*args)
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerSupervisor:
+    """
+    Runs `target(*args)` in `workers` forked processes, restarting any
+    that exit while the supervisor is running and passing shutdown on to
+    them (SIGTERM, then SIGKILL after `grace_period`). Each worker is a
+    full server with its own event loop; they share a port through
+    SO_REUSEPORT, so the kernel spreads connections across them.
+
+    Workers are forked, so nothing gRPC-related should be started in
+    the supervising process before `run`.
+    """
+
+    def __init__(
+        self,
+        target: Callable[..., None],
+        args: Tuple[Any, ...] = (),
+        workers: int = 2,
+        grace_period: int = 5,
+    ) -> None:
+        self.target = target
+        self.args = args
+        self.workers = workers
+        self.grace_period = grace_period
+        self.processes: Dict[int, BaseProcess] = {}
+        self._started: Dict[int, float] = {}
+        self._context = get_context("fork")
+        self._stopping = False
+
+    def start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self.target, self.args, index),
+            name=f"extproc-worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+        self._started[index] = monotonic()
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self.start_worker(index)
+
+    def check(self) -> int:
+        """restart workers that have exited; returns how many were restarted"""
+        restarted = 0
+        for index, process in list(self.processes.items()):
+            if self._stopping or process.is_alive():
+                continue
+            if monotonic() - self._started[index] < RESTART_INTERVAL:
+                continue
+            logger.warning(
+                f"Worker {index} (pid {process.pid}) exited with {process.exitcode}; restarting"
+            )
+            process.close()
+            self.start_worker(index)
+            restarted += 1
+        return restarted
+
+    def stop(self, grace_period: Optional[int] = None) -> None:
+        """stop all workers, waiting up to the grace period before killing"""
+        self._stopping = True
+        grace_period = self.grace_period if grace_period is None else grace_period
+        logger.info("Stopping workers...")
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = monotonic() + grace_period + 1
+        for process in self.processes.values():
+            process.join(max(0.0, deadline - monotonic()))
+            if process.is_alive():
+                logger.warning(f"Killing worker {process.name} (pid {process.pid})")
+                process.kill()
+                process.join()
+
+    def _request_stop(self, signum: int, frame: Any) -> None:
+        self._stopping = True
+
+    def run(self) -> None:
+        """start workers and supervise them until SIGINT/SIGTERM"""
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        self.start()
+        try:
+            while not self._stopping:
+                # wake up when a (live) worker exits, or periodically to
+                # restart ones that exited too recently to restart before
+                alive = [p.sentinel for p in self.processes.values() if p.is_alive()]
+                if alive:
+                    wait(alive, timeout=RESTART_INTERVAL)
+                else:
+                    sleep(RESTART_INTERVAL)
+                self.check()
+        finally:
+            self.stop()
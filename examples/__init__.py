@@ -1,4 +1,5 @@
 from .body_modify import BodyModifyExtProcService  # noqa: F401
+from .chained import ChainedExamplesExtProcService  # noqa: F401
 from .context import CtxExtProcService  # noqa: F401
 from .decorated import DecoratedExtProcService  # noqa: F401
 from .digest import DigestExtProcService  # noqa: F401
@@ -6,3 +7,4 @@ from .echo import EchoExtProcService  # noqa: F401,E402
 from .llm_proxy import LLMProxyExtProcService  # noqa: F401
 from .timer import TimerExtProcService  # noqa: F401
 from .trivial import TrivialExtProcService  # noqa: F401
+from .upload_guard import UploadGuardExtProcService  # noqa: F401
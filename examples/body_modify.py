@@ -6,11 +6,11 @@
 # 2. Modifies the value of a key in the request JSON
 # 3. Adds a header to indicate the body was modified
 
-import json
 import logging
-from typing import Dict
+from typing import Any, Dict
 
-from envoy_extproc_sdk import BaseExtProcService, ext_api, serve
+from envoy_extproc_sdk import BaseExtProcService, ext_api, RequestContext, serve
+from envoy_extproc_sdk.util.jsonbody import JSONMembers
 from grpc import ServicerContext
 
 BODY_MODIFIED_HEADER = "x-body-modified"
@@ -23,7 +23,7 @@ class BodyModifyExtProcService(BaseExtProcService):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         # Skip processing if not specifically targeting this service via path
@@ -39,7 +39,7 @@ class BodyModifyExtProcService(BaseExtProcService):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         if not request["path"].startswith("/body-modify"):
@@ -47,26 +47,24 @@ class BodyModifyExtProcService(BaseExtProcService):
 
         if request.get("content_type") and "application/json" in request["content_type"]:
             try:
-                body_str = body.body.decode("utf-8")
-                json_body = json.loads(body_str)
+                # scanned once, for reading the fields and for patching them
+                fields = JSONMembers(body.body)
 
-                # Track modifications
-                modified = False
+                values: Dict[str, Any] = {}
+                rename: Dict[str, str] = {}
 
                 # Rename a key (e.g., 'user_id' -> 'userId')
-                if "user_id" in json_body:
-                    json_body["userId"] = json_body.pop("user_id")
-                    modified = True
+                if "user_id" in fields:
+                    rename["user_id"] = "userId"
 
                 # Modify a value (e.g., add prefix to 'name' field)
-                if "name" in json_body:
-                    json_body["name"] = f"modified-{json_body['name']}"
-                    modified = True
+                if "name" in fields:
+                    values["name"] = f"modified-{fields.get('name')}"
 
-                if modified:
-                    new_body = json.dumps(json_body).encode("utf-8")
+                if values or rename:
+                    new_body = fields.patch(values, rename=rename)
 
-                    response.body_mutation.body = new_body
+                    self.set_body(response, new_body)
 
                     # When working with Envoy ExtProc, we don't set the content-length header
                     # as Envoy uses transfer-encoding: chunked when body is modified.
@@ -76,17 +74,17 @@ class BodyModifyExtProcService(BaseExtProcService):
                     self.add_header(response, BODY_MODIFIED_HEADER, "true")
                     request["body_modified"] = True
 
-            except (json.JSONDecodeError, UnicodeDecodeError):
+            except (ValueError, UnicodeDecodeError):
                 logger.warning("Failed to decode JSON body")
                 pass
-        logger.debug(f"response: {response}")
+        logger.debug("response: %s", response)
         return response
 
     async def process_response_headers(
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         if not request.get("path", "").startswith("/body-modify"):
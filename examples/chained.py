@@ -0,0 +1,33 @@
+# ChainedExamplesExtProcService
+#
+# This ExternalProcessor runs the trivial, timer and digest examples
+# in order, within a single ext_proc filter and gRPC stream, instead
+# of configuring one envoy ext_proc filter for each of them. Each
+# processor keeps its own request context and sees the headers and
+# bodies as modified by the ones before it, and their header
+# mutations are merged into one response per phase.
+
+from envoy_extproc_sdk import ChainedExtProcService, serve
+
+from .digest import DigestExtProcService
+from .timer import TimerExtProcService
+from .trivial import TrivialExtProcService
+
+
+class ChainedExamplesExtProcService(ChainedExtProcService):
+    def __init__(self) -> None:
+        super().__init__(
+            TrivialExtProcService(),
+            TimerExtProcService(),
+            DigestExtProcService(),
+        )
+
+
+if __name__ == "__main__":
+
+    import logging
+
+    FORMAT = "%(asctime)s : %(levelname)s : %(message)s"
+    logging.basicConfig(level=logging.INFO, format=FORMAT, handlers=[logging.StreamHandler()])
+
+    serve(service=ChainedExamplesExtProcService())
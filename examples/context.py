@@ -2,10 +2,8 @@
 #
 # TBD
 
-from json import loads
-from typing import Dict
-
-from envoy_extproc_sdk import BaseExtProcService, ext_api, serve
+from envoy_extproc_sdk import BaseExtProcService, ext_api, RequestContext, serve
+from envoy_extproc_sdk.util.codec import loads
 from grpc import ServicerContext
 
 CONTEXT_ID_HEADER = "x-context-id"
@@ -16,7 +14,7 @@ class CtxExtProcService(BaseExtProcService):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         request["cid"] = self.get_header(headers, CONTEXT_ID_HEADER)
@@ -27,7 +25,7 @@ class CtxExtProcService(BaseExtProcService):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         if request.get("cid", None):
@@ -39,11 +37,11 @@ class CtxExtProcService(BaseExtProcService):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         if request.get("cid", None):
-            data = loads(body.body.decode())
+            data = loads(body.body)
             path = data["path"]
             assert path == request["path"]
             self.add_header(response, CONTEXT_ID_HEADER, request["cid"])
@@ -14,9 +14,13 @@
 # for a specific phase. The decorated function must only match the
 # type/signature of a handler to work.
 
-from typing import Dict
-
-from envoy_extproc_sdk import BaseExtProcService, ext_api, ExtProcPhase, serve
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    ext_api,
+    ExtProcPhase,
+    RequestContext,
+    serve,
+)
 from grpc import ServicerContext
 
 from .digest import digest_headers
@@ -31,7 +35,7 @@ DecoratedExtProcService = BaseExtProcService(name="DecoratedExtProcService")
 def start_digest(
     headers: ext_api.HttpHeaders,
     context: ServicerContext,
-    request: Dict,
+    request: RequestContext,
     response: ext_api.CommonResponse,
 ) -> ext_api.CommonResponse:
     request["tenant"] = BaseExtProcService.get_header(headers, TENANT_ID_HEADER)
@@ -48,7 +52,7 @@ def start_digest(
 def complete_digest(
     body: ext_api.HttpBody,
     context: ServicerContext,
-    request: Dict,
+    request: RequestContext,
     response: ext_api.CommonResponse,
 ) -> ext_api.CommonResponse:
     request["digest"].update(body.body)
@@ -6,19 +6,21 @@
 # hex form of that digest to upstreams and back to the caller
 # via a header `x-request-digest`. This is another example of
 # storing an _object_ in the request context, like the timer
-# service TimerExtProcService.
+# service TimerExtProcService. Hashing large bodies is CPU work, so the
+# body handler runs in a thread pool instead of on the event loop (hashlib
+# releases the GIL while it hashes, so bodies hash in parallel).
 
 from hashlib import sha256
-from typing import Any, Dict
+from typing import Any
 
-from envoy_extproc_sdk import BaseExtProcService, ext_api, serve
+from envoy_extproc_sdk import BaseExtProcService, ext_api, RequestContext, serve
 from grpc import ServicerContext
 
 REQUEST_DIGEST_HEADER = "x-request-digest"
 TENANT_ID_HEADER = "x-tenant-id"
 
 
-def digest_headers(headers: ext_api.HttpHeaders, request: Dict) -> Any:
+def digest_headers(headers: ext_api.HttpHeaders, request: RequestContext) -> Any:
     digest = sha256()
     digest.update(request["tenant"].encode())
     digest.update(request["method"].encode())
@@ -27,11 +29,14 @@ def digest_headers(headers: ext_api.HttpHeaders, request: Dict) -> Any:
 
 
 class DigestExtProcService(BaseExtProcService):
+
+    EXECUTORS = {"request_body": "thread"}
+
     async def process_request_headers(
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
 
@@ -49,11 +54,13 @@ class DigestExtProcService(BaseExtProcService):
 
         return response
 
-    async def process_request_body(
+    # a plain function: in the thread pool it's simply called, with no
+    # event loop needed to run it
+    def process_request_body(
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
 
@@ -68,7 +75,7 @@ class DigestExtProcService(BaseExtProcService):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
 
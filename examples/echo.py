@@ -10,16 +10,16 @@
 # an "error" but rather a signal of the need to stop request
 # processing.
 
-import json
 import re
-from typing import Dict
 
 from envoy_extproc_sdk import (
     BaseExtProcService,
     ext_api,
+    RequestContext,
     serve,
     StopRequestProcessing,
 )
+from envoy_extproc_sdk.util.codec import dumps
 from envoy_extproc_sdk.util.envoy import EnvoyHttpStatusCode
 from grpc import ServicerContext
 
@@ -31,7 +31,7 @@ class EchoExtProcService(BaseExtProcService):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         request["request_headers"] = {}
@@ -43,7 +43,7 @@ class EchoExtProcService(BaseExtProcService):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
 
@@ -60,7 +60,7 @@ class EchoExtProcService(BaseExtProcService):
         headers["content-type"] = "application/json"
 
         immediate_response = self.form_immediate_response(
-            EnvoyHttpStatusCode.OK, headers, json.dumps(response_body)
+            EnvoyHttpStatusCode.OK, headers, dumps(response_body)
         )
         raise StopRequestProcessing(response=immediate_response)
 
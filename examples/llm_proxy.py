@@ -6,13 +6,26 @@
 # 1. Modifies the 'model' parameter in the request JSON
 # 2. Replaces the Authorization header
 # 3. Rewrites the host header
-# 4. Allows streaming responses to flow through unmodified
+# 4. Inspects streaming (server-sent events) responses as they pass,
+#    event by event, optionally restoring the requested model's name
 
-import json
-from logging import getLogger
+from logging import DEBUG, getLogger
 from typing import Any, Dict
 
-from envoy_extproc_sdk import BaseExtProcService, ext_api, serve
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    ext_api,
+    ExtProcPhase,
+    RequestContext,
+    serve,
+)
+from envoy_extproc_sdk.util.envoy import EnvoyProcessingMode
+from envoy_extproc_sdk.util.jsonbody import (
+    get_json_fields,
+    JSONMembers,
+    patch_json_fields,
+)
+from envoy_extproc_sdk.util.sse import rewrite_sse, sse_events, SSEEvent
 from grpc import ServicerContext
 
 LLM_PROXY_HEADER = "x-llm-proxy"
@@ -48,15 +61,34 @@ PATH_REWRITES: Dict[str, Dict[str, str]] = {
 
 
 class LLMProxyExtProcService(BaseExtProcService):
+    # matches the llm_proxy filter's processing_mode in envoy.yaml
+    PROCESSING_MODE = EnvoyProcessingMode(
+        request_header_mode=EnvoyProcessingMode.SEND,
+        response_header_mode=EnvoyProcessingMode.SEND,
+        request_body_mode=EnvoyProcessingMode.BUFFERED,
+        response_body_mode=EnvoyProcessingMode.STREAMED,
+        request_trailer_mode=EnvoyProcessingMode.SKIP,
+        response_trailer_mode=EnvoyProcessingMode.SKIP,
+    )
+    # since it matches, envoy can be told to stop sending the bodies
+    # skip_phases turns off (the filter sets allow_mode_override)
+    MODE_OVERRIDE = True
+
+    # rewrite "model" in streamed events back to the model the client asked
+    # for (instead of the provider's), rather than just inspecting them
+    RESTORE_MODEL = False
+
     async def process_request_headers(
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
-        # Skip processing if not specifically targeting v1 endpoint
+        # Skip processing if not specifically targeting v1 endpoint, and
+        # tell envoy not to bother sending us the bodies
         if not request.get("path", "").startswith(TARGET_ENDPOINT):
+            self.skip_phases(request, ExtProcPhase.request_body, ExtProcPhase.response_body)
             return response
 
         # Store content-type to check if JSON in body phase
@@ -65,7 +97,7 @@ class LLMProxyExtProcService(BaseExtProcService):
 
         # Store the original path for possible rewriting later
         request["original_path"] = request.get("path", "")
-        self.logger.debug(f"Setting original path context: {request['original_path']}")
+        self.logger.debug("Setting original path context: %s", request["original_path"])
 
         # Replace the Authorization header
         auth_header = self.get_header(headers, "authorization")
@@ -83,7 +115,7 @@ class LLMProxyExtProcService(BaseExtProcService):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         original_path = request.get("original_path", "")
@@ -92,16 +124,18 @@ class LLMProxyExtProcService(BaseExtProcService):
 
         if request.get("content_type") and "application/json" in request["content_type"]:
             try:
-                body_str = body.body.decode("utf-8")
-                self.logger.debug(f"ORIGINAL BODY: {body_str}")
-                json_body = json.loads(body_str)
+                debug = self.logger.isEnabledFor(DEBUG)
+                if debug:
+                    self.logger.debug("ORIGINAL BODY: %s", body.body.decode("utf-8"))
+                # scanned once, for reading 'model' and for patching it
+                fields = JSONMembers(body.body)
 
                 # Track modifications
-                modified = False
+                values: Dict[str, Any] = {}
 
                 # Extract and process the 'model' parameter if present
-                if "model" in json_body:
-                    original_model = json_body["model"]
+                if "model" in fields:
+                    original_model = fields.get("model")
                     request["original_model"] = original_model
 
                     # Set routing headers based on the model
@@ -122,11 +156,10 @@ class LLMProxyExtProcService(BaseExtProcService):
                     response.clear_route_cache = True
 
                     # Modify model parameter based on target route
-                    json_body["model"] = model_mapping.get("inference_provider_model", "")
+                    values["model"] = model_mapping.get("inference_provider_model", "")
 
-                    modified = True
                     self.logger.info(
-                        f"Routing {original_model} to {target_route} as {json_body['model']}"
+                        f"Routing {original_model} to {target_route} as {values['model']}"
                     )
 
                     # Check if we need to rewrite the path
@@ -141,19 +174,20 @@ class LLMProxyExtProcService(BaseExtProcService):
                             request["path"] = new_request_path
                             break
 
-                if modified:
-                    new_body = json.dumps(json_body).encode("utf-8")
+                if values:
+                    new_body = fields.patch(values)
 
-                    self.logger.debug(f"MODIFIED BODY SENT: {new_body.decode('utf-8')}")
+                    if debug:
+                        self.logger.debug("MODIFIED BODY SENT: %s", new_body.decode("utf-8"))
 
-                    response.body_mutation.body = new_body
+                    self.set_body(response, new_body)
 
                     # When working with Envoy ExtProc, we don't set the content-length header
                     # as Envoy uses transfer-encoding: chunked when body is modified.
                     self.add_header(response, "x-content-length", str(len(new_body)))
                     request["body_modified"] = True
 
-            except (json.JSONDecodeError, UnicodeDecodeError):
+            except (ValueError, UnicodeDecodeError):
                 self.logger.warning("Failed to decode JSON body")
                 pass
         return response
@@ -162,16 +196,19 @@ class LLMProxyExtProcService(BaseExtProcService):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         original_path = request.get("original_path", "")
         if not original_path.startswith(TARGET_ENDPOINT):
+            self.skip_phases(request, ExtProcPhase.response_body)
             return response
 
         self.logger.debug(
-            f"""Processing response headers for path: {original_path} 
-            with context: {request} and headers: {headers}"""
+            "Processing response headers for path: %s with context: %s and headers: %s",
+            original_path,
+            request,
+            headers,
         )
         # Add proxy header to response
         self.add_header(response, LLM_PROXY_HEADER, "true")
@@ -187,12 +224,62 @@ class LLMProxyExtProcService(BaseExtProcService):
         if original_path != request.get("path", ""):
             self.add_header(response, "x-path-rewritten", "true")
 
-        # Check if this is a streaming response (for demo/debug purposes)
+        # Only streaming responses are inspected, chunk by chunk
         content_type = self.get_header(headers, "content-type")
         if content_type and "text/event-stream" in content_type.lower():
             self.logger.debug("Detected streaming response with content-type: %s", content_type)
+            request["sse_events"] = 0
+        else:
+            self.skip_phases(request, ExtProcPhase.response_body)
         return response
 
+    async def process_response_body_chunk(
+        self,
+        chunk: ext_api.HttpBody,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        # events are parsed as chunks arrive; only a partial event at the
+        # end of a chunk is held on to, never the whole response
+        if self.RESTORE_MODEL and ("original_model" in request):
+            body = rewrite_sse(request, chunk, lambda event: self.restore_model(request, event))
+            self.set_body(response, body)
+        else:
+            for event in sse_events(request, chunk):
+                self.count_event(request, event)
+
+        if chunk.end_of_stream:
+            self.logger.info(
+                f"Streamed {request.get('sse_events', 0)} events"
+                f" (usage: {request.get('usage', 'unknown')})"
+            )
+        return response
+
+    def count_event(self, request: RequestContext, event: SSEEvent) -> None:
+        """count data events, and keep the usage reported (in the last one)"""
+        if (event.data is None) or (event.data == b"[DONE]"):
+            return
+        request["sse_events"] = request.get("sse_events", 0) + 1
+        if b'"usage"' in event.data:
+            try:
+                usage = get_json_fields(event.data, "usage").get("usage")
+            except ValueError:
+                return
+            if usage:
+                request["usage"] = usage
+
+    def restore_model(self, request: RequestContext, event: SSEEvent) -> SSEEvent:
+        """an event with "model" set back to the model requested"""
+        self.count_event(request, event)
+        if (event.data is None) or (b'"model"' not in event.data):
+            return event
+        try:
+            data = patch_json_fields(event.data, {"model": request["original_model"]})
+        except ValueError:
+            return event
+        return event.replace(data=data)
+
 
 def run_processing_server():
     logger = getLogger(__name__)
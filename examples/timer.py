@@ -10,9 +10,7 @@
 # strates using _objects_ in the request context, as opposed to
 # "primitive types" like bools, ints, or strings.
 
-from typing import Dict
-
-from envoy_extproc_sdk import BaseExtProcService, ext_api, serve
+from envoy_extproc_sdk import BaseExtProcService, ext_api, RequestContext, serve
 from envoy_extproc_sdk.util.timer import Timer
 from grpc import ServicerContext
 
@@ -29,7 +27,7 @@ class TimerExtProcService(BaseExtProcService):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         """Start a timer in the context, add a request started header"""
@@ -41,7 +39,7 @@ class TimerExtProcService(BaseExtProcService):
         self,
         body: ext_api.HttpBody,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         """ "End" the timer in the context, add a response duration header"""
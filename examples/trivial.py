@@ -5,9 +5,7 @@
 # `x-request-id` header (with the same value) to both the
 # upstream and back to the caller, as `x-extra-request-id`.
 
-from typing import Dict
-
-from envoy_extproc_sdk import BaseExtProcService, ext_api, serve
+from envoy_extproc_sdk import BaseExtProcService, ext_api, RequestContext, serve
 from grpc import ServicerContext
 
 EXTRA_REQUEST_ID_HEADER = "x-extra-request-id"
@@ -18,7 +16,7 @@ class TrivialExtProcService(BaseExtProcService):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         self.add_header(
@@ -32,7 +30,7 @@ class TrivialExtProcService(BaseExtProcService):
         self,
         headers: ext_api.HttpHeaders,
         context: ServicerContext,
-        request: Dict,
+        request: RequestContext,
         response: ext_api.CommonResponse,
     ) -> ext_api.CommonResponse:
         self.add_header(
@@ -0,0 +1,74 @@
+# UploadGuardExtProcService
+#
+# This example processes request bodies as envoy streams them
+# (`request_body_mode: STREAMED`), chunk by chunk, instead of having
+# envoy buffer whole uploads. It only needs the start of a body: it
+# collects chunks until it has the first few bytes, rejects uploads
+# that look like executables with a 415, and then skips the rest of
+# the body, so the remaining chunks are passed on without calling it.
+
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    body_buffer,
+    ext_api,
+    ExtProcPhase,
+    RequestContext,
+    serve,
+    StopRequestProcessing,
+)
+from envoy_extproc_sdk.util.envoy import (
+    EnvoyHttpStatusCode,
+    EnvoyProcessingMode,
+)
+from grpc import ServicerContext
+
+# the prefix needed to recognize a file, and the signatures rejected
+PREFIX_LENGTH = 4
+EXECUTABLE_SIGNATURES = (b"MZ", b"\x7fELF", b"\xcf\xfa\xed\xfe", b"#!")
+
+
+class UploadGuardExtProcService(BaseExtProcService):
+
+    PROCESSING_MODE = EnvoyProcessingMode(
+        request_header_mode=EnvoyProcessingMode.SEND,
+        response_header_mode=EnvoyProcessingMode.SEND,
+        request_body_mode=EnvoyProcessingMode.STREAMED,
+        response_body_mode=EnvoyProcessingMode.NONE,
+        request_trailer_mode=EnvoyProcessingMode.SKIP,
+        response_trailer_mode=EnvoyProcessingMode.SKIP,
+    )
+
+    async def process_request_body_chunk(
+        self,
+        chunk: ext_api.HttpBody,
+        context: ServicerContext,
+        request: RequestContext,
+        response: ext_api.CommonResponse,
+    ) -> ext_api.CommonResponse:
+        buffer = body_buffer(request, chunk)
+        if (len(buffer) < PREFIX_LENGTH) and not chunk.end_of_stream:
+            return response  # wait for more of the body
+
+        if buffer.view()[:PREFIX_LENGTH].tobytes().startswith(EXECUTABLE_SIGNATURES):
+            raise StopRequestProcessing(
+                self.form_immediate_response(
+                    EnvoyHttpStatusCode.UnsupportedMediaType,
+                    {"content-type": "text/plain"},
+                    "executable uploads are not allowed",
+                ),
+                reason="executable upload",
+            )
+
+        # seen enough: let the rest of the body through untouched
+        self.skip_phases(request, ExtProcPhase.request_body)
+        return response
+
+
+if __name__ == "__main__":
+
+    import logging
+
+    FORMAT = "%(asctime)s : %(levelname)s : %(message)s"
+    logging.basicConfig(level=logging.INFO, format=FORMAT, handlers=[logging.StreamHandler()])
+
+    serve(service=UploadGuardExtProcService())
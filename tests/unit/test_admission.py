@@ -0,0 +1,121 @@
+from typing import AsyncIterator, cast, List
+
+from envoy_extproc_sdk import BaseExtProcService, ext_api, ExtProcPhase
+from envoy_extproc_sdk.admission import (
+    AdmissionController,
+    AIMDLimit,
+    ConcurrencyLimit,
+    get_admission_controller,
+)
+from envoy_extproc_sdk.testing import envoy_body, envoy_headers
+from envoy_extproc_sdk.util.envoy import (
+    EnvoyHttpStatusCode,
+    EnvoyProcessingMode,
+)
+from grpc import ServicerContext
+import pytest
+
+
+def test_concurrency_limit() -> None:
+    limit = ConcurrencyLimit(limit=2)
+    assert limit.acquire() and limit.acquire()
+    assert not limit.acquire()
+    assert (limit.in_use, limit.rejected) == (2, 1)
+    limit.release()
+    assert limit.acquire()
+
+    with pytest.raises(ValueError):
+        ConcurrencyLimit(limit=None)
+
+
+def test_aimd_limit() -> None:
+    limit = AIMDLimit(limit=10, min_limit=2, target_latency_ms=10, backoff=0.5)
+    assert limit.limit == 10
+    limit.observe(20_000_000)
+    assert limit.limit == 5
+    for _ in range(5):
+        limit.observe(20_000_000)
+    assert limit.limit == 2
+
+    # within the target, but hardly used: no reason to grow
+    limit.observe(1_000_000)
+    assert limit.limit == 2
+    limit.acquire()
+    limit.acquire()
+    for _ in range(3):
+        limit.observe(1_000_000)
+    assert limit.limit == 3
+    for _ in range(100):
+        limit.acquire()
+        limit.observe(1_000_000)
+    assert limit.limit == 10
+
+    with pytest.raises(ValueError):
+        AIMDLimit(limit=10, backoff=1)
+
+
+def test_get_admission_controller() -> None:
+    controller = get_admission_controller("off")
+    assert type(controller) is AdmissionController
+    assert all(controller.acquire() for _ in range(100))
+    with pytest.raises(ValueError):
+        get_admission_controller("fifo")
+
+
+async def one_request() -> AsyncIterator[ext_api.ProcessingRequest]:
+    yield ext_api.ProcessingRequest(request_headers=envoy_headers(headers=[(":path", "/")]))
+    yield ext_api.ProcessingRequest(request_body=envoy_body(body="body"))
+
+
+@pytest.mark.asyncio
+async def test_shed_streams_fail_closed() -> None:
+    P = BaseExtProcService(admission=ConcurrencyLimit(limit=1))
+    handled: List[str] = []
+
+    @P.process(ExtProcPhase.request_headers)
+    def headers(headers, context, request, response):  # type: ignore
+        handled.append(request.path)
+        return response
+
+    admitted = P.Process(one_request(), cast(ServicerContext, None))
+    assert (await admitted.__anext__()).HasField("request_headers")
+
+    responses = [r async for r in P.Process(one_request(), cast(ServicerContext, None))]
+    assert len(responses) == 1
+    status = responses[0].immediate_response.status.code
+    assert status == EnvoyHttpStatusCode.ServiceUnavailable
+    assert handled == ["/"]
+
+    await admitted.aclose()
+    assert P.admission.in_use == 0
+    responses = [r async for r in P.Process(one_request(), cast(ServicerContext, None))]
+    assert [r.WhichOneof("response") for r in responses] == ["request_headers", "request_body"]
+    assert handled == ["/", "/"]
+
+
+@pytest.mark.asyncio
+async def test_shed_streams_fail_open() -> None:
+    P = BaseExtProcService(admission=ConcurrencyLimit(limit=1))
+    P.FAIL_OPEN = True
+    P.MODE_OVERRIDE = True
+    handled: List[str] = []
+
+    @P.process(ExtProcPhase.request_body)
+    def body(body, context, request, response):  # type: ignore
+        handled.append(body.body)
+        return P.set_body(response, b"changed")
+
+    admitted = P.Process(one_request(), cast(ServicerContext, None))
+    await admitted.__anext__()
+
+    responses = [r async for r in P.Process(one_request(), cast(ServicerContext, None))]
+    assert [r.WhichOneof("response") for r in responses] == ["request_headers", "request_body"]
+    # passed on unprocessed, and envoy is told not to send anything else
+    assert responses[0].mode_override.request_body_mode == EnvoyProcessingMode.NONE
+    assert responses[0].mode_override.response_header_mode == EnvoyProcessingMode.SKIP
+    assert not responses[1].request_body.response.HasField("body_mutation")
+    assert handled == []
+    assert P.admission.rejected == 1
+
+    responses = [r async for r in admitted]
+    assert responses[0].request_body.response.body_mutation.body == b"changed"
@@ -1,10 +1,16 @@
 from typing import cast, Dict, Optional
 
-from envoy_extproc_sdk import BaseExtProcService
-from envoy_extproc_sdk.testing import AsEnvoyExtProc, envoy_body, envoy_headers
+from envoy_extproc_sdk import BaseExtProcService, ExtProcPhase
+from envoy_extproc_sdk.testing import (
+    AsEnvoyExtProc,
+    envoy_body,
+    envoy_headers,
+    envoy_set_headers_to_dict,
+)
 from envoy_extproc_sdk.util.envoy import (
     EnvoyHeaderValue,
     EnvoyHeaderValueOption,
+    EnvoyProcessingMode,
     ext_api,
 )
 from grpc import ServicerContext
@@ -312,3 +318,65 @@ async def test_process_response_trailers(trailers: ext_api.HttpTrailers) -> None
         trailers, cast(ServicerContext, None), {}, response
     )
     assert isinstance(response, ext_api.TrailersResponse)
+
+
+@pytest.mark.asyncio
+async def test_decorator_updates_dispatch() -> None:
+    p = BaseExtProcService()
+    assert p._dispatch["request_headers"].is_coroutine
+
+    @p.process(ExtProcPhase.request_headers)
+    def handler(headers, context, request, response):
+        return p.add_header(response, "x-handled", "true")
+
+    dispatch = p._dispatch["request_headers"]
+    assert dispatch.action is handler
+    assert not dispatch.is_coroutine
+
+    async for r in p.Process(AsEnvoyExtProc(), FakeServicerContext()):
+        if r.WhichOneof("response") == "request_headers":
+            assert envoy_set_headers_to_dict(r.request_headers.response) == {"x-handled": "true"}
+
+
+@pytest.mark.asyncio
+async def test_mode_override_skips_unhandled_phases() -> None:
+    p = BaseExtProcService()
+    responses = [r async for r in p.Process(AsEnvoyExtProc(), FakeServicerContext())]
+    # opt-in: the override is only right if PROCESSING_MODE matches envoy's
+    assert all(not r.HasField("mode_override") for r in responses)
+
+    p.MODE_OVERRIDE = True
+    responses = [r async for r in p.Process(AsEnvoyExtProc(), FakeServicerContext())]
+    assert len(responses) == 6
+    assert responses[0].HasField("mode_override")
+    mode = responses[0].mode_override
+    assert mode.request_body_mode == EnvoyProcessingMode.NONE
+    assert mode.response_body_mode == EnvoyProcessingMode.NONE
+    assert mode.response_header_mode == EnvoyProcessingMode.SEND
+    assert all(not r.HasField("mode_override") for r in responses[1:])
+
+
+@pytest.mark.asyncio
+async def test_skip_phases_per_request() -> None:
+    p = BaseExtProcService()
+    p.MODE_OVERRIDE = True
+    calls = []
+
+    @p.process(ExtProcPhase.request_headers)
+    def headers_handler(headers, context, request, response):
+        p.skip_phases(request, ExtProcPhase.request_body)
+        return response
+
+    @p.process(ExtProcPhase.request_body)
+    def body_handler(body, context, request, response):
+        calls.append(body)
+        return response
+
+    # request_body is handled, so only turned off for this request
+    assert p._mode_override is not None
+    assert p._mode_override.request_body_mode == EnvoyProcessingMode.BUFFERED
+
+    responses = [r async for r in p.Process(AsEnvoyExtProc(), FakeServicerContext())]
+    assert responses[0].mode_override.request_body_mode == EnvoyProcessingMode.NONE
+    assert responses[1].WhichOneof("response") == "request_body"
+    assert not calls
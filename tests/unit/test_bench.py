@@ -0,0 +1,90 @@
+import json
+
+from envoy_extproc_sdk import BaseExtProcService, ExtProcPhase
+from envoy_extproc_sdk.bench import (
+    main,
+    percentile,
+    run_benchmark,
+    STREAM,
+    synthetic_exchange,
+)
+from envoy_extproc_sdk.tracing import NoopTracer
+import pytest
+
+
+def test_synthetic_exchange() -> None:
+    E = synthetic_exchange(header_count=10, body_size=100, response_body_size=10)
+    request_headers = E.messages[0].request_headers.headers.headers
+    assert len([h for h in request_headers if not h.key.startswith(":")]) == 10
+    assert len(E.messages[1].request_body.body) == 100
+    response_headers = E.messages[3].response_headers.headers.headers
+    assert len([h for h in response_headers if not h.key.startswith(":")]) == 10
+    assert len(E.messages[4].response_body.body) == 10
+
+    other = synthetic_exchange(body=b"{}")
+    assert other.messages[1].request_body.body == other.messages[4].response_body.body == b"{}"
+    ids = [
+        [h.value for h in e.messages[0].request_headers.headers.headers if h.key == "x-request-id"]
+        for e in (E, other)
+    ]
+    assert ids[0] != ids[1]
+
+
+def test_percentile() -> None:
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == (
+        50,
+        99,
+        100,
+    )
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) == 0
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark() -> None:
+    P = BaseExtProcService()
+    seen = []
+
+    @P.process(ExtProcPhase.request_body)
+    def body(body, context, request, response):  # type: ignore
+        seen.append(len(body.body))
+        return response
+
+    result = await run_benchmark(
+        P, requests=20, concurrency=4, warmup=5, allocation_requests=5, body_size=64
+    )
+    assert seen == [64] * 30
+    assert len(result.latencies_ns["request_body"]) == len(result.latencies_ns[STREAM]) == 20
+    assert len(result.latencies_ns) == 7
+    assert result.throughput > 0
+    assert len(result.allocated_bytes) == 5
+    summary = result.summary()
+    assert summary["latency"][STREAM]["p99_ms"] >= summary["latency"][STREAM]["p50_ms"] > 0
+    assert "request_body" in result.report()
+
+    with pytest.raises(ValueError):
+        await run_benchmark(P, requests=0)
+
+
+@pytest.mark.asyncio
+async def test_base_service_retains_nothing() -> None:
+    # neither the exchanges nor the benchmark's own bookkeeping count (the
+    # tracer is off, or with DD_TRACE_ENABLED its buffered spans would)
+    result = await run_benchmark(
+        BaseExtProcService(tracer=NoopTracer()),
+        requests=50,
+        concurrency=1,
+        warmup=10,
+        allocation_requests=200,
+    )
+    assert result.retained_bytes is not None and result.retained_bytes < 8
+    assert result.retained_blocks == 0
+
+
+def test_main(capsys: pytest.CaptureFixture) -> None:
+    result = main(["-n", "10", "-c", "2", "--warmup", "0", "--allocations", "0", "--json"])
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["requests"] == 10
+    assert "allocations" not in summary
+    assert not result.allocated_bytes
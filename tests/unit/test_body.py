@@ -0,0 +1,122 @@
+from typing import AsyncIterator, cast, List
+
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    body_buffer,
+    BodyBuffer,
+    BodyTooLarge,
+    ext_api,
+    ExtProcPhase,
+    RequestContext,
+)
+from envoy_extproc_sdk.testing import envoy_body, envoy_headers
+from envoy_extproc_sdk.util.envoy import EnvoyHttpStatusCode
+from grpc import ServicerContext
+import pytest
+
+BODY = b"first line\r\nsecond line\r\n\r\nlast"
+
+
+def buffer_of(*chunks: bytes, **kwargs) -> BodyBuffer:  # type: ignore
+    buffer = BodyBuffer(**kwargs)
+    for chunk in chunks:
+        buffer.append(chunk)
+    return buffer
+
+
+def test_chunks_are_not_copied() -> None:
+    chunks = [b"ab", b"", b"cd"]
+    buffer = buffer_of(*chunks)
+    assert len(buffer) == 4
+    assert [view.obj for view in buffer.chunks()] == [chunks[0], chunks[2]]
+    assert buffer.view() == b"abcd"
+    assert buffer.tobytes() == b"abcd"
+    # joined once
+    assert buffer.view().obj is buffer.view().obj
+
+    assert buffer_of(b"one").view().obj == b"one"
+    assert buffer_of().view() == b""
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 100])
+def test_find_across_chunks(size: int) -> None:
+    buffer = buffer_of(*[BODY[i : i + size] for i in range(0, len(BODY), size)])
+    for sub in (b"\r\n", b"\r\n\r\n", b"line", b"last", b"x", b"t\r\ns", b"first line"):
+        for start in range(len(BODY) + 1):
+            assert buffer.find(sub, start) == BODY.find(sub, start), (sub, start)
+    assert buffer.find(b"") == 0
+    assert buffer.find(b"", len(BODY) + 1) == -1
+
+
+def test_max_size() -> None:
+    buffer = BodyBuffer(max_size=4)
+    buffer.append(b"1234")
+    with pytest.raises(BodyTooLarge) as error:
+        buffer.append(b"5")
+    assert error.value.response.status.code == EnvoyHttpStatusCode.PayloadTooLarge
+    assert (error.value.size, error.value.max_size) == (5, 4)
+    assert len(buffer) == 0
+
+
+def test_spill_to_file(tmp_path) -> None:  # type: ignore
+    buffer = BodyBuffer(spill_threshold=8, spill_dir=str(tmp_path))
+    buffer.append(BODY[:5])
+    assert not buffer.spilled
+    assert buffer.append(BODY[5:10]).append(BODY[10:]).spilled
+    assert len(buffer) == len(BODY)
+    assert buffer.view() == BODY
+    assert buffer.find(b"\r\n\r\n") == BODY.find(b"\r\n\r\n")
+    assert b"".join(buffer.chunks()) == BODY
+
+    # appending after mapping remaps
+    buffer.append(b"!")
+    assert buffer.tobytes() == BODY + b"!"
+    with buffer:
+        pass
+    assert len(buffer) == 0 and not buffer.spilled
+
+
+def test_body_buffer_in_context() -> None:
+    request = RequestContext()
+    request.phase = "request_body"
+    buffer = body_buffer(request, envoy_body(body=b"ab"))
+    assert "__request_body_buffer" in request
+    assert body_buffer(request, envoy_body(body=b"cd")) is buffer
+    last = ext_api.HttpBody(body=b"ef", end_of_stream=True)
+    assert body_buffer(request, last).tobytes() == b"abcdef"
+    assert "__request_body_buffer" not in request
+
+    body_buffer(request, envoy_body(body=b"ab"))
+    BaseExtProcService.skip_phases(request, ExtProcPhase.request_body)
+    assert "__request_body_buffer" not in request
+
+    body_buffer(request, envoy_body(body=b"ab"), max_size=3)
+    with pytest.raises(BodyTooLarge):
+        body_buffer(request, envoy_body(body=b"cd"), max_size=3)
+    assert "__request_body_buffer" not in request
+
+
+async def streamed_request(*chunks: bytes) -> AsyncIterator[ext_api.ProcessingRequest]:
+    yield ext_api.ProcessingRequest(request_headers=envoy_headers(headers=[(":path", "/")]))
+    for i, chunk in enumerate(chunks):
+        yield ext_api.ProcessingRequest(
+            request_body=ext_api.HttpBody(body=chunk, end_of_stream=(i == len(chunks) - 1))
+        )
+
+
+@pytest.mark.asyncio
+async def test_body_too_large_responds_413() -> None:
+    P = BaseExtProcService()
+    lines: List[int] = []
+
+    @P.process(ExtProcPhase.request_body, chunks=True)
+    def chunk(body, context, request, response):  # type: ignore
+        buffer = body_buffer(request, body, max_size=6)
+        lines.append(buffer.find(b"\n"))
+        return response
+
+    E = streamed_request(b"ab", b"c\n", b"def")
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    assert lines == [-1, 3]
+    assert responses[-1].WhichOneof("response") == "immediate_response"
+    assert responses[-1].immediate_response.status.code == EnvoyHttpStatusCode.PayloadTooLarge
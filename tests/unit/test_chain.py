@@ -0,0 +1,278 @@
+from typing import cast, List
+
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    ChainedExtProcService,
+    ext_api,
+    ExtProcPhase,
+    RequestContext,
+    StopRequestProcessing,
+)
+from envoy_extproc_sdk.chain import apply_response, merge_header_mutation
+from envoy_extproc_sdk.settings import (
+    EXTPROCS_APPLIED_HEADER,
+    REVEAL_EXTPROC_CHAIN,
+)
+from envoy_extproc_sdk.testing import (
+    AsEnvoyExtProc,
+    envoy_body,
+    envoy_headers,
+    envoy_set_headers_to_dict,
+)
+from envoy_extproc_sdk.util.envoy import (
+    EnvoyHeaderValue,
+    EnvoyHeaderValueOption,
+    EnvoyHttpStatusCode,
+    EnvoyProcessingMode,
+)
+from examples import ChainedExamplesExtProcService, LLMProxyExtProcService
+from grpc import ServicerContext
+import pytest
+
+
+def mutation(set_headers=(), remove_headers=()) -> ext_api.HeaderMutation:  # type: ignore
+    return ext_api.HeaderMutation(
+        set_headers=[
+            EnvoyHeaderValueOption(header=EnvoyHeaderValue(key=key, value=value))
+            for key, value in set_headers
+        ],
+        remove_headers=list(remove_headers),
+    )
+
+
+def test_merge_header_mutation() -> None:
+    merged = ext_api.HeaderMutation()
+    merge_header_mutation(merged, mutation(set_headers=[("a", "1"), ("b", "1")]))
+    merge_header_mutation(merged, mutation(remove_headers=["b", "c"]))
+    merge_header_mutation(merged, mutation(set_headers=[("c", "2")]))
+    assert [(o.header.key, o.header.value) for o in merged.set_headers] == [
+        ("a", "1"),
+        ("c", "2"),
+    ]
+    assert list(merged.remove_headers) == ["b"]
+
+
+def test_apply_response() -> None:
+    headers = envoy_headers(headers=[("a", "1"), ("b", "1")])
+    response = ext_api.CommonResponse(
+        header_mutation=mutation(set_headers=[("a", "2")], remove_headers=["b"])
+    )
+    applied = apply_response(headers, response)
+    assert applied is not headers
+    assert [(h.key, h.value) for h in applied.headers.headers] == [("a", "2")]
+
+    body = envoy_body(body="before")
+    response = ext_api.CommonResponse()
+    assert apply_response(body, response) is body
+    response.body_mutation.body = b"after"
+    assert apply_response(body, response).body == b"after"
+
+
+@pytest.mark.asyncio
+async def test_chain_runs_processors_in_order() -> None:
+    seen: List[str] = []
+
+    first = BaseExtProcService(name="first")
+    second = BaseExtProcService(name="second")
+
+    @first.process(ExtProcPhase.request_headers)
+    def first_headers(headers, context, request, response):  # type: ignore
+        request["mine"] = "first"
+        return BaseExtProcService.add_header(response, "x-first", "1")
+
+    @first.process(ExtProcPhase.request_body)
+    def first_body(body, context, request, response):  # type: ignore
+        seen.append(request["mine"])
+        response.body_mutation.body = body.body.upper()
+        return response
+
+    @second.process(ExtProcPhase.request_headers)
+    def second_headers(headers, context, request, response):  # type: ignore
+        assert "mine" not in request
+        seen.append(BaseExtProcService.get_header(headers, "x-first"))
+        return BaseExtProcService.add_header(response, "x-second", "2")
+
+    @second.process(ExtProcPhase.request_body)
+    def second_body(body, context, request, response):  # type: ignore
+        seen.append(body.body.decode())
+        return response
+
+    chain = ChainedExtProcService(first, second)
+    chain.MODE_OVERRIDE = True
+    assert chain.name == "first,second"
+    E = AsEnvoyExtProc(
+        request_headers=envoy_headers(headers=[(":path", "/")]),
+        request_body=envoy_body(body="body"),
+    )
+    responses = [r async for r in chain.Process(E, cast(ServicerContext, None))]
+
+    assert envoy_set_headers_to_dict(responses[0].request_headers.response) == {
+        "x-first": "1",
+        "x-second": "2",
+    }
+    assert responses[1].request_body.response.body_mutation.body == b"BODY"
+    assert seen == ["1", "first", "BODY"]
+    if REVEAL_EXTPROC_CHAIN:
+        headers = envoy_set_headers_to_dict(responses[3].response_headers.response)
+        assert headers[EXTPROCS_APPLIED_HEADER] == "first,second"
+
+    # only phases someone handles stay on
+    mode = responses[0].mode_override
+    assert mode.request_body_mode == EnvoyProcessingMode.BUFFERED
+    assert mode.response_body_mode == EnvoyProcessingMode.NONE
+
+
+@pytest.mark.asyncio
+async def test_chain_short_circuits() -> None:
+    called: List[str] = []
+
+    first = BaseExtProcService(name="first")
+    second = BaseExtProcService(name="second")
+
+    @first.process(ExtProcPhase.request_headers)
+    def stop(headers, context, request, response):  # type: ignore
+        called.append("first")
+        raise StopRequestProcessing(
+            BaseExtProcService.form_immediate_response(EnvoyHttpStatusCode.Forbidden, {}),
+        )
+
+    @second.process(ExtProcPhase.request_headers)
+    def never(headers, context, request, response):  # type: ignore
+        called.append("second")
+        return response
+
+    chain = ChainedExtProcService(first, second)
+    E = AsEnvoyExtProc()
+    responses = [r async for r in chain.Process(E, cast(ServicerContext, None))]
+    assert responses[0].WhichOneof("response") == "immediate_response"
+    assert responses[0].immediate_response.status.code == EnvoyHttpStatusCode.Forbidden
+    assert called == ["first"]
+
+
+@pytest.mark.asyncio
+async def test_chain_skips_phases_all_processors_skip() -> None:
+    bodies: List[str] = []
+
+    first = BaseExtProcService(name="first")
+    second = BaseExtProcService(name="second")
+
+    @first.process(ExtProcPhase.request_headers)
+    def skip(headers, context, request: RequestContext, response):  # type: ignore
+        BaseExtProcService.skip_phases(request, ExtProcPhase.request_body)
+        return response
+
+    @first.process(ExtProcPhase.request_body)
+    def first_body(body, context, request, response):  # type: ignore
+        bodies.append("first")
+        return response
+
+    @second.process(ExtProcPhase.request_body)
+    def second_body(body, context, request, response):  # type: ignore
+        bodies.append("second")
+        return response
+
+    chain = ChainedExtProcService(first, second)
+    chain.MODE_OVERRIDE = True
+    responses = [r async for r in chain.Process(AsEnvoyExtProc(), cast(ServicerContext, None))]
+    assert bodies == ["second"]
+    assert responses[0].mode_override.request_body_mode == EnvoyProcessingMode.BUFFERED
+
+    # once every processor handling a phase skips it, so does the stream
+    @second.process(ExtProcPhase.request_headers)
+    def also_skip(headers, context, request: RequestContext, response):  # type: ignore
+        BaseExtProcService.skip_phases(request, ExtProcPhase.request_body)
+        return response
+
+    bodies.clear()
+    chain = ChainedExtProcService(first, second)
+    chain.MODE_OVERRIDE = True
+    responses = [r async for r in chain.Process(AsEnvoyExtProc(), cast(ServicerContext, None))]
+    assert bodies == []
+    assert responses[0].mode_override.request_body_mode == EnvoyProcessingMode.NONE
+
+
+@pytest.mark.asyncio
+async def test_chained_examples() -> None:
+    E = AsEnvoyExtProc(
+        request_headers=envoy_headers(
+            headers=[(":method", "get"), (":path", "/"), ("x-request-id", "abc")]
+        ),
+    )
+    P = ChainedExamplesExtProcService()
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    headers = envoy_set_headers_to_dict(responses[0].request_headers.response)
+    assert headers["x-extra-request-id"] == "abc"
+    assert "X-Request-Started" in headers
+    assert "x-request-digest" in headers
+
+
+@pytest.mark.asyncio
+async def test_chain_shares_standard_headers() -> None:
+    paths: List[str] = []
+
+    first = BaseExtProcService(name="first")
+    second = BaseExtProcService(name="second")
+
+    @first.process(ExtProcPhase.request_headers)
+    def rewrite(headers, context, request, response):  # type: ignore
+        return BaseExtProcService.add_header(response, ":path", "/rewritten")
+
+    # neither handles request_headers, but both see the standard headers
+    @first.process(ExtProcPhase.request_body)
+    def first_body(body, context, request, response):  # type: ignore
+        paths.append(request.get("path"))
+        return response
+
+    @second.process(ExtProcPhase.response_body)
+    def second_body(body, context, request, response):  # type: ignore
+        paths.append(request.get("path"))
+        paths.append(request.get("content_type"))
+        return response
+
+    E = AsEnvoyExtProc(
+        request_headers=envoy_headers(headers=[(":path", "/x"), ("content-type", "text/plain")]),
+        response_headers=envoy_headers(headers=[("content-type", "application/json")]),
+    )
+    chain = ChainedExtProcService(first, second)
+    _ = [r async for r in chain.Process(E, cast(ServicerContext, None))]
+    assert paths == ["/x", "/rewritten", "application/json"]
+
+    # also when no processor handles the headers phase itself
+    paths.clear()
+    chain = ChainedExtProcService(BaseExtProcService(), second)
+    _ = [r async for r in chain.Process(E, cast(ServicerContext, None))]
+    assert paths == ["/x", "application/json"]
+
+
+@pytest.mark.asyncio
+async def test_chain_merges_processing_modes() -> None:
+    streamed = LLMProxyExtProcService()
+    buffered = BaseExtProcService(name="buffered")
+
+    @buffered.process(ExtProcPhase.request_body)
+    def body(body, context, request, response):  # type: ignore
+        return response
+
+    chain = ChainedExtProcService(buffered, streamed)
+    chain.MODE_OVERRIDE = True
+    mode = chain.PROCESSING_MODE
+    assert mode.request_body_mode == EnvoyProcessingMode.BUFFERED
+    assert mode.response_body_mode == EnvoyProcessingMode.STREAMED
+    assert mode.response_header_mode == EnvoyProcessingMode.SEND
+    assert mode.request_trailer_mode == EnvoyProcessingMode.SKIP
+
+    E = AsEnvoyExtProc(request_headers=envoy_headers(headers=[(":path", "/v1/chat")]))
+    responses = [r async for r in chain.Process(E, cast(ServicerContext, None))]
+    assert responses[0].mode_override.response_body_mode != EnvoyProcessingMode.BUFFERED
+
+    # the most demanding body mode wins
+    buffered.PROCESSING_MODE = EnvoyProcessingMode(response_body_mode=EnvoyProcessingMode.BUFFERED)
+    buffered.process(ExtProcPhase.response_body)(body)
+    chain = ChainedExtProcService(buffered, streamed)
+    assert chain.PROCESSING_MODE.response_body_mode == EnvoyProcessingMode.BUFFERED
+
+    # unless the chain is configured otherwise
+    class Configured(ChainedExtProcService):
+        PROCESSING_MODE = EnvoyProcessingMode(response_body_mode=EnvoyProcessingMode.STREAMED)
+
+    assert Configured(buffered, streamed).PROCESSING_MODE == Configured.PROCESSING_MODE
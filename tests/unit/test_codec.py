@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Union
+
+from envoy_extproc_sdk.testing import envoy_body
+from envoy_extproc_sdk.util import codec
+from envoy_extproc_sdk.util.codec import (
+    from_builtins,
+    get_json_codec,
+    JSONCodec,
+    set_json_codec,
+)
+from envoy_extproc_sdk.util.schemas import ChatCompletionRequest, ChatMessage
+import pytest
+
+CHAT = (
+    b'{"model": "gpt-4o", "stream": true, "temperature": 1, "extra": {"ignored": 1},'
+    b' "messages": [{"role": "user", "content": "h\\u00e9llo"}, {"role": "system"}]}'
+)
+
+
+@pytest.fixture(params=["json", "orjson", "msgspec"])
+def json_codec(request: pytest.FixtureRequest) -> JSONCodec:
+    try:
+        return get_json_codec(request.param)
+    except ImportError:
+        pytest.skip(f"{request.param} isn't installed")
+
+
+@pytest.fixture
+def restore_codec() -> Iterator[None]:
+    current = codec.json_codec()
+    yield
+    set_json_codec(current)
+
+
+def test_round_trip(json_codec: JSONCodec) -> None:
+    value = {"a": [1, 2.5, None, True], "é": "ü", "nested": {"b": "c"}}
+    data = json_codec.dumps(value)
+    assert isinstance(data, bytes)
+    assert data == '{"a":[1,2.5,null,true],"é":"ü","nested":{"b":"c"}}'.encode()
+    assert json_codec.loads(data) == value
+    assert json_codec.loads(bytearray(data)) == value
+    assert json_codec.loads(memoryview(data)) == value
+    assert json_codec.loads(data.decode()) == value
+
+
+@pytest.mark.parametrize("data", [b"", b"{", b'{"a": }', b"\xff"])
+def test_invalid(json_codec: JSONCodec, data: bytes) -> None:
+    with pytest.raises(ValueError):
+        json_codec.loads(data)
+
+
+def test_decode_schema(json_codec: JSONCodec) -> None:
+    chat = json_codec.decode(CHAT, ChatCompletionRequest)
+    assert chat == ChatCompletionRequest(
+        model="gpt-4o",
+        messages=[ChatMessage(role="user", content="héllo"), ChatMessage(role="system")],
+        stream=True,
+        temperature=1.0,
+    )
+    with pytest.raises(ValueError):
+        json_codec.decode(b'{"messages": []}', ChatCompletionRequest)
+    with pytest.raises(ValueError):
+        json_codec.decode(b'{"model": 1}', ChatCompletionRequest)
+    with pytest.raises(ValueError):
+        json_codec.decode(b'{"model": "m", "messages": {}}', ChatCompletionRequest)
+    with pytest.raises(ValueError):
+        json_codec.decode(b"[]", ChatCompletionRequest)
+
+
+@dataclass
+class Nested:
+    counts: Dict[str, int]
+    either: Union[int, str]
+    maybe: Optional[List[float]] = None
+
+
+def test_from_builtins() -> None:
+    assert from_builtins({"counts": {"a": 1}, "either": "x"}, Nested) == Nested({"a": 1}, "x")
+    assert from_builtins({"counts": {}, "either": 1, "maybe": [1]}, Nested).maybe == [1.0]
+    with pytest.raises(ValueError):
+        from_builtins({"counts": {"a": "1"}, "either": 1}, Nested)
+    with pytest.raises(ValueError):
+        from_builtins({"counts": {}, "either": None}, Nested)
+    with pytest.raises(ValueError):
+        from_builtins(True, int)
+
+
+def test_get_json_codec() -> None:
+    assert get_json_codec("stdlib").name == "json"
+    assert get_json_codec("auto").name in ("orjson", "msgspec", "json")
+    with pytest.raises(ValueError):
+        get_json_codec("yaml")
+
+
+def test_set_json_codec(restore_codec: None) -> None:
+    assert set_json_codec("json") is codec.json_codec()
+    assert codec.dumps({"a": 1}) == b'{"a":1}'
+    assert codec.loads(b'{"a": 1}') == {"a": 1}
+    assert envoy_body({"a": [1]}).body == b'{"a":[1]}'
+
+    class Upper(JSONCodec):
+        def dumps(self, value):  # type: ignore
+            return super().dumps(value).upper()
+
+    set_json_codec(Upper())
+    assert envoy_body({"a": "b"}).body == b'{"A":"B"}'
@@ -0,0 +1,146 @@
+from collections.abc import MutableMapping
+import copy
+import json
+from typing import cast
+
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    ext_api,
+    ExtProcPhase,
+    RequestContext,
+)
+from envoy_extproc_sdk.testing import (
+    AsEnvoyExtProc,
+    envoy_body,
+    envoy_headers,
+    envoy_set_headers_to_dict,
+)
+from examples import TimerExtProcService
+from examples.timer import REQUEST_DURATION_HEADER, REQUEST_STARTED_HEADER
+from grpc import ServicerContext
+import pytest
+
+
+def test_standard_fields_as_keys() -> None:
+    request = RequestContext()
+    assert request["__id"] == "unknown"
+    assert request["__phase"] == "unknown"
+    assert request["__overhead_ns"] == 0
+    assert request.get("path", "") == ""
+    assert "path" not in request
+
+    request.update({"method": "get", "path": "/api", "__id": "abc"})
+    assert request.method == "get"
+    assert request["path"] == "/api"
+    assert request.id == "abc"
+    assert "path" in request
+
+
+def test_extension_keys() -> None:
+    request = RequestContext()
+    assert request._extra is None
+    assert request.get("tenant") is None
+    with pytest.raises(KeyError):
+        request["tenant"]
+
+    request["tenant"] = "t"
+    assert request["tenant"] == "t"
+    assert "tenant" in request
+    assert request.setdefault("tenant", "u") == "t"
+    assert request.pop("tenant") == "t"
+    assert request.pop("tenant", None) is None
+    assert "tenant" not in request
+
+
+def test_mapping_behaviors() -> None:
+    request = RequestContext({"path": "/api", "tenant": "t"})
+    assert dict(request.items()) == {
+        "path": "/api",
+        "__id": "unknown",
+        "__phase": "unknown",
+        "__overhead_ns": 0,
+        "tenant": "t",
+    }
+    assert request == request.to_dict()
+    assert len(request) == 5
+    assert not hasattr(request, "__dict__")
+
+
+def test_deleting_standard_fields() -> None:
+    request = RequestContext({"path": "/api"})
+    request["__overhead_ns"] = 10
+    del request["__overhead_ns"]
+    request.overhead_ns += 1  # reset to its default, not None
+    assert request.pop("path") == "/api"
+    assert request.path is None
+    with pytest.raises(KeyError):
+        del request["path"]
+    with pytest.raises(KeyError):
+        del request["__id"]
+    with pytest.raises(KeyError):
+        request.pop("path")
+    assert request.pop("path", "default") == "default"
+
+
+def test_copies() -> None:
+    request = RequestContext({"path": "/api", "tenant": "t"})
+    BaseExtProcService.skip_phases(request, ExtProcPhase.request_body)
+    for copied in (request.copy(), copy.copy(request)):
+        assert isinstance(copied, RequestContext)
+        assert copied == request
+        copied["tenant"] = "u"
+        copied["path"] = "/other"
+        BaseExtProcService.skip_phases(copied, ExtProcPhase.response_body)
+        assert request["tenant"] == "t"
+        assert request.path == "/api"
+        assert request.skipped == {"request_body"}
+
+    assert isinstance(request, MutableMapping)
+    assert json.loads(json.dumps(RequestContext({"tenant": "t"}).to_dict()))["tenant"] == "t"
+
+
+@pytest.mark.asyncio
+async def test_process_uses_request_context() -> None:
+    seen = []
+    P = BaseExtProcService()
+
+    @P.process(ExtProcPhase.request_headers)
+    def handler(headers, context, request, response):
+        seen.append(request)
+        return response
+
+    headers = envoy_headers([(":method", "get"), (":path", "/api"), ("x-request-id", "abc")])
+    async for _ in P.Process(AsEnvoyExtProc(request_headers=headers), cast(ServicerContext, None)):
+        pass
+
+    request = seen[0]
+    assert isinstance(request, RequestContext)
+    assert (request.method, request.path, request.id) == ("get", "/api", "abc")
+    assert request.get("content_type", "none") == "none"
+    assert request.overhead_ns > 0
+
+
+@pytest.mark.asyncio
+async def test_handlers_called_with_request_context() -> None:
+    # as the tests calling handlers directly with a plain dict, but with
+    # what Process passes them
+    P = TimerExtProcService()
+    request = RequestContext()
+    headers = envoy_headers([(":method", "get"), (":path", "/api")])
+
+    response = await P.process_request_headers(
+        headers, cast(ServicerContext, None), request, ext_api.CommonResponse()
+    )
+    assert REQUEST_STARTED_HEADER in envoy_set_headers_to_dict(response)
+    assert "timer" in request
+
+    response = await P.process_response_body(
+        envoy_body(), cast(ServicerContext, None), request, ext_api.CommonResponse()
+    )
+    assert REQUEST_DURATION_HEADER in envoy_set_headers_to_dict(response)
+
+    base = BaseExtProcService()
+    response = ext_api.CommonResponse()
+    context = cast(ServicerContext, None)
+    assert await base.process_request_headers(headers, context, request, response) is response
+    assert await base.process_request_body(envoy_body(), context, request, response) is response
@@ -0,0 +1,171 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import cast, List
+
+from envoy_extproc_sdk import BaseExtProcService, ext_api, ExtProcPhase
+from envoy_extproc_sdk.executors import HandlerPools
+from envoy_extproc_sdk.testing import (
+    AsEnvoyExtProc,
+    envoy_body,
+    envoy_headers,
+    envoy_set_headers_to_dict,
+)
+from grpc import ServicerContext
+import pytest
+
+
+def in_process(body, context, request, response):  # type: ignore
+    # runs in a pool process: a copy of the request, no gRPC context
+    request["changed"] = True
+    BaseExtProcService.add_header(response, "x-context", str(context))
+    return BaseExtProcService.add_header(response, "x-body", body.body.decode())
+
+
+class InProcess(BaseExtProcService):
+    EXECUTORS = {"request_body": "process"}
+
+    def process_request_body(self, body, context, request, response):  # type: ignore
+        # runs in a pool process, as a method of a copy of the service
+        return self.add_header(response, "x-processor", f"{self.name} {self.pools.processes}")
+
+
+def exchange() -> AsEnvoyExtProc:
+    return AsEnvoyExtProc(
+        request_headers=envoy_headers(headers=[(":path", "/")]),
+        request_body=envoy_body(body="body"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_thread_executor() -> None:
+    P = BaseExtProcService()
+    threads: List[int] = []
+
+    @P.process(ExtProcPhase.request_body, executor="thread")
+    def body(body, context, request, response):  # type: ignore
+        threads.append(threading.get_ident())
+        request["seen"] = True
+        P.add_header(response, "x-first", "1")
+        return P.add_header(response, "x-first", "2")
+
+    @P.process(ExtProcPhase.response_headers, executor="thread")
+    async def headers(headers, context, request, response):  # type: ignore
+        threads.append(threading.get_ident())
+        await asyncio.sleep(0)
+        return P.add_header(response, "x-seen", str(request["seen"]))
+
+    responses = [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    assert envoy_set_headers_to_dict(responses[1].request_body.response) == {"x-first": "2"}
+    assert envoy_set_headers_to_dict(responses[3].response_headers.response)["x-seen"] == "True"
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
+
+    # the loop the async handler ran on is closed with the pools
+    (loop,) = P.pools._loops
+    P.shutdown()
+    assert loop.is_closed()
+    assert not P.pools._loops
+
+
+@pytest.mark.asyncio
+async def test_process_executor() -> None:
+    P = BaseExtProcService(executors={"request_body": "process"}, pools=HandlerPools(processes=1))
+    P.process(ExtProcPhase.request_body)(in_process)
+
+    @P.process(ExtProcPhase.response_headers)
+    def headers(headers, context, request, response):  # type: ignore
+        assert "changed" not in request
+        return response
+
+    try:
+        responses = [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    finally:
+        P.shutdown()
+    assert envoy_set_headers_to_dict(responses[1].request_body.response) == {
+        "x-context": "None",
+        "x-body": "body",
+    }
+
+
+@pytest.mark.asyncio
+async def test_process_executor_methods() -> None:
+    P = InProcess(name="in-process", pools=HandlerPools(processes=1))
+    try:
+        responses = [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    finally:
+        P.shutdown()
+    # the copy gets new pools of its own (with the default settings)
+    headers = envoy_set_headers_to_dict(responses[1].request_body.response)
+    assert headers == {"x-processor": f"in-process {HandlerPools().processes}"}
+
+
+@pytest.mark.asyncio
+async def test_pools_are_bounded() -> None:
+    pools = HandlerPools(threads=1, backlog=1)
+    pool = cast(ThreadPoolExecutor, pools.pool("thread"))
+    queued: List[int] = []
+
+    def work(data, context, request, response):  # type: ignore
+        queued.append(pool._work_queue.qsize())
+        threading.Event().wait(0.01)
+        return data
+
+    results = await asyncio.gather(
+        *[pools.run("thread", work, False, i, None, None, None) for i in range(5)]
+    )
+    assert results == list(range(5))
+    # one running and at most one waiting in the pool, the rest on the loop
+    assert max(queued) <= 1
+    pools.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_slot_held_until_handler_finishes() -> None:
+    pools = HandlerPools(threads=1, backlog=0)
+    release = threading.Event()
+
+    def blocked(data, context, request, response):  # type: ignore
+        release.wait(5)
+        return data
+
+    task = asyncio.ensure_future(pools.run("thread", blocked, False, 1, None, None, None))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    limit = pools._limit(pools.pool("thread"))
+    assert limit.locked()
+    release.set()
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if not limit.locked():
+            break
+    assert not limit.locked()
+    pools.shutdown()
+
+
+def test_unknown_executor() -> None:
+    with pytest.raises(ValueError):
+        BaseExtProcService(executors={"request_body": "fiber"})
+    with pytest.raises(ValueError):
+        BaseExtProcService().process(ExtProcPhase.request_body, executor="fiber")
+    with pytest.raises(ValueError):
+        BaseExtProcService(executors={"request_bodies": "thread"})
+
+
+def test_executors_by_phase() -> None:
+    class Offloaded(BaseExtProcService):
+        EXECUTORS = {"request_body": "thread"}
+
+        def process_request_body(self, body, context, request, response):  # type: ignore
+            return response
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    P = Offloaded(executors={"response_body": pool})
+    assert P._dispatch["request_body"].executor == "thread"
+    assert P._dispatch["response_body"].executor is pool
+    assert P._dispatch["request_headers"].executor is None
+    assert isinstance(P._dispatch["request_body"].skip_response, ext_api.ProcessingResponse)
+    pool.shutdown()
@@ -0,0 +1,57 @@
+from envoy_extproc_sdk import BaseExtProcService
+from envoy_extproc_sdk.testing import envoy_headers
+from envoy_extproc_sdk.util.envoy import (
+    EnvoyHeaderMap,
+    EnvoyHeaderValue,
+    ext_api,
+)
+from envoy_extproc_sdk.util.headers import HeaderIndex
+
+
+def test_header_index_lookups() -> None:
+    headers = envoy_headers([(":path", "/api"), ("content-type", "application/json")])
+    index = HeaderIndex(headers)
+    assert len(index) == 2
+    assert ":path" in index
+    assert index.get(":path") == "/api"
+    assert index.get("Content-Type") == "application/json"
+    assert index.get_raw("content-type", lower_cased=True) == b"application/json"
+    assert index.get("missing") is None
+    assert index.get_all("missing") == []
+
+
+def test_header_index_multi_and_raw_values() -> None:
+    headers = ext_api.HttpHeaders(
+        headers=EnvoyHeaderMap(
+            headers=[
+                EnvoyHeaderValue(key="x-forwarded-for", raw_value=b"10.0.0.1"),
+                EnvoyHeaderValue(key="X-Forwarded-For", value="10.0.0.2"),
+                EnvoyHeaderValue(key="x-forwarded-for", raw_value=b"10.0.0.3"),
+            ]
+        )
+    )
+    index = HeaderIndex(headers)
+    assert index.get("x-forwarded-for") == "10.0.0.1"
+    assert index.get_raw("x-forwarded-for") == b"10.0.0.1"
+    assert index.get_all("x-forwarded-for") == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert BaseExtProcService.get_header_values(headers, "x-forwarded-for")[-1] == "10.0.0.3"
+
+
+def test_header_index_is_cached_per_message() -> None:
+    headers = envoy_headers([(":path", "/api")])
+    index = HeaderIndex.of(headers)
+    assert HeaderIndex.of(headers) is index
+    assert BaseExtProcService.get_header(headers, ":path") == "/api"
+
+    other = envoy_headers([(":path", "/other")])
+    assert HeaderIndex.of(other) is not index
+    assert BaseExtProcService.get_header(other, ":path") == "/other"
+
+    HeaderIndex.clear()
+    assert HeaderIndex.of(other) is not index
+
+    # headers added to the message since it was indexed aren't missed
+    index = HeaderIndex.of(other)
+    other.headers.headers.add(key="x-added", value="yes")
+    assert BaseExtProcService.get_header(other, "x-added") == "yes"
+    assert HeaderIndex.of(other) is not index
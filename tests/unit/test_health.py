@@ -0,0 +1,158 @@
+import asyncio
+import threading
+from typing import Any, cast, List
+
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    ChainedExtProcService,
+    ext_api,
+    ExtProcPhase,
+)
+from envoy_extproc_sdk.executors import HandlerPools
+from envoy_extproc_sdk.health import (
+    HealthService,
+    LoadMonitor,
+    NOT_SERVING,
+    SERVING,
+)
+from envoy_extproc_sdk.server import create_server
+import grpc
+from grpc import ServicerContext
+from grpc_health_check.v1.health_pb2 import (
+    HealthCheckRequest,
+    HealthCheckResponse,
+)
+from grpc_health_check.v1.health_pb2_grpc import HealthStub
+import pytest
+
+
+class Loaded:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.queued = 0
+
+    def queued_handlers(self) -> int:
+        return self.queued
+
+
+def test_monitor_hysteresis() -> None:
+    service = Loaded()
+    health = HealthService()
+    monitor = LoadMonitor(
+        service,
+        health,
+        max_loop_lag_ms=100,
+        max_in_flight=10,
+        max_queued=None,
+        recover_ratio=0.5,
+        recover_checks=2,
+    )
+    assert not monitor.sample(0)
+    service.queued = 1000  # not checked
+    assert not monitor.sample(100)
+
+    service.in_flight = 11
+    assert monitor.sample(0)
+    assert health.status == NOT_SERVING
+    # under the maximum, but not under half of it
+    service.in_flight = 6
+    assert monitor.sample(0)
+    service.in_flight = 5
+    assert monitor.sample(0)
+    assert monitor.sample(60)  # the lag isn't calm: starts over
+    assert monitor.sample(0)
+    assert not monitor.sample(0)
+    assert health.status == SERVING
+    assert (monitor.loop_lag_ms, monitor.in_flight, monitor.queued) == (0, 5, 1000)
+
+    assert monitor.sample(101)
+    assert health.status == NOT_SERVING
+
+    with pytest.raises(ValueError):
+        LoadMonitor(service, recover_ratio=2)
+
+
+@pytest.mark.asyncio
+async def test_monitor_measures_loop_lag() -> None:
+    monitor = LoadMonitor(object(), interval_ms=1, max_loop_lag_ms=20, recover_checks=1000)
+    monitor.start()
+    await asyncio.sleep(0.01)
+    threading.Event().wait(0.05)  # block the loop
+    await asyncio.sleep(0.01)
+    await monitor.stop()
+    assert monitor.overloaded
+    assert monitor._task is None
+
+
+@pytest.mark.asyncio
+async def test_in_flight_streams() -> None:
+    P = BaseExtProcService()
+    seen: List[int] = []
+
+    @P.process(ExtProcPhase.request_headers)
+    def headers(headers, context, request, response):  # type: ignore
+        seen.append(P.in_flight)
+        return response
+
+    async def messages():  # type: ignore[no-untyped-def]
+        yield ext_api.ProcessingRequest(request_headers=ext_api.HttpHeaders())
+
+    stream = P.Process(messages(), cast(ServicerContext, None))
+    await stream.__anext__()
+    assert seen == [1]
+    other = P.Process(messages(), cast(ServicerContext, None))
+    await other.__anext__()
+    assert seen == [1, 2]
+    await stream.aclose()
+    await other.aclose()
+    assert P.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_queued_handlers() -> None:
+    pools = HandlerPools(threads=1, backlog=1)
+    P = ChainedExtProcService(BaseExtProcService(pools=pools))
+    release = threading.Event()
+
+    def blocked(*args: Any) -> None:
+        release.wait(5)
+
+    tasks = [
+        asyncio.ensure_future(pools.run("thread", blocked, False, None, None, None, None))
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0.01)
+    # one running, one in the pool's queue and one waiting for a slot
+    assert P.queued_handlers() == 2
+    release.set()
+    await asyncio.gather(*tasks)
+    assert P.queued_handlers() == 0
+    P.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_check_and_watch() -> None:
+    health = HealthService()
+    server = create_server(BaseExtProcService(), port=0, uds="@extproc-health", health=health)
+    await server.start()
+    try:
+        async with grpc.aio.insecure_channel("unix-abstract:extproc-health") as channel:
+            stub = HealthStub(channel)
+            response = await stub.Check(HealthCheckRequest())
+            assert response.status == HealthCheckResponse.ServingStatus.SERVING
+
+            watch = stub.Watch(HealthCheckRequest())
+            statuses = [(await watch.read()).status]
+            health.set_status(NOT_SERVING)
+            health.set_status(NOT_SERVING)
+            statuses.append((await watch.read()).status)
+            health.set_status(SERVING)
+            statuses.append((await watch.read()).status)
+            watch.cancel()
+            assert statuses == [SERVING, NOT_SERVING, SERVING]
+
+            response = await stub.Check(HealthCheckRequest())
+            assert response.status == SERVING
+    finally:
+        await server.stop(None)
+    assert not health._watchers
@@ -0,0 +1,176 @@
+import json
+from typing import cast
+
+from envoy_extproc_sdk.testing import AsEnvoyExtProc, envoy_body, envoy_headers
+from envoy_extproc_sdk.util.codec import json_codec, set_json_codec
+from envoy_extproc_sdk.util.jsonbody import (
+    get_json_fields,
+    JSONMembers,
+    patch_json_fields,
+)
+from examples import BodyModifyExtProcService, LLMProxyExtProcService
+from grpc import ServicerContext
+import pytest
+
+BODY = (
+    b'{"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "a \\"}\\" {"}],'
+    b' "stream": true, "n": 1.5e3, "meta": {"tags": ["x", "]"]}, "nothing": null}'
+)
+
+
+def test_members() -> None:
+    members = JSONMembers(BODY)
+    assert list(members.keys()) == ["model", "messages", "stream", "n", "meta", "nothing"]
+    assert members.get("stream") is True
+    assert members.get("messages") == [{"role": "user", "content": 'a "}" {'}]
+    assert members.get("n") == 1500.0
+    assert members.get("meta") == {"tags": ["x", "]"]}
+    assert members.get("nothing", "default") is None
+    assert members.get("missing", "default") == "default"
+
+    assert len(JSONMembers(b" {} ")) == 0
+    assert JSONMembers(b'{"a\\u00e9": 1}').get("aé") == 1
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"[1]",
+        b'"a"',
+        b"",
+        b"{",
+        b'{"a" 1}',
+        b'{"a": }',
+        b'{"a": 1,}',
+        b'{"a": 1} x',
+        b'{"a": [}',
+        b'{"a": [1, 2}}',
+        b'{"a": "b}',
+        b'{"a": tru, "b": [1,,]}',
+        b'{"a\\": 1}',
+    ],
+)
+def test_members_invalid(body: bytes) -> None:
+    with pytest.raises(ValueError):
+        JSONMembers(body)
+    with pytest.raises(ValueError):
+        patch_json_fields(body, {"a": 1})
+
+
+def test_get_json_fields() -> None:
+    assert get_json_fields(BODY, "model", "stream", "missing") == {
+        "model": "gpt-3.5-turbo",
+        "stream": True,
+    }
+    # duplicate keys: the last one wins, as with json.loads
+    assert get_json_fields(b'{"a": 1, "a": 2}', "a") == {"a": 2}
+    with pytest.raises(ValueError):
+        get_json_fields(b"[1, 2]", "a")
+    with pytest.raises(ValueError):
+        get_json_fields(b'{"a": ', "a")
+
+
+@pytest.mark.parametrize("name", ["json", "orjson", "msgspec"])
+def test_get_json_fields_with_each_codec(name: str) -> None:
+    current = json_codec()
+    try:
+        set_json_codec(name)
+    except ImportError:
+        pytest.skip(f"{name} isn't installed")
+    try:
+        assert get_json_fields(BODY, "model", "meta", "nothing", "model", "missing") == {
+            "model": "gpt-3.5-turbo",
+            "meta": {"tags": ["x", "]"]},
+            "nothing": None,
+        }
+        assert get_json_fields(b'{"max-tokens": 5}', "max-tokens") == {"max-tokens": 5}
+        with pytest.raises(ValueError):
+            get_json_fields(b'["model"]', "model")
+    finally:
+        set_json_codec(current)
+
+
+def test_patch() -> None:
+    body = b'{\n  "model": "gpt-3.5-turbo",\n  "messages": [ 1, 2 ]\n}'
+    members = JSONMembers(body)
+    assert members.get("model") == "gpt-3.5-turbo"
+    # patched values are written into the body, the rest is kept as it was
+    assert (
+        members.patch({"model": "gpt-4o"}) == b'{\n  "model": "gpt-4o",\n  "messages": [ 1, 2 ]\n}'
+    )
+    assert members.patch({"n": 2}, remove=["model"]) == b'{\n  "messages": [ 1, 2 ],\n  "n": 2\n}'
+    # patches that change nothing return the body as it was
+    assert members.patch(remove=["missing"], rename={"missing": "x"}) is body
+
+    assert patch_json_fields(b'{"a": 1}', {"b": "é"}) == '{"a": 1, "b": "é"}'.encode()
+    assert patch_json_fields(b'{"a":1}', {"b": [1, 2]}) == b'{"a":1,"b":[1,2]}'
+    assert patch_json_fields(b" { } ", {"b": None}) == b' { "b":null} '
+    assert patch_json_fields(b'{"a": 1, "b": 2}', rename={"a": "c"}) == b'{"c": 1, "b": 2}'
+    assert patch_json_fields(b'{"a": 1, "b": 2, "c": 3}', remove=["a", "c"]) == b'{"b": 2}'
+    assert patch_json_fields(b'{"a": 1, "b": 2}', remove=["a", "b"]) == b"{}"
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        BODY,
+        b'{"a": 1, "a": 2, "b": 3}',
+        b'{"a": 1, "b": 2}',
+        b"{}",
+    ],
+)
+def test_patch_matches_full_parse(body: bytes) -> None:
+    values = {"model": "x", "a": {"nested": True}, "new": None}
+    rename = {"stream": "streaming", "b": "B"}
+    remove = ["messages", "nothing"]
+    expected = {rename.get(k, k): v for k, v in json.loads(body).items()}
+    expected.update(values)
+    for key in remove:
+        expected.pop(key, None)
+
+    patched = json.loads(patch_json_fields(body, values, remove=remove, rename=rename))
+    assert patched == expected
+    assert list(patched) == list(expected)
+
+
+def test_patch_rename_onto_existing_key() -> None:
+    patched = patch_json_fields(b'{"a": 1, "b": 2}', rename={"a": "b"})
+    assert json.loads(patched) == {"b": 2}
+
+
+def test_patch_large_body_in_place() -> None:
+    messages = [{"role": "user", "content": 'say "[hi]" {\\' * 50} for _ in range(200)]
+    body = json.dumps({"model": "a", "messages": messages, "input": [0.5] * 1000}).encode()
+    members = JSONMembers(body)
+    assert list(members.keys()) == ["model", "messages", "input"]
+    assert members.get("messages") == messages
+    patched = members.patch({"model": "b"})
+    assert patched == body.replace(b'"model": "a"', b'"model": "b"', 1)
+
+
+@pytest.mark.asyncio
+async def test_body_modify_example() -> None:
+    E = AsEnvoyExtProc(
+        request_headers=envoy_headers(
+            headers=[(":path", "/body-modify"), ("content-type", "application/json")]
+        ),
+        request_body=envoy_body(body='{"user_id": "12345", "name": "test", "other": [1, 2]}'),
+    )
+    P = BodyModifyExtProcService()
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    body = responses[1].request_body.response.body_mutation.body
+    assert body == b'{"userId": "12345", "name": "modified-test", "other": [1, 2]}'
+
+
+@pytest.mark.asyncio
+async def test_llm_proxy_example() -> None:
+    E = AsEnvoyExtProc(
+        request_headers=envoy_headers(
+            headers=[(":path", "/v1/chat/completions"), ("content-type", "application/json")]
+        ),
+        request_body=envoy_body(body='{"model": "gpt-3.5-turbo", "messages": []}'),
+    )
+    P = LLMProxyExtProcService()
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    body = responses[1].request_body.response.body_mutation.body
+    assert body == b'{"model": "gpt-4o", "messages": []}'
@@ -0,0 +1,133 @@
+import asyncio
+from typing import AsyncIterator, cast
+
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    ext_api,
+    ExtProcPhase,
+    StopRequestProcessing,
+)
+from envoy_extproc_sdk.admission import ConcurrencyLimit
+from envoy_extproc_sdk.metrics import (
+    Counter,
+    ExtProcMetrics,
+    Histogram,
+    MetricsRegistry,
+    start_metrics_server,
+)
+from envoy_extproc_sdk.testing import AsEnvoyExtProc, envoy_body, envoy_headers
+from envoy_extproc_sdk.util.envoy import EnvoyHttpStatusCode
+from grpc import ServicerContext
+import pytest
+
+
+def test_histogram() -> None:
+    histogram = Histogram("latency_seconds", "Latency", ("phase",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value, ("request_headers",))
+    assert histogram.counts[("request_headers",)] == [2, 1, 1]
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{phase="request_headers",le="0.1"} 2',
+        'latency_seconds_bucket{phase="request_headers",le="1"} 3',
+        'latency_seconds_bucket{phase="request_headers",le="+Inf"} 4',
+        'latency_seconds_sum{phase="request_headers"} 2.65',
+        'latency_seconds_count{phase="request_headers"} 4',
+    ]
+    with pytest.raises(ValueError):
+        Histogram("bad", "Unordered", buckets=(1, 0.1))
+
+
+def test_registry() -> None:
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("requests_total", "Requests", ("path",)))
+    counter.inc(('say "hi"\n',))
+    counter.inc(('say "hi"\n',), 2)
+    assert registry.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{path="say \\"hi\\"\\n"} 3\n'
+    )
+    with pytest.raises(ValueError):
+        registry.register(Counter("requests_total", "Again"))
+
+
+@pytest.mark.asyncio
+async def test_service_metrics() -> None:
+    metrics = ExtProcMetrics()
+    P = BaseExtProcService(name="metered", metrics=metrics)
+
+    @P.process(ExtProcPhase.request_body)
+    def body(body, context, request, response):  # type: ignore
+        if body.body == b"stop":
+            raise StopRequestProcessing(
+                P.form_immediate_response(EnvoyHttpStatusCode.Forbidden, {})
+            )
+        return response
+
+    def exchange(body: str) -> AsEnvoyExtProc:
+        return AsEnvoyExtProc(
+            request_headers=envoy_headers(headers=[(":path", "/")]),
+            request_body=envoy_body(body=body),
+        )
+
+    for body_text in ("hello", "stop"):
+        _ = [r async for r in P.Process(exchange(body_text), cast(ServicerContext, None))]
+
+    assert metrics.phase_duration.counts[("metered", "request_body")][-1] == 0
+    assert sum(metrics.phase_duration.counts[("metered", "request_body")]) == 2
+    assert ("metered", "request_headers") not in metrics.phase_duration.counts
+    assert metrics.body_size.sums[("metered", "request_body")] == 9
+    assert metrics.immediate_responses.values == {("metered", "403"): 1}
+    assert sum(metrics.stream_duration.counts[("metered",)]) == 2
+    assert metrics.stream_messages.sums[("metered",)] == 12
+    assert metrics.in_flight.values[("metered",)] == 0
+
+    text = metrics.render()
+    assert 'extproc_immediate_responses_total{processor="metered",status="403"} 1' in text
+    assert 'extproc_stream_messages_count{processor="metered"} 2' in text
+
+
+@pytest.mark.asyncio
+async def test_shed_and_cancelled_streams() -> None:
+    metrics = ExtProcMetrics()
+    P = BaseExtProcService(name="busy", metrics=metrics, admission=ConcurrencyLimit(limit=1))
+
+    async def cancelled() -> AsyncIterator[ext_api.ProcessingRequest]:
+        yield ext_api.ProcessingRequest(request_headers=envoy_headers(headers=[(":path", "/")]))
+        raise asyncio.CancelledError()
+
+    first = P.Process(cancelled(), cast(ServicerContext, None))
+    await first.__anext__()
+    _ = [r async for r in P.Process(cancelled(), cast(ServicerContext, None))]
+    _ = [r async for r in first]
+
+    assert metrics.shed.values == {("busy",): 1}
+    assert metrics.immediate_responses.values == {("busy", "503"): 1}
+    assert metrics.cancelled.values == {("busy",): 1}
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint() -> None:
+    registry = MetricsRegistry()
+    registry.register(Counter("scrapes_total", "Scrapes")).inc()
+    server = await start_metrics_server(0, registry=registry, host="127.0.0.1")
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path: str) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    try:
+        response = await get("/metrics")
+        assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert b"text/plain; version=0.0.4" in response
+        assert response.endswith(b"\r\n\r\n" + registry.render().encode())
+        assert (await get("/")).startswith(b"HTTP/1.1 404")
+    finally:
+        server.close()
+        await server.wait_closed()
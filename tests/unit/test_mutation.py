@@ -0,0 +1,95 @@
+from typing import cast
+
+from envoy_extproc_sdk import BaseExtProcService, ext_api, ExtProcPhase
+from envoy_extproc_sdk.testing import AsEnvoyExtProc
+from envoy_extproc_sdk.util.envoy import (
+    EnvoyHeaderValue,
+    EnvoyHeaderValueOption,
+)
+from envoy_extproc_sdk.util.mutation import (
+    merge_header_mutation,
+    MutationBuilder,
+)
+from grpc import ServicerContext
+import pytest
+
+
+def header_pairs(mutation: ext_api.HeaderMutation):  # type: ignore
+    return [(o.header.key, o.header.value, o.append.value) for o in mutation.set_headers]
+
+
+def test_builder_keys_headers() -> None:
+    response = ext_api.CommonResponse()
+    builder = MutationBuilder(response)
+    assert not builder
+    builder.set_header("X-A", "1").set_header("x-a", "2")
+    builder.append_header("x-b", "1").append_header("x-b", "2")
+    builder.set_header("x-c", "1").remove_header("x-c")
+    builder.remove_header("x-d").set_header("x-d", "1")
+    builder.set_body(b"body")
+    assert builder
+
+    builder.apply()
+    assert header_pairs(response.header_mutation) == [
+        ("x-a", "2", False),
+        ("x-b", "1", True),
+        ("x-b", "2", True),
+        ("x-d", "1", False),
+    ]
+    assert list(response.header_mutation.remove_headers) == ["x-c"]
+    assert response.body_mutation.body == b"body"
+
+    builder = MutationBuilder(response)
+    builder.clear_body()
+    builder.apply()
+    assert response.body_mutation.clear_body
+
+
+def test_merge_replaces_earlier_sets() -> None:
+    merged = ext_api.HeaderMutation(
+        set_headers=[EnvoyHeaderValueOption(header=EnvoyHeaderValue(key="x-a", value="1"))]
+    )
+    merge_header_mutation(
+        merged,
+        ext_api.HeaderMutation(
+            set_headers=[EnvoyHeaderValueOption(header=EnvoyHeaderValue(key="X-A", value="2"))]
+        ),
+    )
+    assert header_pairs(merged) == [("X-A", "2", False)]
+
+
+def test_helpers_outside_handlers_edit_directly() -> None:
+    response = ext_api.CommonResponse()
+    BaseExtProcService.add_header(response, "x-a", "1")
+    BaseExtProcService.add_header(response, "x-a", "2")
+    assert len(response.header_mutation.set_headers) == 2
+
+
+@pytest.mark.asyncio
+async def test_helpers_collect_per_phase() -> None:
+    P = BaseExtProcService()
+
+    @P.process(ExtProcPhase.request_headers)
+    def headers(headers, context, request, response):  # type: ignore
+        P.add_header(response, "x-started", "1")
+        P.add_header(response, "x-started", "2")
+        P.remove_header(response, "authorization")
+        P.add_header(response, "authorization", "Bearer replaced")
+        # nothing is written into the response until the phase is done
+        assert not response.header_mutation.set_headers
+        return response
+
+    @P.process(ExtProcPhase.request_body)
+    def body(body, context, request, response):  # type: ignore
+        P.set_body(response, b"first")
+        P.set_body(response, b"second")
+        return response
+
+    responses = [r async for r in P.Process(AsEnvoyExtProc(), cast(ServicerContext, None))]
+    mutation = responses[0].request_headers.response.header_mutation
+    assert header_pairs(mutation) == [
+        ("x-started", "2", False),
+        ("authorization", "Bearer replaced", False),
+    ]
+    assert not mutation.remove_headers
+    assert responses[1].request_body.response.body_mutation.body == b"second"
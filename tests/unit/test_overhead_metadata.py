@@ -0,0 +1,89 @@
+from typing import cast, Dict
+
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    ChainedExtProcService,
+    ext_api,
+    ExtProcPhase,
+    StopRequestProcessing,
+)
+from envoy_extproc_sdk.testing import AsEnvoyExtProc, envoy_body, envoy_headers
+from envoy_extproc_sdk.util.envoy import EnvoyHttpStatusCode
+from google.protobuf.json_format import MessageToDict
+from grpc import ServicerContext
+import pytest
+
+
+def exchange(body: str = "body") -> AsEnvoyExtProc:
+    return AsEnvoyExtProc(
+        request_headers=envoy_headers(headers=[(":path", "/")]),
+        request_body=envoy_body(body=body),
+    )
+
+
+def reported(response: ext_api.ProcessingResponse) -> Dict:
+    return MessageToDict(response.dynamic_metadata).get("envoy_extproc_sdk", {})
+
+
+def service(name: str) -> BaseExtProcService:
+    P = BaseExtProcService(name=name)
+    P.REPORT_OVERHEAD = True
+
+    @P.process(ExtProcPhase.request_headers)
+    def headers(headers, context, request, response):  # type: ignore
+        return response
+
+    @P.process(ExtProcPhase.request_body)
+    def body(body, context, request, response):  # type: ignore
+        if body.body == b"stop":
+            raise StopRequestProcessing(
+                P.form_immediate_response(EnvoyHttpStatusCode.Forbidden, {})
+            )
+        return response
+
+    return P
+
+
+@pytest.mark.asyncio
+async def test_off_by_default() -> None:
+    P = BaseExtProcService()
+    responses = [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    assert not any(r.HasField("dynamic_metadata") for r in responses)
+
+
+@pytest.mark.asyncio
+async def test_overhead_metadata() -> None:
+    P = service("timed")
+    responses = [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    headers, body = reported(responses[0])["timed"], reported(responses[1])["timed"]
+    assert set(headers["phase_overhead_ns"]) == {"request_headers"}
+    assert set(body["phase_overhead_ns"]) == {"request_headers", "request_body"}
+    assert body["overhead_ns"] == sum(body["phase_overhead_ns"].values()) > 0
+    assert body["phase_overhead_ns"]["request_headers"] == headers["overhead_ns"]
+    # phases without handlers aren't timed, and don't report anything
+    assert not responses[2].HasField("dynamic_metadata")
+
+
+@pytest.mark.asyncio
+async def test_immediate_responses_report_overhead() -> None:
+    P = service("stopping")
+    P.METADATA_NAMESPACE = "timing"
+    responses = [r async for r in P.Process(exchange("stop"), cast(ServicerContext, None))]
+    assert responses[1].HasField("immediate_response")
+    metadata = MessageToDict(responses[1].dynamic_metadata)["timing"]["stopping"]
+    assert set(metadata["phase_overhead_ns"]) == {"request_headers", "request_body"}
+
+
+@pytest.mark.asyncio
+async def test_chain_reports_each_processor() -> None:
+    first, second = service("first"), service("second")
+    first.REPORT_OVERHEAD = second.REPORT_OVERHEAD = False
+    chain = ChainedExtProcService(first, second, name="chain")
+    chain.REPORT_OVERHEAD = True
+
+    responses = [r async for r in chain.Process(exchange(), cast(ServicerContext, None))]
+    metadata = reported(responses[1])
+    assert set(metadata) == {"chain", "first", "second"}
+    for name in ("first", "second"):
+        assert set(metadata[name]["phase_overhead_ns"]) == {"request_headers", "request_body"}
+    assert metadata["chain"]["overhead_ns"] >= metadata["first"]["overhead_ns"]
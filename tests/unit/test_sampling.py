@@ -0,0 +1,43 @@
+import logging
+from typing import cast
+
+from envoy_extproc_sdk import BaseExtProcService, ExtProcPhase
+from envoy_extproc_sdk.testing import AsEnvoyExtProc
+from envoy_extproc_sdk.util.sampling import EveryNth
+from grpc import ServicerContext
+import pytest
+
+
+def test_every_nth() -> None:
+    sampler = EveryNth(3)
+    assert sampler
+    assert [sampler() for _ in range(7)] == [False, False, True, False, False, True, False]
+
+    never = EveryNth(0)
+    assert not never
+    assert not any(never() for _ in range(10))
+
+
+@pytest.mark.asyncio
+async def test_sampled_phase_logging(caplog: pytest.LogCaptureFixture) -> None:
+    P = BaseExtProcService(log_sample_rate=2)
+
+    @P.process(ExtProcPhase.request_headers)
+    def headers_handler(headers, context, request, response):
+        return response
+
+    @P.process(ExtProcPhase.request_body)
+    def body_handler(body, context, request, response):
+        return response
+
+    with caplog.at_level(logging.INFO, logger="envoy_extproc_sdk.extproc"):
+        async for _ in P.Process(AsEnvoyExtProc(), cast(ServicerContext, None)):
+            pass
+
+    # every second handled phase is logged: request_body, not request_headers
+    sampled = [r for r in caplog.records if r.levelno == logging.INFO]
+    assert len(sampled) == 1
+    # logged with extra fields, which end up in the record's __dict__
+    fields = sampled[0].__dict__
+    assert fields["phase"] == "request_body"
+    assert fields["duration_ns"] >= 0
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import signal
+import socket
+import tempfile
+
+from envoy.service.ext_proc.v3.external_processor_pb2_grpc import (
+    ExternalProcessorStub,
+)
+from envoy_extproc_sdk import BaseExtProcService
+from envoy_extproc_sdk.server import (
+    _run,
+    create_server,
+    event_loop_factory,
+    GrpcServerOptions,
+    listen_addresses,
+    serve,
+    uds_address,
+)
+from envoy_extproc_sdk.util.envoy import ext_api
+import grpc
+import pytest
+
+
+def test_uds_address() -> None:
+    assert uds_address("/tmp/extproc.sock") == "unix:/tmp/extproc.sock"
+    assert uds_address("unix:/tmp/extproc.sock") == "unix:/tmp/extproc.sock"
+    assert uds_address("unix:///tmp/extproc.sock") == "unix:/tmp/extproc.sock"
+    assert uds_address("@extproc") == "unix-abstract:extproc"
+    assert uds_address("unix-abstract:extproc") == "unix-abstract:extproc"
+
+
+def test_uds_needs_one_worker() -> None:
+    with pytest.raises(ValueError):
+        serve(BaseExtProcService(), port=0, workers=2, uds="@extproc")
+
+
+def test_listen_addresses() -> None:
+    assert listen_addresses(port=50051, uds=None) == ["[::]:50051"]
+    assert listen_addresses(port=0, uds="@extproc") == ["unix-abstract:extproc"]
+    assert listen_addresses(port=50051, uds="@extproc") == [
+        "[::]:50051",
+        "unix-abstract:extproc",
+    ]
+    with pytest.raises(ValueError):
+        listen_addresses(port=0, uds=None)
+
+
+@pytest.mark.asyncio
+async def test_serve_on_uds() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "extproc.sock")
+        # a socket file left behind by a server that didn't shut down cleanly
+        stale = socket.socket(socket.AF_UNIX)
+        stale.bind(path)
+        stale.close()
+
+        srv = create_server(BaseExtProcService(), port=0, uds=path)
+        await srv.start()
+        try:
+            async with grpc.aio.insecure_channel(f"unix:{path}") as channel:
+                stub = ExternalProcessorStub(channel)
+
+                async def messages():  # type: ignore[no-untyped-def]
+                    yield ext_api.ProcessingRequest(
+                        request_headers=ext_api.HttpHeaders(end_of_stream=True)
+                    )
+
+                responses = [r async for r in stub.Process(messages())]
+                assert responses[0].HasField("request_headers")
+        finally:
+            await srv.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_live_socket_is_kept() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "extproc.sock")
+        live = socket.socket(socket.AF_UNIX)
+        live.bind(path)
+        live.listen()
+        try:
+            with pytest.raises(ValueError):
+                create_server(BaseExtProcService(), port=0, uds=path)
+            assert os.path.exists(path)
+        finally:
+            live.close()
+
+
+def test_grpc_server_options() -> None:
+    options = GrpcServerOptions(
+        maximum_concurrent_rpcs=10,
+        max_concurrent_streams=None,
+        max_receive_message_length=1024,
+        max_send_message_length=None,
+        keepalive_time_ms=30000,
+        keepalive_timeout_ms=None,
+        keepalive_permit_without_calls=True,
+        min_ping_interval_ms=None,
+        http2_window_size=None,
+        http2_bdp_probe=False,
+        compression="gzip",
+    )
+    assert options.channel_options() == [
+        ("grpc.max_receive_message_length", 1024),
+        ("grpc.keepalive_time_ms", 30000),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.bdp_probe", 0),
+    ]
+    assert options.compression_algorithm() == grpc.Compression.Gzip
+
+    with pytest.raises(ValueError):
+        GrpcServerOptions(compression="brotli")
+
+
+@pytest.mark.asyncio
+async def test_max_receive_message_length() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "extproc.sock")
+        srv = create_server(
+            BaseExtProcService(),
+            port=0,
+            uds=path,
+            server_options=GrpcServerOptions(max_receive_message_length=1024),
+        )
+        await srv.start()
+        try:
+            async with grpc.aio.insecure_channel(f"unix:{path}") as channel:
+                stub = ExternalProcessorStub(channel)
+
+                async def messages():  # type: ignore[no-untyped-def]
+                    yield ext_api.ProcessingRequest(
+                        request_body=ext_api.HttpBody(body=b"x" * 2048, end_of_stream=True)
+                    )
+
+                with pytest.raises(grpc.aio.AioRpcError) as error:
+                    [r async for r in stub.Process(messages())]
+                assert error.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+        finally:
+            await srv.stop(None)
+
+
+def test_event_loop_factory() -> None:
+    assert event_loop_factory("asyncio") is asyncio.new_event_loop
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        assert event_loop_factory("auto") is asyncio.new_event_loop
+        with pytest.raises(ImportError):
+            event_loop_factory("uvloop")
+    else:
+        assert event_loop_factory("auto") is uvloop.new_event_loop
+
+    assert event_loop_factory(asyncio.new_event_loop) is asyncio.new_event_loop
+    with pytest.raises(ValueError):
+        event_loop_factory("trio")
+
+
+def test_run_shuts_down_on_signal() -> None:
+    loops = []
+
+    def new_loop() -> asyncio.AbstractEventLoop:
+        loop = asyncio.new_event_loop()
+        loop.call_later(0.5, os.kill, os.getpid(), signal.SIGTERM)
+        loops.append(loop)
+        return loop
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _run(BaseExtProcService(), port=0, uds=os.path.join(tmp, "extproc.sock"), loop=new_loop)
+
+    assert loops[0].is_closed()
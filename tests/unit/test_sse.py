@@ -0,0 +1,186 @@
+from typing import cast, List
+
+from envoy_extproc_sdk import BaseExtProcService, ExtProcPhase, RequestContext
+from envoy_extproc_sdk.testing import AsEnvoyExtProc, envoy_body, envoy_headers
+from envoy_extproc_sdk.util.codec import loads
+from envoy_extproc_sdk.util.envoy import EnvoyProcessingMode, ext_api
+from envoy_extproc_sdk.util.sse import (
+    rewrite_sse,
+    sse_events,
+    SSEEvent,
+    SSEParser,
+)
+from examples import LLMProxyExtProcService
+from grpc import ServicerContext
+import pytest
+
+STREAM = (
+    b": keep-alive\n\n"
+    b'data: {"model": "gpt-4o", "choices": [{"delta": {"content": "Hi"}}]}\n\n'
+    b"event: update\r\nid: 7\r\nretry: 100\r\ndata: line 1\r\ndata:line 2\r\n\r\n"
+    b"data: [DONE]\n\n"
+)
+EVENTS = [
+    SSEEvent(),
+    SSEEvent(data=b'{"model": "gpt-4o", "choices": [{"delta": {"content": "Hi"}}]}'),
+    SSEEvent(data=b"line 1\nline 2", event="update", id="7", retry=100),
+    SSEEvent(data=b"[DONE]"),
+]
+
+
+def feed_all(parser: SSEParser, chunks: List[bytes]) -> List[SSEEvent]:
+    events = []
+    for index, chunk in enumerate(chunks):
+        events.extend(parser.feed(chunk, end_of_stream=index == len(chunks) - 1))
+    return events
+
+
+def test_parse_whole_stream() -> None:
+    parser = SSEParser()
+    events = parser.feed(STREAM)
+    assert events == EVENTS
+    assert parser.pending == 0
+    assert b"".join(event.encode() for event in events) == STREAM
+
+
+@pytest.mark.parametrize("split", range(1, len(STREAM)))
+def test_parse_across_chunks(split: int) -> None:
+    parser = SSEParser()
+    events = feed_all(parser, [STREAM[:split], STREAM[split:]])
+    assert events == EVENTS
+    assert b"".join(bytes(event.encode()) for event in events) == STREAM
+
+
+def test_parse_byte_by_byte() -> None:
+    parser = SSEParser()
+    chunks = [STREAM[i : i + 1] for i in range(len(STREAM))]
+    assert feed_all(parser, chunks) == EVENTS
+
+
+def test_held_back_until_complete() -> None:
+    parser = SSEParser()
+    assert parser.feed(b"data: a\n\ndata: b") == [SSEEvent(data=b"a")]
+    assert parser.pending == len(b"data: b")
+    # a CR at the end may be half a CRLF
+    assert parser.feed(b"\r\n\r") == []
+    assert parser.feed(b"\n") == [SSEEvent(data=b"b")]
+    assert parser.pending == 0
+
+    # at the end of the stream, an unterminated event is returned as is
+    events = parser.feed(b"data: c", end_of_stream=True)
+    assert events == [SSEEvent(data=b"c")]
+    assert bytes(events[0].encode()) == b"data: c"
+
+
+def test_event_encode() -> None:
+    event = SSEEvent(data=b"a\nb", event="e", id="1", retry=5)
+    assert event.encode() == b"event: e\nid: 1\nretry: 5\ndata: a\ndata: b\n\n"
+    assert SSEParser().feed(event.encode()) == [event]
+
+    parsed = SSEParser().feed(b"data:  spaced\nid: x\0y\nretry: soon\nunknown\n\n")[0]
+    assert parsed == SSEEvent(data=b" spaced")
+    replaced = parsed.replace(data=b"new", event="e")
+    assert replaced.encode() == b"event: e\ndata: new\n\n"
+    assert parsed.data == b" spaced"
+
+
+def test_rewrite() -> None:
+    def rewrite(event: SSEEvent) -> SSEEvent:
+        if event.data is None:
+            return None  # type: ignore[return-value]
+        return event.replace(data=event.data.upper()) if event.event else event
+
+    parser = SSEParser()
+    split = STREAM.index(b"retry")
+    first = parser.rewrite(STREAM[:split], rewrite)
+    second = parser.rewrite(STREAM[split:], rewrite, end_of_stream=True)
+    assert first == STREAM[STREAM.index(b"data") : STREAM.index(b"event")]
+    assert second == (
+        b"event: update\nid: 7\nretry: 100\ndata: LINE 1\ndata: LINE 2\n\ndata: [DONE]\n\n"
+    )
+
+
+def test_parser_kept_in_context() -> None:
+    request = RequestContext()
+    request.phase = "response_body"
+    assert sse_events(request, envoy_body(body=b"data: a\n\ndata:")) == [SSEEvent(data=b"a")]
+    assert "__response_body_sse" in request
+    body = ext_api.HttpBody(body=b" b\n\n", end_of_stream=True)
+    assert rewrite_sse(request, body, lambda event: event) == b"data: b\n\n"
+    assert "__response_body_sse" not in request
+
+    sse_events(request, envoy_body(body=b"data:"))
+    BaseExtProcService.skip_phases(request, ExtProcPhase.response_body)
+    assert "__response_body_sse" not in request
+
+
+def stream_chunks(chunks: List[bytes]) -> List[ext_api.HttpBody]:
+    return [
+        ext_api.HttpBody(body=chunk, end_of_stream=index == len(chunks) - 1)
+        for index, chunk in enumerate(chunks)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_llm_proxy_streamed_response() -> None:
+    chunks = [
+        b'data: {"model": "gpt-4o", "choices": [{"delta": {"content": "He"}}]}\n\ndata: {"mo',
+        b'del": "gpt-4o", "choices": [], "usage": {"total_tokens": 3}}\n\n',
+        b"data: [DONE]\n\n",
+    ]
+    headers = [(":path", "/v1/chat/completions"), ("content-type", "application/json")]
+
+    def exchange() -> AsEnvoyExtProc:
+        E = AsEnvoyExtProc(
+            request_headers=envoy_headers(headers=headers),
+            request_body=envoy_body(body='{"model": "gpt-3.5-turbo", "messages": []}'),
+            response_headers=envoy_headers(headers=[("content-type", "text/event-stream")]),
+        )
+        E.messages[4:5] = [
+            ext_api.ProcessingRequest(response_body=body) for body in stream_chunks(chunks)
+        ]
+        return E
+
+    P = LLMProxyExtProcService()
+    responses = [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    assert [r.WhichOneof("response") for r in responses[4:7]] == ["response_body"] * 3
+    # only inspected: chunks pass through unchanged
+    assert all(not r.response_body.response.HasField("body_mutation") for r in responses[4:7])
+
+    P.RESTORE_MODEL = True
+    responses = [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    bodies = [r.response_body.response.body_mutation.body for r in responses[4:7]]
+    events = SSEParser().feed(b"".join(bodies))
+    data = [e.data for e in events[:2] if e.data is not None]
+    assert [loads(d)["model"] for d in data] == ["gpt-3.5-turbo"] * 2
+    assert events[2].data == b"[DONE]"
+    # the partial event at the end of the first chunk went out with the second
+    assert bodies[0].count(b"data:") == 1
+
+
+@pytest.mark.asyncio
+async def test_llm_proxy_skips_other_response_bodies() -> None:
+    E = AsEnvoyExtProc(
+        request_headers=envoy_headers(headers=[(":path", "/v1/models")]),
+        response_headers=envoy_headers(headers=[("content-type", "application/json")]),
+    )
+    P = LLMProxyExtProcService()
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    # a JSON response, so envoy is told not to send its body
+    (headers,) = [r for r in responses if r.WhichOneof("response") == "response_headers"]
+    assert headers.HasField("mode_override")
+    assert headers.mode_override.response_body_mode == EnvoyProcessingMode.NONE
+
+
+@pytest.mark.asyncio
+async def test_llm_proxy_turns_off_bodies_it_skips() -> None:
+    # not an LLM API request: envoy is told, with the first response, not
+    # to send either body at all
+    E = AsEnvoyExtProc(request_headers=envoy_headers(headers=[(":path", "/health")]))
+    P = LLMProxyExtProcService()
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    assert responses[0].HasField("mode_override")
+    mode = responses[0].mode_override
+    assert mode.request_body_mode == EnvoyProcessingMode.NONE
+    assert mode.response_body_mode == EnvoyProcessingMode.NONE
+    assert mode.response_header_mode == EnvoyProcessingMode.SEND
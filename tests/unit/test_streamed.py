@@ -0,0 +1,103 @@
+from typing import AsyncIterator, cast, List
+
+from envoy_extproc_sdk import BaseExtProcService, ext_api, ExtProcPhase
+from envoy_extproc_sdk.testing import envoy_headers
+from envoy_extproc_sdk.util.envoy import (
+    EnvoyHttpStatusCode,
+    EnvoyProcessingMode,
+)
+from examples import UploadGuardExtProcService
+from grpc import ServicerContext
+import pytest
+
+
+async def streamed_request(
+    *chunks: bytes, protocol_config: ext_api.ProtocolConfiguration = None  # type: ignore
+) -> AsyncIterator[ext_api.ProcessingRequest]:
+    first = ext_api.ProcessingRequest(request_headers=envoy_headers(headers=[(":path", "/")]))
+    if protocol_config is not None:
+        first.protocol_config.CopyFrom(protocol_config)
+    yield first
+    for i, chunk in enumerate(chunks):
+        yield ext_api.ProcessingRequest(
+            request_body=ext_api.HttpBody(body=chunk, end_of_stream=(i == len(chunks) - 1))
+        )
+
+
+@pytest.mark.asyncio
+async def test_chunk_handler_and_accumulator() -> None:
+    P = BaseExtProcService()
+    seen: List[bytes] = []
+
+    @P.process(ExtProcPhase.request_body, chunks=True)
+    def chunk(body, context, request, response):  # type: ignore
+        accumulated = P.accumulate_body(request, body)
+        if body.end_of_stream:
+            seen.append(bytes(accumulated))
+            assert "__request_body_accumulated" not in request
+        return response
+
+    E = streamed_request(b"ab", b"cd", b"ef")
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    assert len(responses) == 4
+    assert seen == [b"abcdef"]
+    assert all(r.WhichOneof("response") == "request_body" for r in responses[1:])
+
+
+@pytest.mark.asyncio
+async def test_chunk_handler_can_stop_early() -> None:
+    P = BaseExtProcService()
+    calls: List[bytes] = []
+
+    @P.process(ExtProcPhase.request_body, chunks=True)
+    def chunk(body, context, request, response):  # type: ignore
+        calls.append(body.body)
+        P.skip_phases(request, ExtProcPhase.request_body)
+        return response
+
+    E = streamed_request(b"ab", b"cd", b"ef")
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    assert calls == [b"ab"]
+    assert len(responses) == 4
+
+
+def test_chunks_only_for_body_phases() -> None:
+    with pytest.raises(ValueError):
+        BaseExtProcService().process(ExtProcPhase.request_headers, chunks=True)
+
+
+@pytest.mark.asyncio
+async def test_full_duplex_streams_chunks_back() -> None:
+    P = BaseExtProcService()
+
+    @P.process(ExtProcPhase.request_body, chunks=True)
+    def chunk(body, context, request, response):  # type: ignore
+        if body.body == b"cd":
+            P.set_body(response, b"CD")
+        if body.body == b"ef":
+            P.skip_phases(request, ExtProcPhase.request_body)
+        return response
+
+    config = ext_api.ProtocolConfiguration(
+        request_body_mode=EnvoyProcessingMode.FULL_DUPLEX_STREAMED
+    )
+    E = streamed_request(b"ab", b"cd", b"ef", b"gh", protocol_config=config)
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    streamed = [r.request_body.response.body_mutation.streamed_response for r in responses[1:]]
+    assert [s.body for s in streamed] == [b"ab", b"CD", b"ef", b"gh"]
+    assert [s.end_of_stream for s in streamed] == [False, False, False, True]
+
+
+@pytest.mark.asyncio
+async def test_upload_guard() -> None:
+    P = UploadGuardExtProcService()
+
+    E = streamed_request(b"M", b"Z\x90\x00", b"...")
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    assert responses[-1].WhichOneof("response") == "immediate_response"
+    assert responses[-1].immediate_response.status.code == EnvoyHttpStatusCode.UnsupportedMediaType
+
+    E = streamed_request(b"%P", b"DF-1.7", b"...")
+    responses = [r async for r in P.Process(E, cast(ServicerContext, None))]
+    assert len(responses) == 4
+    assert all(r.WhichOneof("response") != "immediate_response" for r in responses)
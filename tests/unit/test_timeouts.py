@@ -0,0 +1,144 @@
+import asyncio
+import threading
+from typing import cast, Dict, List
+
+from envoy_extproc_sdk import (
+    BaseExtProcService,
+    ChainedExtProcService,
+    ext_api,
+    ExtProcPhase,
+)
+from envoy_extproc_sdk.testing import (
+    AsEnvoyExtProc,
+    envoy_body,
+    envoy_headers,
+    envoy_set_headers_to_dict,
+)
+from envoy_extproc_sdk.util.envoy import EnvoyHttpStatusCode
+from grpc import ServicerContext
+import pytest
+
+
+def by_kind(responses: List[ext_api.ProcessingResponse]) -> Dict[str, ext_api.ProcessingResponse]:
+    return {r.WhichOneof("response"): r for r in responses}
+
+
+def exchange() -> AsEnvoyExtProc:
+    return AsEnvoyExtProc(
+        request_headers=envoy_headers(headers=[(":path", "/")]),
+        request_body=envoy_body(body="body"),
+    )
+
+
+def slow_service(**kwargs) -> BaseExtProcService:  # type: ignore
+    P = BaseExtProcService(**kwargs)
+
+    @P.process(ExtProcPhase.request_headers)
+    async def headers(headers, context, request, response):  # type: ignore
+        P.add_header(response, "x-started", "yes")
+        await asyncio.sleep(1)
+        return P.add_header(response, "x-finished", "yes")
+
+    return P
+
+
+@pytest.mark.asyncio
+async def test_timeout_fails_closed() -> None:
+    P = slow_service(timeouts_ms={"request_headers": 10})
+    responses = [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    assert responses[0].WhichOneof("response") == "immediate_response"
+    status = responses[0].immediate_response.status.code
+    assert status == EnvoyHttpStatusCode.GatewayTimeout
+    assert P.timed_out == {"request_headers": 1}
+
+
+@pytest.mark.asyncio
+async def test_timeout_fails_open() -> None:
+    class Slow(BaseExtProcService):
+        TIMEOUT_FAIL_OPEN = True
+        DEFAULT_TIMEOUT_MS = 10
+
+        async def process_request_body(self, body, context, request, response):  # type: ignore
+            self.set_body(response, b"changed")
+            await asyncio.sleep(1)
+            return response
+
+    P = Slow()
+    responses = by_kind([r async for r in P.Process(exchange(), cast(ServicerContext, None))])
+    # continues, unchanged
+    assert "immediate_response" not in responses
+    assert not responses["request_body"].request_body.response.HasField("body_mutation")
+    assert P.timed_out == {"request_body": 1}
+
+
+@pytest.mark.asyncio
+async def test_timeout_keeps_earlier_changes() -> None:
+    # the chain header, added before the handler runs, survives a timeout
+    P = BaseExtProcService()
+    P.TIMEOUT_FAIL_OPEN = True
+
+    @P.process(ExtProcPhase.response_headers, timeout_ms=10)
+    async def headers(headers, context, request, response):  # type: ignore
+        await asyncio.sleep(1)
+        return response
+
+    E = AsEnvoyExtProc(response_headers=envoy_headers(headers=[("content-type", "text/plain")]))
+    responses = by_kind([r async for r in P.Process(E, cast(ServicerContext, None))])
+    headers_set = envoy_set_headers_to_dict(responses["response_headers"].response_headers.response)
+    assert headers_set == {"x-ext-procs-applied": "BaseExtProcService"}
+
+
+@pytest.mark.asyncio
+async def test_timeout_in_executor() -> None:
+    release = threading.Event()
+    P = BaseExtProcService()
+
+    @P.process(ExtProcPhase.request_body, executor="thread", timeout_ms=10)
+    def body(body, context, request, response):  # type: ignore
+        release.wait(5)
+        return response
+
+    responses = by_kind([r async for r in P.Process(exchange(), cast(ServicerContext, None))])
+    # the thread can't be stopped, and runs on past the deadline
+    assert P.pools.overrun == 1
+    release.set()
+    assert "immediate_response" in responses
+    assert P.timed_out["request_body"] == 1
+    P.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_handler_timeout_errors_are_not_deadlines() -> None:
+    P = BaseExtProcService(timeouts_ms={"request_headers": 1000})
+
+    @P.process(ExtProcPhase.request_headers)
+    async def headers(headers, context, request, response):  # type: ignore
+        await asyncio.wait_for(asyncio.sleep(1), 0.001)
+
+    with pytest.raises(asyncio.TimeoutError):
+        [r async for r in P.Process(exchange(), cast(ServicerContext, None))]
+    assert not P.timed_out
+
+
+@pytest.mark.asyncio
+async def test_fast_handlers_and_chains() -> None:
+    P = slow_service(timeouts_ms={"request_headers": 5000})
+    assert P._dispatch["request_headers"].timeout == 5
+    assert P._dispatch["request_body"].timeout is None
+
+    seen: List[str] = []
+    inner = slow_service(timeouts_ms={"request_headers": 10})
+    inner.TIMEOUT_FAIL_OPEN = True
+    after = BaseExtProcService()
+
+    @after.process(ExtProcPhase.request_body)
+    def body(body, context, request, response):  # type: ignore
+        seen.append(body.body)
+        return response
+
+    chain = ChainedExtProcService(inner, after)
+
+    responses = [r async for r in chain.Process(exchange(), cast(ServicerContext, None))]
+    assert not responses[0].request_headers.response.header_mutation.set_headers
+    assert seen == [b"body"]
+    assert inner.timed_out == {"request_headers": 1}
@@ -6,6 +6,7 @@ from envoy_extproc_sdk.testing import (
     envoy_headers,
     envoy_set_headers_to_dict,
 )
+from envoy_extproc_sdk.util.timer import Timer
 from examples import TimerExtProcService
 from examples.timer import REQUEST_DURATION_HEADER, REQUEST_STARTED_HEADER
 from google.protobuf.timestamp_pb2 import Timestamp
@@ -66,3 +67,20 @@ async def test_timer_flow(headers: ext_api.HttpHeaders, body: ext_api.HttpBody)
     v = Timestamp()
     v.FromJsonString(_headers[REQUEST_STARTED_HEADER])
     assert s.ToNanoseconds() < v.ToNanoseconds()
+
+
+def test_timer() -> None:
+    T = Timer()
+    assert not T.running
+    with T as timed:
+        assert timed.running
+        assert T.duration_ns() >= 0
+    assert not T.running
+    duration = T.duration_ns()
+    assert duration >= 0
+    assert T.duration_ns() == duration
+    assert T.duration().ToNanoseconds() == duration
+    assert T.started().ToNanoseconds() == T.started_ns()
+    s = Timestamp()
+    s.FromJsonString(T.started_iso())
+    assert s.ToNanoseconds() == T.started_ns()
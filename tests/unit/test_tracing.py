@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+import os
+import subprocess
+import sys
+from typing import cast, Iterator, List
+
+from envoy_extproc_sdk import BaseExtProcService, ExtProcPhase
+from envoy_extproc_sdk.testing import AsEnvoyExtProc
+from envoy_extproc_sdk.tracing import (
+    ExtProcTracer,
+    get_tracer,
+    NoopTracer,
+    PHASE_RESOURCES,
+    PHASE_SPAN_NAMES,
+)
+from grpc import ServicerContext
+import pytest
+
+
+class RecordingTracer(ExtProcTracer):
+    def __init__(self, sample_rate: float = 1.0) -> None:
+        super().__init__(sample_rate=sample_rate)
+        self.spans: List[str] = []
+
+    @contextmanager
+    def _span(self, name: str) -> Iterator[None]:
+        self.spans.append(name)
+        yield
+
+    def stream_span(self):
+        return self._span("process")
+
+    def phase_span(self, phase: str):
+        return self._span(PHASE_SPAN_NAMES[phase])
+
+
+def test_get_tracer() -> None:
+    assert isinstance(get_tracer("off"), NoopTracer)
+    assert isinstance(get_tracer("None"), NoopTracer)
+    assert get_tracer("ddtrace", sample_rate=0.5).sample.rate == 0.5
+    with pytest.raises(ValueError):
+        get_tracer("zipkin")
+
+
+def test_precomputed_names() -> None:
+    assert PHASE_SPAN_NAMES["request_headers"] == "process.request_headers"
+    assert PHASE_RESOURCES["response_body"] == (
+        "/envoy.service.ext_proc.v3.ExternalProcessor/Process/ResponseBody"
+    )
+
+
+def test_noop_tracer_never_samples() -> None:
+    tracer = NoopTracer(sample_rate=1.0)
+    assert not any(tracer.sample() for _ in range(10))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sample_rate", (0.0, 1.0))
+async def test_stream_sampling(sample_rate: float) -> None:
+    tracer = RecordingTracer(sample_rate=sample_rate)
+    P = BaseExtProcService(tracer=tracer)
+
+    @P.process(ExtProcPhase.request_headers)
+    def handler(headers, context, request, response):
+        return response
+
+    async for _ in P.Process(AsEnvoyExtProc(), cast(ServicerContext, None)):
+        pass
+
+    if sample_rate:
+        assert tracer.spans == [
+            "process",
+            "process.request_headers",
+            "process.response_headers",
+        ]
+    else:
+        assert tracer.spans == []
+
+
+def test_tracing_off_doesnt_import_ddtrace() -> None:
+    code = (
+        "import sys; import envoy_extproc_sdk, envoy_extproc_sdk.health; "
+        "assert 'ddtrace' not in sys.modules, 'ddtrace imported'"
+    )
+    env = {**os.environ, "DD_TRACE_ENABLED": "false", "TRACING": "off"}
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
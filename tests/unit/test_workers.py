@@ -0,0 +1,34 @@
+import time
+
+from envoy_extproc_sdk import workers
+from envoy_extproc_sdk.workers import WorkerSupervisor
+import pytest
+
+
+def sleep_forever() -> None:
+    while True:
+        time.sleep(0.05)
+
+
+def test_supervisor_restarts_and_stops(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(workers, "RESTART_INTERVAL", 0.0)
+    supervisor = WorkerSupervisor(sleep_forever, workers=2, grace_period=1)
+    supervisor.start()
+    try:
+        assert len(supervisor.processes) == 2
+        assert all(p.is_alive() for p in supervisor.processes.values())
+        assert supervisor.check() == 0
+
+        crashed = supervisor.processes[0]
+        crashed.kill()
+        crashed.join()
+        assert supervisor.check() == 1
+        assert supervisor.processes[0] is not crashed
+        assert supervisor.processes[0].is_alive()
+        time.sleep(0.2)  # let workers install their signal handlers
+    finally:
+        supervisor.stop()
+
+    # SIGTERM is a graceful shutdown for workers
+    assert all(p.exitcode == 0 for p in supervisor.processes.values())
+    assert supervisor.check() == 0